@@ -0,0 +1,236 @@
+"""
+Write-behind buffer for last_login and last_activity. Events are coalesced per user in
+memory or Redis and written to accounts_user in periodic bulk_update batches, so a login
+storm costs one UPDATE per batch instead of one per login.
+"""
+import atexit
+import threading
+import time
+import uuid
+from collections import defaultdict
+from datetime import datetime, timezone as dt_timezone
+from django.conf import settings
+from django.db import connection
+from django.utils import timezone
+import logging
+
+logger = logging.getLogger(__name__)
+
+FIELDS = ('last_login', 'last_activity')
+SEEN_MAX_SIZE = 10000
+
+# KEYS: field hash. ARGV: user id, epoch seconds. Keeps the later timestamp, so a batch put
+# back after a failed flush never overwrites an event recorded meanwhile.
+RECORD_SCRIPT = """
+local current = redis.call('hget', KEYS[1], ARGV[1])
+if not current or tonumber(current) < tonumber(ARGV[2]) then
+    redis.call('hset', KEYS[1], ARGV[1], ARGV[2])
+end
+"""
+
+
+class InMemoryActivityBuffer:
+    """
+    Per-process buffer, flushed by the process that recorded the events
+    """
+
+    def __init__(self):
+        self._pending = {}
+        self._lock = threading.Lock()
+
+    def record(self, user_id, field, when):
+        with self._lock:
+            entry = self._pending.setdefault(user_id, {})
+            if entry.get(field) is None or when > entry[field]:
+                entry[field] = when
+
+    def drain(self):
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        return pending
+
+    def __len__(self):
+        return len(self._pending)
+
+
+class RedisActivityBuffer:
+    """
+    One hash per field (user id -> epoch seconds), shared by every web and worker process
+    """
+
+    def __init__(self, url):
+        import redis
+        self.client = redis.Redis.from_url(url)
+        self.response_error = redis.ResponseError
+        self._record = self.client.register_script(RECORD_SCRIPT)
+
+    def _key(self, field):
+        return f'user:activity:{field}'
+
+    def record(self, user_id, field, when):
+        self._record(keys=[self._key(field)], args=[user_id, when.timestamp()])
+
+    def drain(self):
+        pending = defaultdict(dict)
+        for field in FIELDS:
+            # Renamed away atomically, events recorded meanwhile land in a fresh hash
+            draining_key = f'{self._key(field)}:draining:{uuid.uuid4().hex}'
+            try:
+                self.client.rename(self._key(field), draining_key)
+            except self.response_error:
+                continue  # nothing buffered for this field
+            values = self.client.hgetall(draining_key)
+            self.client.delete(draining_key)
+            for user_id, timestamp in values.items():
+                pending[int(user_id)][field] = datetime.fromtimestamp(float(timestamp), tz=dt_timezone.utc)
+        return dict(pending)
+
+    def __len__(self):
+        return max(self.client.hlen(self._key(field)) for field in FIELDS)
+
+
+_buffer = None
+_buffer_lock = threading.Lock()
+_last_flush = time.monotonic()
+_seen = {}
+_exit_flush_registered = False
+
+
+def get_activity_buffer():
+    """
+    Configured buffer, or None when USER_ACTIVITY_BUFFER is empty (write-through)
+    """
+    global _buffer
+    backend = settings.USER_ACTIVITY_BUFFER
+    if not backend:
+        return None
+    if _buffer is None:
+        with _buffer_lock:
+            if _buffer is None:
+                if backend == 'redis':
+                    _buffer = RedisActivityBuffer(settings.REDIS_URL)
+                else:
+                    _buffer = InMemoryActivityBuffer()
+                    _register_exit_flush()
+    return _buffer
+
+
+def _register_exit_flush():
+    # Whatever a memory buffer still holds when the process stops would be lost
+    global _exit_flush_registered
+    if not _exit_flush_registered:
+        atexit.register(_flush_at_exit, connection.settings_dict['NAME'])
+        _exit_flush_registered = True
+
+
+def _flush_at_exit(database_name):
+    if _buffer is None or not len(_buffer):
+        return
+    if connection.settings_dict['NAME'] != database_name:
+        # The events were recorded against a database that is gone by now (the test runner's)
+        return
+    _safe_flush()
+
+
+def _safe_flush():
+    try:
+        flush_activity()
+    except Exception as e:
+        # The batch was put back, the next flush retries it
+        logger.error(f"Error flushing user activity: {e}")
+
+
+def reset_activity_buffer():
+    global _buffer, _last_flush, _exit_flush_registered
+    if _exit_flush_registered:
+        atexit.unregister(_flush_at_exit)
+        _exit_flush_registered = False
+    _buffer = None
+    _last_flush = time.monotonic()
+    _seen.clear()
+
+
+def _write_through(user_id, field, when):
+    from .models import User
+    User.objects.filter(pk=user_id).update(**{field: when})
+
+
+def record_user_event(user_id, field, when=None):
+    when = when or timezone.now()
+    buffer = get_activity_buffer()
+    if buffer is None:
+        _write_through(user_id, field, when)
+        return
+
+    try:
+        buffer.record(user_id, field, when)
+    except Exception as e:
+        logger.warning(f"Activity buffer unavailable, writing {field} directly: {e}")
+        _write_through(user_id, field, when)
+        return
+
+    if settings.USER_ACTIVITY_BUFFER == 'memory':
+        _maybe_flush()
+
+
+def _maybe_flush():
+    # Memory buffers live in the web process, so it flushes them itself once per interval and at exit
+    global _last_flush
+    now = time.monotonic()
+    if now - _last_flush < settings.USER_ACTIVITY_FLUSH_INTERVAL:
+        return
+    with _buffer_lock:
+        if now - _last_flush < settings.USER_ACTIVITY_FLUSH_INTERVAL:
+            return
+        _last_flush = now
+    # Runs inside authentication, a database error here must not fail the request
+    _safe_flush()
+
+
+def record_login(user):
+    when = timezone.now()
+    user.last_login = when
+    record_user_event(user.pk, 'last_login', when)
+
+
+def record_activity(user_id):
+    """
+    Record a request by user_id, at most once per USER_ACTIVITY_RESOLUTION seconds per process
+    """
+    now = time.monotonic()
+    last = _seen.get(user_id)
+    if last is not None and now - last < settings.USER_ACTIVITY_RESOLUTION:
+        return
+    if len(_seen) >= SEEN_MAX_SIZE:
+        _seen.clear()
+    _seen[user_id] = now
+    record_user_event(user_id, 'last_activity')
+
+
+def flush_activity(batch_size=None):
+    """
+    Write buffered timestamps with one bulk_update per set of changed fields.
+    Returns the number of users updated.
+    """
+    from .models import User
+
+    buffer = get_activity_buffer()
+    if buffer is None:
+        return 0
+    pending = buffer.drain()
+    if not pending:
+        return 0
+
+    groups = defaultdict(list)
+    for user_id, values in pending.items():
+        groups[tuple(sorted(values))].append(User(id=user_id, **values))
+    try:
+        for fields, users in groups.items():
+            User.objects.bulk_update(users, fields, batch_size=batch_size or settings.USER_ACTIVITY_FLUSH_BATCH_SIZE)
+    except Exception:
+        # Put the batch back so the next flush retries it
+        for user_id, values in pending.items():
+            for field, when in values.items():
+                buffer.record(user_id, field, when)
+        raise
+    return len(pending)
@@ -1,6 +1,6 @@
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin
-from .models import User, WorkerProfile
+from .models import User, WorkerProfile, WorkerImportJob
 
 @admin.register(User)
 class CustomUserAdmin(UserAdmin):
@@ -19,4 +19,17 @@ class WorkerProfileAdmin(admin.ModelAdmin):
     list_display = ['user', 'experience_years', 'hourly_rate', 'rating', 'is_available']
     list_filter = ['is_available', 'experience_years']
     search_fields = ['user__username', 'user__email']
-    filter_horizontal = ['specializations']
\ No newline at end of file
+    filter_horizontal = ['specializations']
+
+@admin.register(WorkerImportJob)
+class WorkerImportJobAdmin(admin.ModelAdmin):
+    list_display = ['id', 'status', 'processed_count', 'created_count', 'error_count', 'requested_by', 'created_at']
+    list_filter = ['status']
+    readonly_fields = ['id', 'requested_by', 'source_name', 'status', 'processed_count', 'created_count', 'error_count',
+                       'errors', 'created_at', 'started_at', 'finished_at']
+    exclude = ['source']
+
+    @admin.display(description='Source')
+    def source_name(self, obj):
+        # Private file, shown without a link
+        return obj.source.name
@@ -0,0 +1,209 @@
+"""
+JWT authentication that resolves request.user from a cached snapshot instead of a
+SELECT on accounts_user. Tokens carry the user's role and auth_version; a snapshot
+is cached under (user_id, auth_version), so bumping the version invalidates it. The
+bumped version is also cached on its own, for lookups that never read the database.
+"""
+import threading
+import time
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.utils.translation import gettext_lazy as _
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import RefreshToken
+from .activity import record_activity
+from .blacklist import is_blacklisted
+from .models import User
+
+ROLE_CLAIM = 'role'
+VERSION_CLAIM = 'ver'
+
+# Enough for permissions, ownership checks and FK assignment. Other fields load lazily.
+SNAPSHOT_FIELDS = [
+    'id', 'username', 'email', 'first_name', 'last_name', 'role',
+    'is_active', 'is_staff', 'is_superuser', 'is_verified', 'date_joined', 'auth_version',
+]
+
+_local = {}
+_local_lock = threading.Lock()
+LOCAL_CACHE_MAX_SIZE = 10000
+
+
+def get_snapshot_ttl():
+    return getattr(settings, 'AUTH_USER_SNAPSHOT_TTL', 30)
+
+
+def _cache_key(user_id, version):
+    return f'auth:user:{user_id}:{version}'
+
+
+def _version_key(user_id):
+    return f'auth:version:{user_id}'
+
+
+def _get_shared_cache():
+    return caches[getattr(settings, 'AUTH_USER_SNAPSHOT_CACHE', 'default')]
+
+
+def is_cache_shared():
+    """
+    False when AUTH_USER_SNAPSHOT_CACHE is per-process (LocMem) or a no-op (Dummy): a bumped
+    auth_version written by another process is then never seen here.
+    """
+    return not isinstance(_get_shared_cache(), (LocMemCache, DummyCache))
+
+
+def _build_user(values):
+    field_names = [field.attname for field in User._meta.concrete_fields if field.attname in values]
+    return User.from_db('default', field_names, [values[name] for name in field_names])
+
+
+def get_user_snapshot(user_id, version=None):
+    """
+    User instance built from cache for (user_id, version). On a miss the row is read once
+    and cached under its current version. Returns None if the user doesn't exist.
+    """
+    now = time.monotonic()
+    if version is not None:
+        key = _cache_key(user_id, version)
+        entry = _local.get(key)
+        if entry and entry[0] > now:
+            return _build_user(entry[1])
+        values = _get_shared_cache().get(key)
+        if values is not None:
+            _remember_locally(key, values, now)
+            return _build_user(values)
+
+    values = User.objects.filter(pk=user_id).values(*SNAPSHOT_FIELDS).first()
+    if values is None:
+        return None
+    cache_snapshot(values, now)
+    return _build_user(values)
+
+
+def get_local_snapshot(user_id, version):
+    """
+    User from this process's snapshot cache only: no database or network I/O
+    """
+    entry = _local.get(_cache_key(user_id, version))
+    if entry and entry[0] > time.monotonic():
+        return _build_user(entry[1])
+    return None
+
+
+def get_cached_snapshot(user_id, version):
+    """
+    User from the local, then the shared snapshot cache, without a database query.
+    Returns (user or None, outdated): outdated means the user's auth_version has been
+    bumped past `version` since the token was issued.
+    """
+    user = get_local_snapshot(user_id, version)
+    if user is not None:
+        return user, False
+    key, version_key = _cache_key(user_id, version), _version_key(user_id)
+    found = _get_shared_cache().get_many([key, version_key])
+    if key in found:
+        _remember_locally(key, found[key], time.monotonic())
+        return _build_user(found[key]), False
+    current = found.get(version_key)
+    return None, current is not None and current != version
+
+
+def user_from_claims(validated_token):
+    """
+    Lightweight user built from the signed role/ver claims alone (id, role, auth_version).
+    Returns None for tokens issued without those claims.
+    """
+    role = validated_token.get(ROLE_CLAIM)
+    version = validated_token.get(VERSION_CLAIM)
+    if role is None or version is None:
+        return None
+    return _build_user({
+        'id': validated_token[api_settings.USER_ID_CLAIM],
+        'role': role,
+        'is_active': True,
+        'auth_version': version,
+    })
+
+
+def cache_snapshot(values, now=None):
+    key = _cache_key(values['id'], values['auth_version'])
+    _get_shared_cache().set(key, values, get_snapshot_ttl())
+    _remember_locally(key, values, now or time.monotonic())
+
+
+def _remember_locally(key, values, now):
+    with _local_lock:
+        if len(_local) >= LOCAL_CACHE_MAX_SIZE:
+            _local.clear()
+        _local[key] = (now + get_snapshot_ttl(), values)
+
+
+def invalidate_user_snapshot(user_id, *versions):
+    keys = [_cache_key(user_id, version) for version in versions]
+    shared = _get_shared_cache()
+    shared.delete_many(keys)
+    # Tokens with an older version are rejected until the last of them has expired
+    shared.set(_version_key(user_id), max(versions), api_settings.ACCESS_TOKEN_LIFETIME.total_seconds())
+    with _local_lock:
+        for key in keys:
+            _local.pop(key, None)
+
+
+def clear_local_snapshots():
+    with _local_lock:
+        _local.clear()
+
+
+def add_auth_claims(token, user):
+    token[ROLE_CLAIM] = user.role
+    token[VERSION_CLAIM] = user.auth_version
+    return token
+
+
+class VersionedRefreshToken(RefreshToken):
+    """
+    Refresh token whose access tokens carry the role and auth_version claims.
+    The blacklist check goes through the JTI Bloom filter.
+    """
+
+    @classmethod
+    def for_user(cls, user):
+        return add_auth_claims(super().for_user(user), user)
+
+    def check_blacklist(self):
+        # Bloom filter first, BlacklistedToken is only queried on a probable hit
+        if is_blacklisted(self.payload[api_settings.JTI_CLAIM]):
+            raise TokenError(_("Token is blacklisted"))
+
+
+class SnapshotJWTAuthentication(JWTAuthentication):
+    def get_user(self, validated_token):
+        user = self._resolve_user(validated_token)
+        record_activity(user.pk)
+        return user
+
+    def _resolve_user(self, validated_token):
+        version = validated_token.get(VERSION_CLAIM)
+        if version is None:
+            # Tokens issued before versioned claims
+            return super().get_user(validated_token)
+
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise AuthenticationFailed(_("Token contained no recognizable user identification"))
+
+        user = get_user_snapshot(user_id, version)
+        if user is None:
+            raise AuthenticationFailed(_("User not found"), code="user_not_found")
+        if not user.is_active:
+            raise AuthenticationFailed(_("User is inactive"), code="user_inactive")
+        if user.auth_version != version:
+            raise AuthenticationFailed(_("Token is outdated, refresh it"), code="token_outdated")
+        return user
@@ -0,0 +1,82 @@
+"""
+Avatar thumbnails. Avatars are stored content-addressed (see accounts.storage), and each one
+is resized into the fixed AVATAR_THUMBNAIL_SIZES by a Celery task. Thumbnail names derive from
+the source digest, so users sharing an image share its thumbnails and they are rendered once.
+"""
+import io
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db.models import Q
+from PIL import Image, ImageOps
+from .models import User
+from .storage import content_digest, digest_from_name, sharded_name
+
+THUMBNAIL_DIRECTORY = 'avatars/thumbs'
+
+
+def thumbnail_name(digest, size):
+    extension = '.' + settings.AVATAR_THUMBNAIL_FORMAT.lower()
+    return sharded_name(f'{THUMBNAIL_DIRECTORY}/{size}', digest, extension)
+
+
+def render_thumbnail(image, size):
+    thumbnail = ImageOps.fit(image, (size, size), Image.Resampling.LANCZOS)
+    output = io.BytesIO()
+    thumbnail.save(output, format=settings.AVATAR_THUMBNAIL_FORMAT, quality=settings.AVATAR_THUMBNAIL_QUALITY)
+    return output.getvalue()
+
+
+def generate_thumbnails(avatar):
+    """
+    Render the missing thumbnails of an avatar file. Returns {label: storage name}.
+    """
+    digest = digest_from_name(avatar.name)
+    if digest is None:
+        with avatar.open('rb') as source:
+            digest = content_digest(source)
+
+    names = {label: thumbnail_name(digest, size) for label, size in settings.AVATAR_THUMBNAIL_SIZES.items()}
+    missing = {label: name for label, name in names.items() if not default_storage.exists(name)}
+    if missing:
+        with avatar.open('rb') as source:
+            image = ImageOps.exif_transpose(Image.open(source))
+            image = image.convert('RGBA' if 'A' in image.getbands() else 'RGB')
+            for label, name in missing.items():
+                content = render_thumbnail(image, settings.AVATAR_THUMBNAIL_SIZES[label])
+                names[label] = default_storage.save(name, ContentFile(content))
+    return names
+
+
+def update_avatar_thumbnails(user_id):
+    """
+    Generate thumbnails for the user's current avatar and store their names on the user.
+    The write is skipped if the avatar changed meanwhile, that change queued its own run.
+    """
+    user = User.objects.only('id', 'avatar').get(pk=user_id)
+    if user.avatar:
+        thumbnails = generate_thumbnails(user.avatar)
+        current = Q(avatar=user.avatar.name)
+    else:
+        thumbnails = {}
+        current = Q(avatar='') | Q(avatar__isnull=True)
+    User.objects.filter(current, pk=user_id).update(avatar_thumbnails=thumbnails)
+    return thumbnails
+
+
+def current_thumbnails(user):
+    """
+    The user's thumbnail names if they were rendered from the current avatar, else {}
+    """
+    if not user.avatar or not user.avatar_thumbnails:
+        return {}
+    digest = digest_from_name(user.avatar.name)
+    if digest is None or any(digest_from_name(name) != digest for name in user.avatar_thumbnails.values()):
+        return {}
+    return user.avatar_thumbnails
+
+
+def thumbnails_outdated(user):
+    if not user.avatar:
+        return bool(user.avatar_thumbnails)
+    return not current_thumbnails(user)
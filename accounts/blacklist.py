@@ -0,0 +1,220 @@
+"""
+Bloom filter of blacklisted refresh token JTIs. A refresh whose jti is definitely not in
+the filter skips the BlacklistedToken lookup; only probable hits are checked in the database.
+The filter is updated when a token is blacklisted and rebuilt periodically to drop expired JTIs.
+"""
+import hashlib
+import math
+import threading
+from datetime import timedelta
+from django.conf import settings
+from django.utils import timezone
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken
+import logging
+
+logger = logging.getLogger(__name__)
+
+REDIS_BATCH_SIZE = 10000
+
+# Sets bits only if the filter exists, so an insert can't create a partial filter
+# that would answer "not blacklisted" for everything it is missing
+ADD_SCRIPT = """
+if redis.call('exists', KEYS[1]) == 1 then
+    for _, position in ipairs(ARGV) do
+        redis.call('setbit', KEYS[1], position, 1)
+    end
+end
+"""
+
+
+def filter_size(capacity, error_rate):
+    """
+    Bits and hash count for `capacity` items at the target false positive rate
+    """
+    bits = math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2)
+    hashes = max(1, round(bits / capacity * math.log(2)))
+    return bits, hashes
+
+
+def bit_positions(jti, bits, hashes):
+    # Double hashing: k positions from two 64-bit halves of one digest
+    digest = hashlib.blake2b(jti.encode(), digest_size=16).digest()
+    h1 = int.from_bytes(digest[:8], 'little')
+    h2 = int.from_bytes(digest[8:], 'little') | 1
+    return [(h1 + i * h2) % bits for i in range(hashes)]
+
+
+class InMemoryBloomFilter:
+    """
+    Per-process filter. Only safe with a single process, other processes' inserts never reach it.
+    """
+
+    def __init__(self, bits, hashes):
+        self.bits = bits
+        self.hashes = hashes
+        self._array = None
+        self._lock = threading.Lock()
+
+    def might_contain(self, jti):
+        """
+        False if the jti is definitely not blacklisted, True on a probable hit,
+        None while the filter hasn't been built
+        """
+        array = self._array
+        if array is None:
+            return None
+        return all(array[p >> 3] & (1 << (p & 7)) for p in bit_positions(jti, self.bits, self.hashes))
+
+    def add(self, jtis):
+        with self._lock:
+            if self._array is None:
+                return
+            for jti in jtis:
+                for p in bit_positions(jti, self.bits, self.hashes):
+                    self._array[p >> 3] |= 1 << (p & 7)
+
+    def replace(self, jtis):
+        array = bytearray((self.bits + 7) // 8)
+        count = 0
+        for jti in jtis:
+            for p in bit_positions(jti, self.bits, self.hashes):
+                array[p >> 3] |= 1 << (p & 7)
+            count += 1
+        with self._lock:
+            self._array = array
+        return count
+
+
+class RedisBloomFilter:
+    """
+    Filter stored as a Redis bitmap, shared by every web and worker process
+    """
+
+    def __init__(self, url, bits, hashes, key='auth:blacklist:bloom'):
+        import redis
+        self.client = redis.Redis.from_url(url)
+        self.bits = bits
+        self.hashes = hashes
+        self.key = key
+        self._add = self.client.register_script(ADD_SCRIPT)
+
+    def might_contain(self, jti):
+        pipe = self.client.pipeline(transaction=False)
+        pipe.exists(self.key)
+        for p in bit_positions(jti, self.bits, self.hashes):
+            pipe.getbit(self.key, p)
+        exists, *bits = pipe.execute()
+        if not exists:
+            return None
+        return all(bits)
+
+    def add(self, jtis):
+        positions = [p for jti in jtis for p in bit_positions(jti, self.bits, self.hashes)]
+        if positions:
+            self._add(keys=[self.key], args=positions)
+
+    def replace(self, jtis):
+        # Build under a temporary key and swap it in atomically, readers never see a partial filter
+        building_key = f'{self.key}:building'
+        self.client.delete(building_key)
+        self.client.setbit(building_key, self.bits - 1, 0)
+
+        count = 0
+        pipe = self.client.pipeline(transaction=False)
+        for jti in jtis:
+            for p in bit_positions(jti, self.bits, self.hashes):
+                pipe.setbit(building_key, p, 1)
+            count += 1
+            if count % REDIS_BATCH_SIZE == 0:
+                pipe.execute()
+        pipe.execute()
+        self.client.rename(building_key, self.key)
+        return count
+
+    def discard(self):
+        self.client.delete(self.key)
+
+
+_filter = None
+_filter_lock = threading.Lock()
+
+
+def get_blacklist_filter():
+    """
+    Configured filter, or None when TOKEN_BLACKLIST_BLOOM is empty
+    """
+    global _filter
+    backend = settings.TOKEN_BLACKLIST_BLOOM
+    if not backend:
+        return None
+    if _filter is None:
+        with _filter_lock:
+            if _filter is None:
+                bits, hashes = filter_size(
+                    settings.TOKEN_BLACKLIST_BLOOM_CAPACITY, settings.TOKEN_BLACKLIST_BLOOM_ERROR_RATE
+                )
+                if backend == 'redis':
+                    _filter = RedisBloomFilter(settings.REDIS_URL, bits, hashes)
+                else:
+                    _filter = InMemoryBloomFilter(bits, hashes)
+    return _filter
+
+
+def reset_blacklist_filter():
+    global _filter
+    _filter = None
+
+
+def is_blacklisted(jti):
+    bloom = get_blacklist_filter()
+    if bloom is not None:
+        try:
+            if bloom.might_contain(jti) is False:
+                return False
+        except Exception as e:
+            logger.warning(f"Blacklist filter lookup failed, checking the database: {e}")
+    return BlacklistedToken.objects.filter(token__jti=jti).exists()
+
+
+def add_to_blacklist_filter(jti):
+    bloom = get_blacklist_filter()
+    if bloom is None:
+        return
+    try:
+        bloom.add([jti])
+    except Exception as e:
+        logger.error(f"Could not add {jti} to the blacklist filter: {e}")
+        # A filter missing this jti would let the token through, drop it until the next rebuild
+        if hasattr(bloom, 'discard'):
+            try:
+                bloom.discard()
+            except Exception:
+                pass
+
+
+def rebuild_blacklist_filter():
+    """
+    Rebuild the filter from unexpired blacklisted tokens. Tokens blacklisted while it was
+    being built are added again once it is in place. Returns the number of JTIs loaded.
+    """
+    bloom = get_blacklist_filter()
+    if bloom is None:
+        return 0
+
+    started = timezone.now()
+    jtis = BlacklistedToken.objects.filter(
+        token__expires_at__gt=started
+    ).values_list('token__jti', flat=True).iterator(chunk_size=REDIS_BATCH_SIZE)
+    count = bloom.replace(jtis)
+
+    late = BlacklistedToken.objects.filter(
+        blacklisted_at__gte=started - timedelta(seconds=5)
+    ).values_list('token__jti', flat=True)
+    bloom.add(list(late))
+
+    if count > settings.TOKEN_BLACKLIST_BLOOM_CAPACITY:
+        logger.warning(
+            f"{count} blacklisted tokens exceed TOKEN_BLACKLIST_BLOOM_CAPACITY, "
+            f"more refreshes will fall through to the database"
+        )
+    return count
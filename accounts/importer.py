@@ -0,0 +1,329 @@
+"""
+Bulk worker onboarding. Rows are streamed from a CSV, validated and de-duplicated a batch
+at a time, passwords are hashed in a process pool and each batch is written with
+bulk_create (users, worker profiles and the specializations through table) in one transaction.
+"""
+import csv
+import io
+import multiprocessing
+import os
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from decimal import Decimal, InvalidOperation
+from itertools import islice
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.validators import UnicodeUsernameValidator
+from django.core.exceptions import ValidationError
+from django.core.validators import validate_email
+from django.db import IntegrityError, transaction
+from django.db.models.functions import Lower
+from django.utils import timezone
+from .models import User, WorkerProfile, WorkerImportJob
+import logging
+
+logger = logging.getLogger(__name__)
+
+COLUMNS = [
+    'username', 'email', 'password', 'first_name', 'last_name', 'phone',
+    'experience_years', 'hourly_rate', 'bio', 'specializations',
+]
+REQUIRED_COLUMNS = ['username', 'password']
+# Keep the job row small, the counters still cover every failure
+MAX_RECORDED_ERRORS = 100
+
+ImportResult = namedtuple('ImportResult', ['processed', 'created', 'failed'])
+
+username_validator = UnicodeUsernameValidator()
+
+
+def read_rows(fileobj):
+    """
+    Yield (line number, row) for each data row of a CSV file opened in text or binary mode
+    """
+    if isinstance(fileobj.read(0), bytes):
+        fileobj = io.TextIOWrapper(fileobj, encoding='utf-8-sig', newline='')
+    reader = csv.DictReader(fileobj)
+    missing = set(REQUIRED_COLUMNS) - set(reader.fieldnames or [])
+    if missing:
+        raise ValueError(f"Missing columns: {', '.join(sorted(missing))}")
+    for row in reader:
+        yield reader.line_num, row
+
+
+def parse_row(row, service_ids):
+    """
+    Returns (cleaned data, field errors) for one CSV row
+    """
+    errors = {}
+
+    def value(name):
+        return (row.get(name) or '').strip()
+
+    username = User.normalize_username(value('username'))
+    try:
+        if not username:
+            raise ValidationError('This field is required.')
+        username_validator(username)
+    except ValidationError as e:
+        errors['username'] = e.messages[0]
+
+    email = User.objects.normalize_email(value('email'))
+    if email:
+        try:
+            validate_email(email)
+        except ValidationError as e:
+            errors['email'] = e.messages[0]
+
+    password = row.get('password') or ''
+    if not password:
+        errors['password'] = 'This field is required.'
+
+    phone = value('phone')
+    if len(phone) > 15:
+        errors['phone'] = 'Ensure this field has no more than 15 characters.'
+
+    try:
+        experience_years = int(value('experience_years') or 0)
+        if experience_years < 0:
+            raise ValueError
+    except ValueError:
+        errors['experience_years'] = 'A valid non-negative integer is required.'
+        experience_years = 0
+
+    try:
+        hourly_rate = Decimal(value('hourly_rate') or '0').quantize(Decimal('0.01'))
+        if hourly_rate < 0 or hourly_rate >= Decimal('1e8'):
+            raise InvalidOperation
+    except InvalidOperation:
+        errors['hourly_rate'] = 'A valid amount is required.'
+        hourly_rate = Decimal('0')
+
+    try:
+        specializations = sorted({int(item) for item in value('specializations').split(';') if item.strip()})
+        unknown = [service_id for service_id in specializations if service_id not in service_ids]
+        if unknown:
+            errors['specializations'] = f"Unknown services: {', '.join(map(str, unknown))}"
+    except ValueError:
+        errors['specializations'] = 'Use service ids separated by ";".'
+        specializations = []
+
+    return {
+        'username': username,
+        'email': email,
+        'password': password,
+        'first_name': value('first_name')[:150],
+        'last_name': value('last_name')[:150],
+        'phone': phone or None,
+        'experience_years': experience_years,
+        'hourly_rate': hourly_rate,
+        'bio': value('bio'),
+        'specializations': specializations,
+    }, errors
+
+
+def _init_hasher_process():
+    import django
+    django.setup()
+
+
+def hasher_pool(processes):
+    if multiprocessing.current_process().daemon:
+        # Celery prefork children can't have children of their own. hashlib releases the GIL
+        # while running PBKDF2, so a thread pool still uses every core there.
+        return ThreadPoolExecutor(max_workers=processes, thread_name_prefix='hasher')
+    return ProcessPoolExecutor(max_workers=processes, initializer=_init_hasher_process)
+
+
+def hash_passwords(passwords, executor=None, processes=1):
+    if executor is None or len(passwords) < 2:
+        return [make_password(password) for password in passwords]
+    chunksize = max(1, len(passwords) // (processes * 4))
+    return list(executor.map(make_password, passwords, chunksize=chunksize))
+
+
+def _filter_duplicates(parsed):
+    """
+    Split parsed rows into new users and rows whose username or email is already taken,
+    by an existing user or an earlier row. Two queries per batch.
+    """
+    usernames = [data['username'].lower() for _, _, data in parsed]
+    emails = [data['email'].lower() for _, _, data in parsed if data['email']]
+    taken_usernames = set(
+        User.objects.annotate(username_lower=Lower('username'))
+        .filter(username_lower__in=usernames)
+        .values_list('username_lower', flat=True)
+    )
+    taken_emails = set(
+        User.objects.annotate(email_lower=Lower('email'))
+        .filter(email_lower__in=emails)
+        .values_list('email_lower', flat=True)
+    )
+
+    valid, duplicates = [], []
+    for line, row, data in parsed:
+        errors = {}
+        username_key, email_key = data['username'].lower(), data['email'].lower()
+        if username_key in taken_usernames:
+            errors['username'] = 'A user with this username already exists.'
+        if email_key and email_key in taken_emails:
+            errors['email'] = 'A user with this email already exists.'
+        if errors:
+            duplicates.append((line, row, errors))
+            continue
+        taken_usernames.add(username_key)
+        if email_key:
+            taken_emails.add(email_key)
+        valid.append((line, row, data))
+    return valid, duplicates
+
+
+def _insert(rows):
+    """
+    bulk_create users, profiles and specializations for (line, row, data, password hash) tuples
+    """
+    users = [
+        User(
+            username=data['username'], email=data['email'], password=password_hash,
+            first_name=data['first_name'], last_name=data['last_name'], phone=data['phone'], role='worker',
+        )
+        for _, _, data, password_hash in rows
+    ]
+    User.objects.bulk_create(users)
+
+    profiles = [
+        WorkerProfile(
+            user=user, experience_years=data['experience_years'], hourly_rate=data['hourly_rate'], bio=data['bio']
+        )
+        for user, (_, _, data, _) in zip(users, rows)
+    ]
+    WorkerProfile.objects.bulk_create(profiles)
+
+    Specialization = WorkerProfile.specializations.through
+    Specialization.objects.bulk_create([
+        Specialization(workerprofile_id=profile.id, service_id=service_id)
+        for profile, (_, _, data, _) in zip(profiles, rows)
+        for service_id in data['specializations']
+    ])
+
+
+def _write_batch(rows):
+    """
+    Insert a batch in one transaction. If a concurrent signup took a username or email in
+    the meantime, fall back to one savepoint per row. Returns (created, failed rows).
+    """
+    try:
+        with transaction.atomic():
+            _insert(rows)
+        return len(rows), []
+    except IntegrityError:
+        pass
+
+    created, failed = 0, []
+    for item in rows:
+        try:
+            with transaction.atomic():
+                _insert([item])
+            created += 1
+        except IntegrityError:
+            failed.append((item[0], item[1], {'username': 'A user with this username or email already exists.'}))
+    return created, failed
+
+
+def import_workers(rows, batch_size=None, processes=None, on_progress=None, on_error=None):
+    """
+    Create workers from (line number, row) pairs, see read_rows. on_error(line, row, errors)
+    is called for every rejected row and on_progress(result) after every batch.
+    """
+    from services.models import Service
+
+    batch_size = batch_size or settings.WORKER_IMPORT_BATCH_SIZE
+    if processes is None:
+        processes = settings.WORKER_IMPORT_PROCESSES or os.cpu_count() or 1
+    service_ids = set(Service.objects.values_list('id', flat=True))
+
+    processed = created = failed = 0
+    executor = hasher_pool(processes) if processes > 1 else None
+    rows = iter(rows)
+    try:
+        while True:
+            batch = list(islice(rows, batch_size))
+            if not batch:
+                break
+
+            parsed, rejected = [], []
+            for line, row in batch:
+                data, errors = parse_row(row, service_ids)
+                if errors:
+                    rejected.append((line, row, errors))
+                else:
+                    parsed.append((line, row, data))
+
+            valid, duplicates = _filter_duplicates(parsed)
+            hashes = hash_passwords([data['password'] for _, _, data in valid], executor, processes)
+            batch_created, write_failures = _write_batch([
+                (line, row, data, password_hash) for (line, row, data), password_hash in zip(valid, hashes)
+            ])
+
+            rejected += duplicates + write_failures
+            if on_error:
+                for line, row, errors in sorted(rejected, key=lambda item: item[0]):
+                    on_error(line, {key: value for key, value in row.items() if key != 'password'}, errors)
+
+            processed += len(batch)
+            created += batch_created
+            failed += len(rejected)
+            if on_progress:
+                on_progress(ImportResult(processed, created, failed))
+    finally:
+        if executor is not None:
+            executor.shutdown(wait=True)
+
+    return ImportResult(processed, created, failed)
+
+
+def create_import_job(source, requested_by=None):
+    return WorkerImportJob.objects.create(source=source, requested_by=requested_by)
+
+
+def run_import_job(job, batch_size=None, processes=None):
+    """
+    Import the job's CSV, saving progress and the first MAX_RECORDED_ERRORS
+    rejected rows on the job after every batch
+    """
+    claimed = WorkerImportJob.objects.filter(pk=job.pk, status='pending').update(
+        status='running', started_at=timezone.now()
+    )
+    if not claimed:
+        return job
+    job.refresh_from_db()
+
+    def record_error(line, row, errors):
+        if len(job.errors) < MAX_RECORDED_ERRORS:
+            job.errors.append({'line': line, 'username': row.get('username', ''), 'errors': errors})
+
+    def save_progress(result):
+        job.processed_count, job.created_count, job.error_count = result
+        job.save(update_fields=['processed_count', 'created_count', 'error_count', 'errors'])
+
+    try:
+        with job.source.open('rb') as source:
+            import_workers(
+                read_rows(source), batch_size, processes, on_progress=save_progress, on_error=record_error
+            )
+        job.status = 'completed'
+    except Exception as e:
+        logger.error(f"Worker import {job.id} failed: {e}")
+        job.errors = job.errors[:MAX_RECORDED_ERRORS] + [{'line': None, 'username': '', 'errors': {'file': str(e)}}]
+        job.status = 'failed'
+        raise
+    finally:
+        job.finished_at = timezone.now()
+        job.save(update_fields=['status', 'errors', 'finished_at'])
+        # The CSV holds plaintext passwords, only the job's counters and errors are kept
+        try:
+            job.source.storage.delete(job.source.name)
+        except OSError as e:
+            logger.error(f"Could not delete source of worker import {job.id}: {e}")
+
+    return job
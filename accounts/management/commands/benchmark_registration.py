@@ -0,0 +1,61 @@
+import time
+import uuid
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import override_settings
+from accounts.serializers import UserSerializer
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = 'Register users through UserSerializer inside a rolled-back transaction and report registrations/sec'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--count', type=int, default=200)
+        parser.add_argument('--worker-ratio', type=float, default=0.5, help='Fraction of signups with role=worker')
+        parser.add_argument('--fast-hasher', action='store_true',
+                            help='Use MD5 hashing to measure the database path without PBKDF2')
+
+    def handle(self, *args, **options):
+        if options['count'] < 1:
+            raise CommandError('--count must be positive')
+
+        hashers = ['django.contrib.auth.hashers.MD5PasswordHasher'] if options['fast_hasher'] else None
+        with override_settings(**({'PASSWORD_HASHERS': hashers} if hashers else {})):
+            elapsed, queries = self.run(options['count'], options['worker_ratio'])
+
+        self.stdout.write(
+            f"{options['count']} registrations in {elapsed:.2f}s ({options['count'] / elapsed:.0f}/s), "
+            f"{queries / options['count']:.1f} queries each"
+        )
+
+    def run(self, count, worker_ratio):
+        queries = 0
+
+        def count_queries(execute, sql, params, many, context):
+            nonlocal queries
+            queries += 1
+            return execute(sql, params, many, context)
+
+        prefix = uuid.uuid4().hex[:8]
+        workers_every = int(1 / worker_ratio) if worker_ratio > 0 else 0
+        started = time.perf_counter()
+        try:
+            # Nothing is kept and welcome emails (on_commit) are never queued
+            with transaction.atomic(), connection.execute_wrapper(count_queries):
+                for i in range(count):
+                    serializer = UserSerializer(data={
+                        'username': f'bench-{prefix}-{i}',
+                        'email': f'bench-{prefix}-{i}@example.com',
+                        'password': 'benchpass123',
+                        'role': 'worker' if workers_every and i % workers_every == 0 else 'client',
+                    })
+                    serializer.is_valid(raise_exception=True)
+                    serializer.save()
+                raise Rollback
+        except Rollback:
+            pass
+        return time.perf_counter() - started, queries
@@ -0,0 +1,66 @@
+import random
+import time
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import override_settings
+from accounts.activity import flush_activity, record_activity, record_login, reset_activity_buffer
+from accounts.models import User
+
+
+class Command(BaseCommand):
+    help = 'Replay logins and requests with and without the activity write-behind buffer and count user table writes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--logins', type=int, default=5000)
+        parser.add_argument('--requests-per-login', type=int, default=5)
+        parser.add_argument('--users', type=int, default=200, help='Distinct users to spread events over')
+        parser.add_argument('--flush-every', type=int, default=1000,
+                            help='Events between flushes, standing in for USER_ACTIVITY_FLUSH_INTERVAL')
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        if options['logins'] < 1 or options['users'] < 1 or options['flush_every'] < 1:
+            raise CommandError('--logins, --users and --flush-every must be positive')
+
+        users = list(User.objects.order_by('id')[:options['users']])
+        if not users:
+            raise CommandError('No users to replay events for')
+
+        rng = random.Random(options['seed'])
+        events = [rng.choice(users) for _ in range(options['logins'])]
+
+        for label, backend in (('write-through', ''), ('write-behind', 'memory')):
+            with override_settings(USER_ACTIVITY_BUFFER=backend, USER_ACTIVITY_FLUSH_INTERVAL=10 ** 9,
+                                   USER_ACTIVITY_RESOLUTION=0):
+                reset_activity_buffer()
+                writes, elapsed = self.replay(events, options['requests_per_login'], options['flush_every'])
+                reset_activity_buffer()
+
+            total = len(events) * (1 + options['requests_per_login'])
+            self.stdout.write(
+                f'{label}: {total} events, {writes} UPDATEs on accounts_user in {elapsed:.2f}s '
+                f'({writes / elapsed:.0f} writes/s, {writes * 1000 / total:.1f} per 1000 events)'
+            )
+
+    def replay(self, events, requests_per_login, flush_every):
+        writes = 0
+
+        def count_user_writes(execute, sql, params, many, context):
+            nonlocal writes
+            if sql.startswith('UPDATE "accounts_user"'):
+                writes += 1
+            return execute(sql, params, many, context)
+
+        processed = 0
+        started = time.perf_counter()
+        with connection.execute_wrapper(count_user_writes):
+            for user in events:
+                record_login(user)
+                for _ in range(requests_per_login):
+                    record_activity(user.pk)
+                processed += 1 + requests_per_login
+                if processed >= flush_every:
+                    flush_activity()
+                    processed = 0
+            flush_activity()
+        return writes, time.perf_counter() - started
@@ -0,0 +1,91 @@
+import asyncio
+import time
+from asgiref.testing import ApplicationCommunicator
+from channels.routing import URLRouter
+from django.core.management.base import BaseCommand, CommandError
+from django.test import override_settings
+from accounts.authentication import VersionedRefreshToken, clear_local_snapshots
+from accounts.middleware import JWTAuthMiddlewareStack
+from accounts.models import User
+from service_marketplace.routing import websocket_urlpatterns
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0
+    index = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+class Command(BaseCommand):
+    help = 'Open and close WebSocket connections through the JWT middleware and report connections per second'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--count', type=int, default=2000)
+        parser.add_argument('--concurrency', type=int, default=100)
+        parser.add_argument('--username', help='User to mint tokens for, defaults to the first active user')
+        parser.add_argument('--invalid-ratio', type=float, default=0.0,
+                            help='Fraction of connections made with a tampered token')
+        parser.add_argument('--redis-layer', action='store_true',
+                            help='Use the configured channel layer instead of an in-memory one')
+
+    def handle(self, *args, **options):
+        if options['count'] < 1 or options['concurrency'] < 1:
+            raise CommandError('--count and --concurrency must be positive')
+
+        users = User.objects.filter(is_active=True).order_by('id')
+        if options['username']:
+            users = users.filter(username=options['username'])
+        user = users.first()
+        if user is None:
+            raise CommandError('No active user to mint tokens for')
+
+        token = str(VersionedRefreshToken.for_user(user).access_token)
+        invalid_every = int(1 / options['invalid_ratio']) if options['invalid_ratio'] > 0 else 0
+        tokens = [
+            token[:-2] + 'xx' if invalid_every and i % invalid_every == 0 else token
+            for i in range(options['count'])
+        ]
+        clear_local_snapshots()
+
+        if options['redis_layer']:
+            results, elapsed = asyncio.run(self.run(tokens, options['concurrency']))
+        else:
+            with override_settings(CHANNEL_LAYERS={'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}}):
+                results, elapsed = asyncio.run(self.run(tokens, options['concurrency']))
+
+        accepted = sum(1 for ok, _ in results if ok)
+        latencies = sorted(ms for _, ms in results)
+        self.stdout.write(f'{len(results)} connections in {elapsed:.2f}s ({len(results) / elapsed:.0f}/s)')
+        self.stdout.write(f'Accepted: {accepted}, rejected: {len(results) - accepted}')
+        self.stdout.write(
+            'Handshake ms: '
+            f'p50={percentile(latencies, 0.5):.2f} p95={percentile(latencies, 0.95):.2f} '
+            f'p99={percentile(latencies, 0.99):.2f} max={latencies[-1]:.2f}'
+        )
+
+    async def run(self, tokens, concurrency):
+        application = JWTAuthMiddlewareStack(URLRouter(websocket_urlpatterns))
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def connect(token):
+            async with semaphore:
+                communicator = ApplicationCommunicator(application, {
+                    'type': 'websocket',
+                    'path': '/ws/notifications/',
+                    'query_string': f'token={token}'.encode(),
+                    'headers': [],
+                    'subprotocols': [],
+                })
+                started = time.perf_counter()
+                await communicator.send_input({'type': 'websocket.connect'})
+                connected = (await communicator.receive_output(5))['type'] == 'websocket.accept'
+                elapsed_ms = (time.perf_counter() - started) * 1000
+                if connected:
+                    await communicator.send_input({'type': 'websocket.disconnect', 'code': 1000})
+                    await communicator.wait(5)
+                return connected, elapsed_ms
+
+        started = time.perf_counter()
+        results = await asyncio.gather(*(connect(token) for token in tokens))
+        return results, time.perf_counter() - started
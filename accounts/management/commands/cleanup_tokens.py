@@ -0,0 +1,34 @@
+import os
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from accounts.token_cleanup import delete_expired_tokens, rows_per_second
+
+
+class Command(BaseCommand):
+    help = 'Delete expired JWT tokens in small batches, once or continuously at low priority'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=settings.TOKEN_CLEANUP_BATCH_SIZE)
+        parser.add_argument('--pause', type=float, default=settings.TOKEN_CLEANUP_PAUSE,
+                            help='Seconds to sleep between batches')
+        parser.add_argument('--continuous', action='store_true',
+                            help='Keep running, sleeping --interval seconds between passes')
+        parser.add_argument('--interval', type=float, default=60.0)
+        parser.add_argument('--nice', type=int, default=10, help='Niceness increment for this process')
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be positive')
+        if options['nice'] and hasattr(os, 'nice'):
+            os.nice(options['nice'])
+
+        while True:
+            stats = delete_expired_tokens(batch_size=options['batch_size'], pause=options['pause'])
+            self.stdout.write(
+                f'Deleted {stats.outstanding} outstanding and {stats.blacklisted} blacklisted tokens '
+                f'in {stats.batches} batches, {stats.seconds:.2f}s ({rows_per_second(stats):.0f} rows/s)'
+            )
+            if not options['continuous']:
+                break
+            time.sleep(options['interval'])
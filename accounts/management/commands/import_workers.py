@@ -0,0 +1,57 @@
+import csv
+import time
+from django.core.management.base import BaseCommand, CommandError
+from accounts.importer import COLUMNS, import_workers, read_rows
+
+
+class Command(BaseCommand):
+    help = 'Stream workers from a CSV file into User, WorkerProfile and specializations with bulk inserts'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='CSV with a header row, see accounts.importer.COLUMNS')
+        parser.add_argument('--batch-size', type=int)
+        parser.add_argument('--processes', type=int, help='Password hashing processes, defaults to one per CPU')
+        parser.add_argument('--errors-file', help='Write rejected rows (without passwords) and their errors here')
+
+    def handle(self, *args, **options):
+        if options['batch_size'] is not None and options['batch_size'] < 1:
+            raise CommandError('--batch-size must be positive')
+
+        errors_file = open(options['errors_file'], 'w', newline='') if options['errors_file'] else None
+        error_writer = None
+        if errors_file:
+            fieldnames = ['line'] + [column for column in COLUMNS if column != 'password'] + ['errors']
+            error_writer = csv.DictWriter(errors_file, fieldnames=fieldnames, extrasaction='ignore')
+            error_writer.writeheader()
+
+        started = time.perf_counter()
+
+        def report_progress(result):
+            elapsed = time.perf_counter() - started
+            self.stdout.write(
+                f'{result.processed} rows, {result.created} created, {result.failed} rejected '
+                f'({result.processed / elapsed:.0f} rows/s)'
+            )
+
+        def report_error(line, row, errors):
+            if error_writer:
+                error_writer.writerow({
+                    **row, 'line': line, 'errors': '; '.join(f'{field}: {message}' for field, message in errors.items())
+                })
+
+        try:
+            with open(options['path'], newline='', encoding='utf-8-sig') as source:
+                result = import_workers(
+                    read_rows(source), options['batch_size'], options['processes'],
+                    on_progress=report_progress, on_error=report_error
+                )
+        except (OSError, ValueError) as e:
+            raise CommandError(str(e))
+        finally:
+            if errors_file:
+                errors_file.close()
+
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'Imported {result.created} of {result.processed} workers in {elapsed:.1f}s, {result.failed} rejected'
+        ))
@@ -0,0 +1,94 @@
+from django.core.files import File
+from django.core.management.base import BaseCommand
+from accounts.avatars import THUMBNAIL_DIRECTORY, thumbnails_outdated, update_avatar_thumbnails
+from accounts.models import User
+from accounts.storage import digest_from_name
+from accounts.tasks import generate_avatar_thumbnails
+
+
+def disk_usage(storage, directory, exclude=()):
+    """
+    (files, bytes) stored under directory
+    """
+    if not storage.exists(directory):
+        return 0, 0
+    files = size = 0
+    subdirectories, names = storage.listdir(directory)
+    for name in names:
+        files += 1
+        size += storage.size(f'{directory}/{name}')
+    for subdirectory in subdirectories:
+        path = f'{directory}/{subdirectory}'
+        if path not in exclude:
+            sub_files, sub_size = disk_usage(storage, path, exclude)
+            files += sub_files
+            size += sub_size
+    return files, size
+
+
+class Command(BaseCommand):
+    help = 'Move existing avatars to content-addressed storage, render thumbnails and report disk and payload savings'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sync', action='store_true', help='Render thumbnails here instead of queueing tasks')
+        parser.add_argument(
+            '--delete-legacy', action='store_true',
+            help='Delete files left in the flat upload directory that no user references anymore'
+        )
+
+    def handle(self, *args, **options):
+        storage = User._meta.get_field('avatar').storage
+        directory = User._meta.get_field('avatar').upload_to.rstrip('/')
+        originals_before = disk_usage(storage, directory, exclude={THUMBNAIL_DIRECTORY})
+
+        users = User.objects.exclude(avatar='').exclude(avatar__isnull=True).only('id', 'avatar', 'avatar_thumbnails')
+        moved, missing, queued = 0, 0, 0
+        for user in users.iterator(chunk_size=500):
+            name = user.avatar.name
+            if digest_from_name(name) is None:
+                if not storage.exists(name):
+                    self.stderr.write(f'User {user.pk}: {name} is missing')
+                    missing += 1
+                    continue
+                with storage.open(name, 'rb') as source:
+                    new_name = storage.save(name, File(source, name))
+                User.objects.filter(pk=user.pk, avatar=name).update(avatar=new_name, avatar_thumbnails={})
+                user.avatar.name, user.avatar_thumbnails = new_name, {}
+                moved += 1
+
+            if thumbnails_outdated(user):
+                if options['sync']:
+                    update_avatar_thumbnails(user.pk)
+                else:
+                    generate_avatar_thumbnails.delay(user.pk)
+                queued += 1
+
+        if options['delete_legacy'] and storage.exists(directory):
+            # Uploads before content addressing were stored flat, next to their _<suffix> duplicates
+            legacy = {f'{directory}/{name}' for name in storage.listdir(directory)[1] if digest_from_name(name) is None}
+            still_used = set(User.objects.filter(avatar__in=legacy).values_list('avatar', flat=True))
+            for name in legacy - still_used:
+                storage.delete(name)
+
+        originals_after = disk_usage(storage, directory, exclude={THUMBNAIL_DIRECTORY})
+        self.stdout.write(
+            f'Moved {moved} avatars ({missing} missing), thumbnails {"rendered" if options["sync"] else "queued"} '
+            f'for {queued} users'
+        )
+        self.stdout.write(
+            f'Originals on disk: {originals_before[0]} files / {originals_before[1]} bytes before, '
+            f'{originals_after[0]} files / {originals_after[1]} bytes after'
+        )
+
+        # Bytes a client downloads for a list showing every user's avatar
+        full = thumbnails = 0
+        for user in users.iterator(chunk_size=500):
+            if not storage.exists(user.avatar.name):
+                continue
+            full += storage.size(user.avatar.name)
+            small = user.avatar_thumbnails.get('small')
+            if small and storage.exists(small):
+                thumbnails += storage.size(small)
+        self.stdout.write(self.style.SUCCESS(
+            f'Avatar payload for all users: {full} bytes full size, {thumbnails} bytes as small thumbnails'
+        ))
@@ -0,0 +1,111 @@
+"""
+JWT authentication for WebSocket connections. The token is validated once, the user is
+resolved without touching the database and bad tokens are rejected before the
+consumer is instantiated.
+"""
+from urllib.parse import parse_qs
+from asgiref.sync import sync_to_async
+from channels.db import database_sync_to_async
+from channels.middleware import BaseMiddleware
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import AccessToken
+from .authentication import (
+    VERSION_CLAIM, get_cached_snapshot, get_local_snapshot, get_user_snapshot, is_cache_shared,
+    user_from_claims
+)
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Application close codes, mirroring HTTP 401/403
+CLOSE_UNAUTHENTICATED = 4401
+CLOSE_FORBIDDEN = 4403
+
+
+def get_token_from_scope(scope):
+    query = parse_qs(scope.get('query_string', b'').decode())
+    if query.get('token'):
+        return query['token'][0]
+    for name, value in scope.get('headers', []):
+        if name == b'authorization':
+            parts = value.decode().split()
+            if len(parts) == 2 and parts[0] in api_settings.AUTH_HEADER_TYPES:
+                return parts[1]
+    return None
+
+
+async def resolve_user(validated_token):
+    """
+    Snapshot cache first (it carries is_active), then the signed claims. The claims are
+    only trusted if the shared cache has no newer auth_version for the user: a role change,
+    deactivation or logout bumps it. With a per-process cache that check can't see other
+    processes, so the user is read from the database instead, as it is for tokens issued
+    without role/ver claims.
+    """
+    user_id = validated_token[api_settings.USER_ID_CLAIM]
+    version = validated_token.get(VERSION_CLAIM)
+
+    if version is not None:
+        user = get_local_snapshot(user_id, version)
+        if user is not None:
+            return user
+        user, outdated = await sync_to_async(get_cached_snapshot, thread_sensitive=False)(user_id, version)
+        if outdated:
+            raise TokenError("Token is outdated, refresh it")
+        if user is not None:
+            return user
+        if is_cache_shared():
+            user = user_from_claims(validated_token)
+            if user is not None:
+                return user
+
+    user = await database_sync_to_async(get_user_snapshot)(user_id)
+    if user is not None and version is not None and user.auth_version != version:
+        raise TokenError("Token is outdated, refresh it")
+    return user
+
+
+async def authenticate_scope(scope):
+    """
+    Returns (user, token claims, None) or (None, None, close code) for a connection scope.
+    Also used by the SSE stream, which maps the codes back to HTTP statuses.
+    """
+    token = get_token_from_scope(scope)
+    if not token:
+        return None, None, CLOSE_UNAUTHENTICATED
+
+    try:
+        validated_token = AccessToken(token)
+        user = await resolve_user(validated_token)
+    except TokenError as e:
+        logger.info(f"Rejected {scope['type']} token: {e}")
+        return None, None, CLOSE_UNAUTHENTICATED
+
+    if user is None or not user.is_active:
+        return None, None, CLOSE_FORBIDDEN
+    return user, validated_token.payload, None
+
+
+class JWTAuthMiddleware(BaseMiddleware):
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'websocket':
+            return await super().__call__(scope, receive, send)
+
+        user, claims, code = await authenticate_scope(scope)
+        if user is None:
+            return await self.reject(receive, send, code)
+
+        scope = dict(scope, user=user, token_claims=claims)
+        return await super().__call__(scope, receive, send)
+
+    async def reject(self, receive, send, code):
+        # Complete the handshake message so the server can close cleanly
+        message = await receive()
+        if message['type'] == 'websocket.connect':
+            await send({'type': 'websocket.close', 'code': code})
+
+
+def JWTAuthMiddlewareStack(inner):
+    return JWTAuthMiddleware(inner)
+
@@ -0,0 +1,41 @@
+# Generated by Django 5.2.5 on 2026-10-19 03:24
+
+import os
+import accounts.models
+import accounts.storage
+from django.conf import settings
+from django.db import migrations, models
+
+
+def move_import_sources(apps, schema_editor):
+    """
+    Take partner CSVs out of MEDIA_ROOT: finished jobs' files are deleted, pending ones move
+    to PRIVATE_MEDIA_ROOT under the same name
+    """
+    WorkerImportJob = apps.get_model('accounts', 'WorkerImportJob')
+    for job in WorkerImportJob.objects.exclude(source='').iterator():
+        legacy = os.path.join(settings.MEDIA_ROOT, job.source.name)
+        if not os.path.exists(legacy):
+            continue
+        if job.status in ('completed', 'failed'):
+            os.remove(legacy)
+        else:
+            target = os.path.join(settings.PRIVATE_MEDIA_ROOT, job.source.name)
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            os.replace(legacy, target)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0008_user_avatar_thumbnails'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='workerimportjob',
+            name='source',
+            field=models.FileField(storage=accounts.storage.PrivateStorage(), upload_to=accounts.models.import_source_path),
+        ),
+        migrations.RunPython(move_import_sources, migrations.RunPython.noop),
+    ]
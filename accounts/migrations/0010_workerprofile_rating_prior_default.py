@@ -0,0 +1,48 @@
+# Generated by Django 5.2.5 on 2026-10-19 03:39
+
+from decimal import Decimal, ROUND_HALF_UP
+import accounts.models
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Sum
+
+
+def recompute_ratings(apps, schema_editor):
+    """
+    Rebuild rating_sum/rating_count from the reviews and rating as the smoothed score, so
+    workers without reviews get the prior mean instead of 0.00
+    """
+    WorkerProfile = apps.get_model('accounts', 'WorkerProfile')
+    Review = apps.get_model('orders', 'Review')
+    prior = settings.WORKER_RATING_PRIOR
+
+    def score(rating_sum, rating_count):
+        value = (prior['weight'] * prior['mean'] + rating_sum) / (prior['weight'] + rating_count)
+        return Decimal(str(value)).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
+
+    totals = {
+        row['worker_id']: (row['total'], row['count'])
+        for row in Review.objects.values('worker_id').annotate(total=Sum('rating'), count=Count('id'))
+    }
+    WorkerProfile.objects.update(rating_sum=0, rating_count=0, rating=score(0, 0))
+    for worker_id, (rating_sum, rating_count) in totals.items():
+        WorkerProfile.objects.filter(user_id=worker_id).update(
+            rating_sum=rating_sum, rating_count=rating_count, rating=score(rating_sum, rating_count)
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0009_private_import_source'),
+        ('orders', '0004_review'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='workerprofile',
+            name='rating',
+            field=models.DecimalField(decimal_places=2, default=accounts.models.default_rating, max_digits=3),
+        ),
+        migrations.RunPython(recompute_ratings, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 5.2.5 on 2026-10-19 04:09
+
+import django.db.models.functions.text
+from django.db import migrations, models
+from django.db.models import Count
+from django.db.models.functions import Lower
+
+
+def check_username_duplicates(apps, schema_editor):
+    """
+    Stop with the conflicting accounts listed instead of a bare IntegrityError, renaming
+    someone's login is left to an admin
+    """
+    User = apps.get_model('accounts', 'User')
+    duplicates = list(
+        User.objects.annotate(username_lower=Lower('username')).values('username_lower')
+        .annotate(count=Count('id')).filter(count__gt=1).values_list('username_lower', flat=True)
+    )
+    if duplicates:
+        raise RuntimeError(
+            f"Usernames that differ only in case must be renamed before this migration: {', '.join(duplicates)}"
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0010_workerprofile_rating_prior_default'),
+        ('auth', '0012_alter_user_first_name_max_length'),
+    ]
+
+    operations = [
+        migrations.RunPython(check_username_duplicates, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='user',
+            constraint=models.UniqueConstraint(django.db.models.functions.text.Lower('username'), name='accounts_user_username_ci_unique'),
+        ),
+    ]
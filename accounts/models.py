@@ -1,5 +1,15 @@
+import uuid
+from decimal import Decimal
+from django.conf import settings
 from django.db import models
+from django.db.models import Q
+from django.db.models.functions import Lower
 from django.contrib.auth.models import AbstractUser
+from .storage import ContentAddressedStorage, PrivateStorage
+
+# Case-insensitive unique email and username, registration relies on them instead of a lookup
+EMAIL_UNIQUE_CONSTRAINT = 'accounts_user_email_ci_unique'
+USERNAME_UNIQUE_CONSTRAINT = 'accounts_user_username_ci_unique'
 
 class User(AbstractUser):
     ROLE_CHOICES = [
@@ -10,24 +20,107 @@ class User(AbstractUser):
     
     role = models.CharField(max_length=10, choices=ROLE_CHOICES, default='client')
     phone = models.CharField(max_length=15, blank=True, null=True)
-    avatar = models.ImageField(upload_to='avatars/', blank=True, null=True)
+    # Stored as avatars/<sha256 shard>/<sha256>.<ext>, identical uploads share one file
+    avatar = models.ImageField(upload_to='avatars/', storage=ContentAddressedStorage(), blank=True, null=True)
+    # {label: name} per AVATAR_THUMBNAIL_SIZES, written by the generate_avatar_thumbnails task
+    avatar_thumbnails = models.JSONField(default=dict, blank=True)
     is_verified = models.BooleanField(default=False)
+    # Bumped when any AUTH_STATE_FIELDS value changes, invalidates cached snapshots and older tokens
+    auth_version = models.PositiveIntegerField(default=1)
+    # Written in batches by accounts.activity, like last_login
+    last_activity = models.DateTimeField(blank=True, null=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    AUTH_STATE_FIELDS = ('role', 'is_active', 'is_staff', 'is_superuser')
+
+    class Meta(AbstractUser.Meta):
+        constraints = [
+            models.UniqueConstraint(Lower('email'), name=EMAIL_UNIQUE_CONSTRAINT, condition=~Q(email='')),
+            models.UniqueConstraint(Lower('username'), name=USERNAME_UNIQUE_CONSTRAINT),
+        ]
+
     def __str__(self):
         return f"{self.username} ({self.role})"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._auth_state = instance._get_auth_state()
+        return instance
+
+    def _get_auth_state(self):
+        # Read __dict__ so deferred fields aren't loaded
+        return tuple(self.__dict__.get(field) for field in self.AUTH_STATE_FIELDS)
+
+    def save(self, *args, **kwargs):
+        old_state = getattr(self, '_auth_state', None)
+        old_version = self.auth_version
+        if old_state is not None and self._get_auth_state() != old_state:
+            self.auth_version += 1
+            if kwargs.get('update_fields') is not None:
+                kwargs['update_fields'] = {*kwargs['update_fields'], 'auth_version'}
+        super().save(*args, **kwargs)
+        self._auth_state = self._get_auth_state()
+
+        if old_state is not None:
+            from .authentication import invalidate_user_snapshot
+            invalidate_user_snapshot(self.pk, old_version, self.auth_version)
+
+def default_rating():
+    # Smoothed score of a worker without reviews: the prior mean
+    return Decimal(str(settings.WORKER_RATING_PRIOR['mean'])).quantize(Decimal('0.01'))
+
 class WorkerProfile(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='worker_profile')
     specializations = models.ManyToManyField('services.Service', related_name='workers', blank=True)
     experience_years = models.PositiveIntegerField(default=0)
     hourly_rate = models.DecimalField(max_digits=10, decimal_places=2, default=0.00)
-    rating = models.DecimalField(max_digits=3, decimal_places=2, default=0.00)
+    # Bayesian-smoothed score; rating_sum/rating_count are updated incrementally per review
+    rating = models.DecimalField(max_digits=3, decimal_places=2, default=default_rating)
+    rating_sum = models.PositiveIntegerField(default=0)
+    rating_count = models.PositiveIntegerField(default=0)
     is_available = models.BooleanField(default=True)
     bio = models.TextField(blank=True)
     created_at = models.DateTimeField(auto_now_add=True, null=True, blank=True)
     updated_at = models.DateTimeField(auto_now=True, null=True, blank=True)
     
     def __str__(self):
-        return f"{self.user.username} - Worker Profile"
\ No newline at end of file
+        return f"{self.user.username} - Worker Profile"
+
+def import_source_path(instance, filename):
+    # Job id instead of the partner's file name
+    return f'imports/workers/{instance.id}.csv'
+
+
+class WorkerImportJob(models.Model):
+    """
+    Bulk worker onboarding from a partner CSV, run in the background by import_workers_job
+    """
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('running', 'Running'),
+        ('completed', 'Completed'),
+        ('failed', 'Failed'),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    requested_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True,
+                                     related_name='worker_import_jobs')
+    source = models.FileField(upload_to=import_source_path, storage=PrivateStorage())
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
+
+    processed_count = models.PositiveIntegerField(default=0)
+    created_count = models.PositiveIntegerField(default=0)
+    error_count = models.PositiveIntegerField(default=0)
+    errors = models.JSONField(default=list, blank=True)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(blank=True, null=True)
+    finished_at = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return f"Worker import {self.id} - {self.status}"
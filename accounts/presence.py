@@ -0,0 +1,248 @@
+"""
+Presence registry fed by NotificationConsumer. Every open WebSocket is a member of its user's
+set, and online workers are members of one sorted set per specialization plus one for all
+workers. Scores are expiry timestamps refreshed by the ping/pong heartbeat, so a connection that
+dies without a disconnect drops out after WORKER_PRESENCE_TTL and lookups are range queries
+on the score, O(log n + m).
+"""
+import threading
+import time
+from django.conf import settings
+import logging
+
+logger = logging.getLogger(__name__)
+
+ALL_WORKERS = 'all'
+
+# KEYS: user connections, then the worker sets. ARGV: channel, expires at, ttl, user id
+TOUCH_SCRIPT = """
+redis.call('zadd', KEYS[1], ARGV[2], ARGV[1])
+redis.call('expire', KEYS[1], ARGV[3])
+for i = 2, #KEYS do
+    redis.call('zadd', KEYS[i], ARGV[2], ARGV[4])
+    redis.call('expire', KEYS[i], ARGV[3])
+end
+"""
+
+# KEYS: user connections, then the worker sets. ARGV: channel, now, user id.
+# The user leaves the worker sets only when their last live connection closes.
+LEAVE_SCRIPT = """
+redis.call('zrem', KEYS[1], ARGV[1])
+redis.call('zremrangebyscore', KEYS[1], '-inf', ARGV[2])
+local remaining = redis.call('zcard', KEYS[1])
+if remaining == 0 then
+    for i = 2, #KEYS do
+        redis.call('zrem', KEYS[i], ARGV[3])
+    end
+end
+return remaining
+"""
+
+
+class InMemoryPresence:
+    """
+    Per-process registry. Only sees connections served by this process.
+    """
+
+    def __init__(self):
+        self._connections = {}
+        self._workers = {}
+        self._lock = threading.Lock()
+
+    def touch(self, user_id, channel, groups, ttl):
+        expires_at = time.time() + ttl
+        with self._lock:
+            self._connections.setdefault(user_id, {})[channel] = expires_at
+            for group in groups:
+                self._workers.setdefault(group, {})[user_id] = expires_at
+
+    def leave(self, user_id, channel, groups):
+        now = time.time()
+        with self._lock:
+            connections = self._connections.get(user_id, {})
+            connections.pop(channel, None)
+            for name in [name for name, expires_at in connections.items() if expires_at <= now]:
+                del connections[name]
+            if not connections:
+                self._connections.pop(user_id, None)
+                for group in groups:
+                    self._workers.get(group, {}).pop(user_id, None)
+            return len(connections)
+
+    def online(self, group, limit=None):
+        now = time.time()
+        with self._lock:
+            members = sorted(
+                (expires_at, user_id) for user_id, expires_at in self._workers.get(group, {}).items()
+                if expires_at > now
+            )
+        user_ids = [user_id for _, user_id in members]
+        return user_ids[:limit] if limit else user_ids
+
+    def count_online(self, group):
+        return len(self.online(group))
+
+    def connection_count(self, user_id):
+        now = time.time()
+        with self._lock:
+            return sum(1 for expires_at in self._connections.get(user_id, {}).values() if expires_at > now)
+
+    def prune(self):
+        now = time.time()
+        removed = 0
+        with self._lock:
+            for members in list(self._connections.values()) + list(self._workers.values()):
+                for key in [key for key, expires_at in members.items() if expires_at <= now]:
+                    del members[key]
+                    removed += 1
+        return removed
+
+
+class RedisPresence:
+    """
+    Registry in Redis sorted sets, shared by every ASGI, web and worker process
+    """
+
+    def __init__(self, url, prefix='presence'):
+        import redis
+        self.client = redis.Redis.from_url(url)
+        self.prefix = prefix
+        self._touch = self.client.register_script(TOUCH_SCRIPT)
+        self._leave = self.client.register_script(LEAVE_SCRIPT)
+
+    def _user_key(self, user_id):
+        return f'{self.prefix}:user:{user_id}'
+
+    def _group_key(self, group):
+        return f'{self.prefix}:workers:{group}'
+
+    def touch(self, user_id, channel, groups, ttl):
+        keys = [self._user_key(user_id)] + [self._group_key(group) for group in groups]
+        self._touch(keys=keys, args=[channel, time.time() + ttl, ttl, user_id])
+
+    def leave(self, user_id, channel, groups):
+        keys = [self._user_key(user_id)] + [self._group_key(group) for group in groups]
+        return self._leave(keys=keys, args=[channel, time.time(), user_id])
+
+    def online(self, group, limit=None):
+        if limit:
+            members = self.client.zrangebyscore(self._group_key(group), time.time(), '+inf', start=0, num=limit)
+        else:
+            members = self.client.zrangebyscore(self._group_key(group), time.time(), '+inf')
+        return [int(member) for member in members]
+
+    def count_online(self, group):
+        return self.client.zcount(self._group_key(group), time.time(), '+inf')
+
+    def connection_count(self, user_id):
+        return self.client.zcount(self._user_key(user_id), time.time(), '+inf')
+
+    def prune(self):
+        # Sets of idle groups expire on their own, this trims expired members of busy ones
+        now = time.time()
+        removed = 0
+        for key in self.client.scan_iter(match=f'{self.prefix}:*', count=1000):
+            removed += self.client.zremrangebyscore(key, '-inf', now)
+        return removed
+
+
+_presence = None
+_presence_lock = threading.Lock()
+
+
+def get_presence():
+    """
+    Configured registry, or None when WORKER_PRESENCE is empty
+    """
+    global _presence
+    backend = settings.WORKER_PRESENCE
+    if not backend:
+        return None
+    if _presence is None:
+        with _presence_lock:
+            if _presence is None:
+                if backend == 'redis':
+                    _presence = RedisPresence(settings.REDIS_URL)
+                else:
+                    _presence = InMemoryPresence()
+    return _presence
+
+
+def reset_presence():
+    global _presence
+    _presence = None
+
+
+def presence_groups(user_id, role, service_ids):
+    """
+    Worker sets a user belongs to: every specialization plus ALL_WORKERS. Other roles only
+    have their connection count.
+    """
+    if role != 'worker':
+        return []
+    return [ALL_WORKERS] + [str(service_id) for service_id in service_ids]
+
+
+def worker_service_ids(user_id):
+    from services.models import Service
+    return list(Service.objects.filter(workers__user_id=user_id).values_list('id', flat=True))
+
+
+def touch_connection(user_id, channel, groups):
+    """
+    Register or refresh a connection. Presence is best effort, failures are only logged.
+    """
+    presence = get_presence()
+    if presence is None:
+        return
+    try:
+        presence.touch(user_id, channel, groups, settings.WORKER_PRESENCE_TTL)
+    except Exception as e:
+        logger.warning(f"Could not update presence of user {user_id}: {e}")
+
+
+def leave_connection(user_id, channel, groups):
+    presence = get_presence()
+    if presence is None:
+        return
+    try:
+        presence.leave(user_id, channel, groups)
+    except Exception as e:
+        logger.warning(f"Could not remove presence of user {user_id}: {e}")
+
+
+def online_worker_ids(service_id=None, limit=None):
+    """
+    Ids of workers with a live connection, for one service or all of them.
+    None when the registry is disabled or unreachable, callers fall back to the database.
+    """
+    presence = get_presence()
+    if presence is None:
+        return None
+    try:
+        return presence.online(str(service_id) if service_id is not None else ALL_WORKERS, limit)
+    except Exception as e:
+        logger.warning(f"Presence lookup failed: {e}")
+        return None
+
+
+def count_online_workers(service_id=None):
+    presence = get_presence()
+    if presence is None:
+        return None
+    try:
+        return presence.count_online(str(service_id) if service_id is not None else ALL_WORKERS)
+    except Exception as e:
+        logger.warning(f"Presence lookup failed: {e}")
+        return None
+
+
+def connection_count(user_id):
+    presence = get_presence()
+    if presence is None:
+        return None
+    try:
+        return presence.connection_count(user_id)
+    except Exception as e:
+        logger.warning(f"Presence lookup failed: {e}")
+        return None
@@ -1,53 +1,115 @@
 from rest_framework import serializers
 from django.contrib.auth import authenticate
-from django.db import IntegrityError
-from .models import User, WorkerProfile
+from django.contrib.auth.validators import UnicodeUsernameValidator
+from django.db import IntegrityError, transaction
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.serializers import TokenRefreshSerializer
+from rest_framework_simplejwt.settings import api_settings
+from .models import EMAIL_UNIQUE_CONSTRAINT, USERNAME_UNIQUE_CONSTRAINT, User, WorkerProfile, WorkerImportJob
+from .tasks import send_welcome_email
+from .authentication import VersionedRefreshToken, add_auth_claims, get_user_snapshot
+from .avatars import current_thumbnails
+
+def integrity_error_to_validation_error(error, username=None, email=None, exclude_pk=None):
+    """
+    Field errors for a unique violation on accounts_user. The database reports only one
+    constraint, so the conflicting fields are looked up here, off the happy path.
+    """
+    others = User.objects.exclude(pk=exclude_pk) if exclude_pk else User.objects.all()
+    errors = {}
+    if username and others.filter(username__iexact=username).exists():
+        errors['username'] = "A user with this username already exists."
+    if email and others.filter(email__iexact=email).exists():
+        errors['email'] = "A user with this email already exists."
+    if not errors:
+        message = str(error)
+        if EMAIL_UNIQUE_CONSTRAINT in message or 'email' in message:
+            errors['email'] = "A user with this email already exists."
+        elif USERNAME_UNIQUE_CONSTRAINT in message or 'username' in message:
+            errors['username'] = "A user with this username already exists."
+        else:
+            return serializers.ValidationError("A user with this information already exists.")
+    return serializers.ValidationError(errors)
 
 class UserSerializer(serializers.ModelSerializer):
     password = serializers.CharField(write_only=True)
+    avatar_thumbnails = serializers.SerializerMethodField()
     
     class Meta:
         model = User
         fields = ['id', 'username', 'email', 'first_name', 'last_name', 
-                 'role', 'phone', 'avatar', 'is_verified', 'password']
-        extra_kwargs = {'password': {'write_only': True}}
+                 'role', 'phone', 'avatar', 'avatar_thumbnails', 'is_verified', 'password']
+        extra_kwargs = {
+            'password': {'write_only': True},
+            # Uniqueness is enforced by the database, see create()
+            'username': {'validators': [UnicodeUsernameValidator()]},
+        }
     
     def validate_username(self, value):
-        if User.objects.filter(username=value).exists():
-            raise serializers.ValidationError("A user with this username already exists.")
-        return value
-    
-    def validate_email(self, value):
-        if value and User.objects.filter(email=value).exists():
-            raise serializers.ValidationError("A user with this email already exists.")
-        return value
+        # Same normalization as create_user(), the database then compares it case-insensitively
+        return User.normalize_username(value)
     
     def create(self, validated_data):
+        password = validated_data.pop('password')
+        user = User(**validated_data)
+        user.email = User.objects.normalize_email(user.email)
+        # Hash before opening the transaction so it only covers the inserts
+        user.set_password(password)
+        
         try:
-            password = validated_data.pop('password')
-            user = User.objects.create_user(**validated_data)
-            user.set_password(password)
-            user.save()
-            
-            # Create worker profile if role is worker
-            if user.role == 'worker':
-                WorkerProfile.objects.create(user=user)
-            
-            return user
+            with transaction.atomic():
+                user.save()
+                if user.role == 'worker':
+                    WorkerProfile.objects.create(user=user)
         except IntegrityError as e:
-            if 'username' in str(e):
-                raise serializers.ValidationError({"username": "A user with this username already exists."})
-            elif 'email' in str(e):
-                raise serializers.ValidationError({"email": "A user with this email already exists."})
-            else:
-                raise serializers.ValidationError("A user with this information already exists.")
+            raise integrity_error_to_validation_error(e, user.username, user.email)
+        
+        transaction.on_commit(lambda: send_welcome_email.delay(user.id))
+        return user
+    
+    def get_avatar_thumbnails(self, obj):
+        """
+        {label: URL} of thumbnails rendered from the current avatar, empty until the task ran
+        """
+        request = self.context.get('request')
+        storage = obj.avatar.storage
+        urls = {}
+        for label, name in current_thumbnails(obj).items():
+            url = storage.url(name)
+            urls[label] = request.build_absolute_uri(url) if request else url
+        return urls
+    
+    def update(self, instance, validated_data):
+        try:
+            with transaction.atomic():
+                return super().update(instance, validated_data)
+        except IntegrityError as e:
+            raise integrity_error_to_validation_error(
+                e, validated_data.get('username'), validated_data.get('email'), exclude_pk=instance.pk
+            )
 
 class WorkerProfileSerializer(serializers.ModelSerializer):
     user = UserSerializer(read_only=True)
     
     class Meta:
         model = WorkerProfile
-        fields = '__all__'
+        exclude = ['rating_sum']
+        read_only_fields = ['rating', 'rating_count']
+
+class WorkerImportSerializer(serializers.Serializer):
+    file = serializers.FileField()
+    
+    def validate_file(self, value):
+        if not value.name.lower().endswith('.csv'):
+            raise serializers.ValidationError('Upload a CSV file.')
+        return value
+
+class WorkerImportJobSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = WorkerImportJob
+        fields = ['id', 'status', 'processed_count', 'created_count', 'error_count', 'errors',
+                  'requested_by', 'created_at', 'started_at', 'finished_at']
+        read_only_fields = fields
 
 class LoginSerializer(serializers.Serializer):
     username = serializers.CharField()
@@ -67,4 +129,36 @@ class LoginSerializer(serializers.Serializer):
         else:
             raise serializers.ValidationError('Both username and password are required')
         
-        return attrs
\ No newline at end of file
+        return attrs
+
+class VersionedTokenRefreshSerializer(TokenRefreshSerializer):
+    """
+    Refresh that re-reads role and auth_version, so tokens pick up role changes
+    """
+    token_class = VersionedRefreshToken
+    
+    def validate(self, attrs):
+        refresh = self.token_class(attrs['refresh'])
+        
+        user = get_user_snapshot(refresh[api_settings.USER_ID_CLAIM])
+        if user is None or not user.is_active:
+            raise AuthenticationFailed('User not found or inactive', code='user_inactive')
+        add_auth_claims(refresh, user)
+        
+        data = {'access': str(refresh.access_token)}
+        
+        if api_settings.ROTATE_REFRESH_TOKENS:
+            if api_settings.BLACKLIST_AFTER_ROTATION:
+                try:
+                    refresh.blacklist()
+                except AttributeError:
+                    # Blacklist app not installed
+                    pass
+            
+            refresh.set_jti()
+            refresh.set_exp()
+            refresh.set_iat()
+            
+            data['refresh'] = str(refresh)
+        
+        return data
@@ -0,0 +1,23 @@
+from django.db import transaction
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken
+from .avatars import thumbnails_outdated
+from .blacklist import add_to_blacklist_filter
+from .models import User
+
+
+@receiver(post_save, sender=BlacklistedToken)
+def add_blacklisted_token_to_filter(sender, instance, created, **kwargs):
+    if created:
+        add_to_blacklist_filter(instance.token.jti)
+
+
+@receiver(post_save, sender=User)
+def queue_avatar_thumbnails(sender, instance, update_fields=None, **kwargs):
+    if update_fields is not None and 'avatar' not in update_fields:
+        return
+    if thumbnails_outdated(instance):
+        from .tasks import generate_avatar_thumbnails
+        user_id = instance.pk
+        transaction.on_commit(lambda: generate_avatar_thumbnails.delay(user_id))
@@ -0,0 +1,86 @@
+"""
+Content-addressed file storage. Files are stored under the SHA-256 of their content,
+sharded by the first two byte pairs of the digest (avatars/3f/a2/3fa2...e1.png), so
+uploading the same image twice keeps a single copy on disk.
+"""
+import hashlib
+import os
+import uuid
+from django.conf import settings
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+from django.utils.deconstruct import deconstructible
+
+HASH_CHUNK_SIZE = 64 * 1024
+
+
+def content_digest(content):
+    hasher = hashlib.sha256()
+    for chunk in content.chunks(HASH_CHUNK_SIZE):
+        hasher.update(chunk)
+    return hasher.hexdigest()
+
+
+def sharded_name(directory, digest, extension):
+    return os.path.join(directory, digest[:2], digest[2:4], f'{digest}{extension}').replace(os.sep, '/')
+
+
+def digest_from_name(name):
+    """
+    Digest of a content-addressed name, or None for files stored before hashing was introduced
+    """
+    stem = os.path.splitext(os.path.basename(name or ''))[0]
+    if len(stem) == 64 and all(char in '0123456789abcdef' for char in stem):
+        return stem
+    return None
+
+
+@deconstructible(path='accounts.storage.ContentAddressedStorage')
+class ContentAddressedStorage(FileSystemStorage):
+    """
+    Keeps the directory chosen by upload_to and replaces the file name with the content digest.
+    Saving content that is already stored writes nothing and returns the existing name.
+    """
+
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        if not hasattr(content, 'chunks'):
+            content = File(content, name)
+
+        directory = os.path.dirname(name)
+        extension = os.path.splitext(name)[1].lower()
+        name = sharded_name(directory, content_digest(content), extension)
+        if self.exists(name):
+            return name
+        return super().save(name, content, max_length)
+
+    def get_available_name(self, name, max_length=None):
+        # Same name means same content, never add a suffix
+        return name
+
+    def _save(self, name, content):
+        # Write under a unique temporary name and rename into place: readers never see a partial
+        # file, and a concurrent upload of the same content just replaces it with identical bytes
+        temporary_name = super()._save(f'{name}.{uuid.uuid4().hex}.tmp', content)
+        os.replace(self.path(temporary_name), self.path(name))
+        return name
+
+
+@deconstructible(path='accounts.storage.PrivateStorage')
+class PrivateStorage(FileSystemStorage):
+    """
+    Files under PRIVATE_MEDIA_ROOT, outside MEDIA_ROOT and never served, for uploads
+    holding secrets such as the passwords in partner CSVs
+    """
+
+    @property
+    def base_location(self):
+        return self._value_or_setting(self._location, settings.PRIVATE_MEDIA_ROOT)
+
+    @property
+    def location(self):
+        return os.path.abspath(self.base_location)
+
+    def url(self, name):
+        raise ValueError('Private files have no URL')
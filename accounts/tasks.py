@@ -1,7 +1,5 @@
 from celery import shared_task
-from django.utils import timezone
 from django.contrib.auth import get_user_model
-from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken, OutstandingToken
 import logging
 
 User = get_user_model()
@@ -10,23 +8,103 @@ logger = logging.getLogger(__name__)
 @shared_task
 def cleanup_expired_tokens():
     """
-    Clean up expired JWT tokens from the blacklist
+    Clean up expired JWT tokens from the blacklist in small primary-key ordered batches
     """
     try:
-        expired_tokens = OutstandingToken.objects.filter(
-            expires_at__lt=timezone.now()
-        )
+        from django.conf import settings
+        from accounts.token_cleanup import delete_expired_tokens, rows_per_second
         
-        count = expired_tokens.count()
-        expired_tokens.delete()
+        stats = delete_expired_tokens(
+            batch_size=settings.TOKEN_CLEANUP_BATCH_SIZE,
+            pause=settings.TOKEN_CLEANUP_PAUSE
+        )
         
-        logger.info(f"Cleaned up {count} expired tokens")
-        return f"Cleaned up {count} expired tokens"
+        logger.info(
+            f"Cleaned up {stats.outstanding} expired tokens ({stats.blacklisted} blacklisted) "
+            f"in {stats.batches} batches, {rows_per_second(stats):.0f} rows/sec"
+        )
+        return f"Cleaned up {stats.outstanding} expired tokens"
     
     except Exception as e:
         logger.error(f"Error cleaning up tokens: {e}")
         return f"Error: {e}"
 
+@shared_task
+def rebuild_token_blacklist_filter():
+    """
+    Rebuild the blacklisted JTI Bloom filter, dropping expired tokens
+    """
+    try:
+        from accounts.blacklist import rebuild_blacklist_filter
+        
+        count = rebuild_blacklist_filter()
+        logger.info(f"Rebuilt token blacklist filter with {count} tokens")
+        return f"Rebuilt token blacklist filter with {count} tokens"
+    
+    except Exception as e:
+        logger.error(f"Error rebuilding token blacklist filter: {e}")
+        return f"Error: {e}"
+
+@shared_task
+def flush_user_activity():
+    """
+    Write buffered last_login/last_activity timestamps to the user table
+    """
+    try:
+        from accounts.activity import flush_activity
+        
+        count = flush_activity()
+        logger.info(f"Flushed activity for {count} users")
+        return f"Flushed activity for {count} users"
+    
+    except Exception as e:
+        logger.error(f"Error flushing user activity: {e}")
+        return f"Error: {e}"
+
+@shared_task
+def import_workers_job(job_id):
+    """
+    Run a worker import job created by the worker import API
+    """
+    try:
+        from accounts.models import WorkerImportJob
+        from accounts.importer import run_import_job
+        
+        try:
+            job = WorkerImportJob.objects.get(id=job_id)
+        except WorkerImportJob.DoesNotExist:
+            logger.error(f"Worker import job with id {job_id} not found")
+            return f"Worker import job not found"
+        
+        job = run_import_job(job)
+        logger.info(f"Worker import {job_id} {job.status}: {job.created_count} created, {job.error_count} rejected")
+        return f"Worker import {job.status}: {job.created_count}/{job.processed_count} created"
+    
+    except Exception as e:
+        logger.error(f"Error running worker import {job_id}: {e}")
+        return f"Error: {e}"
+
+@shared_task
+def generate_avatar_thumbnails(user_id):
+    """
+    Render the thumbnails of a user's avatar after it changed
+    """
+    try:
+        from accounts.avatars import update_avatar_thumbnails
+        
+        try:
+            thumbnails = update_avatar_thumbnails(user_id)
+        except User.DoesNotExist:
+            logger.error(f"User with id {user_id} not found")
+            return f"User not found"
+        
+        logger.info(f"Generated {len(thumbnails)} avatar thumbnails for user {user_id}")
+        return f"Generated {len(thumbnails)} avatar thumbnails"
+    
+    except Exception as e:
+        logger.error(f"Error generating avatar thumbnails for user {user_id}: {e}")
+        return f"Error: {e}"
+
 @shared_task
 def send_welcome_email(user_id):
     """
@@ -45,18 +123,36 @@ def send_welcome_email(user_id):
         logger.error(f"Error sending welcome email: {e}")
         return f"Error: {e}"
 
+@shared_task
+def prune_worker_presence():
+    """
+    Drop presence entries of connections that stopped sending heartbeats
+    """
+    try:
+        from accounts.presence import get_presence
+        
+        presence = get_presence()
+        removed = presence.prune() if presence is not None else 0
+        logger.info(f"Pruned {removed} expired presence entries")
+        
+        return f"Pruned {removed} expired presence entries"
+    
+    except Exception as e:
+        logger.error(f"Error pruning presence: {e}")
+        return f"Error: {e}"
+
 @shared_task
 def update_worker_ratings():
     """
-    Update worker ratings based on recent reviews
+    Verify worker rating aggregates against reviews, a few chunks per run, and repair drift
     """
     try:
-        from accounts.models import WorkerProfile
+        from orders.reviews import repair_worker_ratings
         
-        worker_count = WorkerProfile.objects.count()
-        logger.info(f"Updated ratings for {worker_count} workers")
+        checked, repaired = repair_worker_ratings()
+        logger.info(f"Checked ratings for {checked} workers, repaired {repaired}")
         
-        return f"Updated ratings for {worker_count} workers"
+        return f"Checked ratings for {checked} workers, repaired {repaired}"
     
     except Exception as e:
         logger.error(f"Error updating worker ratings: {e}")
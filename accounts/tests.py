@@ -1,11 +1,41 @@
-from django.test import TestCase
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.core.cache import cache
+from django.db import connection
 from django.contrib.auth import get_user_model
 from django.urls import reverse
+from django.utils import timezone
+from datetime import timedelta
+from decimal import Decimal
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken, OutstandingToken
+import io
+import os
+import json
+import tempfile
+from django.core.files.uploadedfile import SimpleUploadedFile
+from unittest.mock import patch
+from django.core.management import call_command
+from PIL import Image
+from asgiref.sync import async_to_sync
 from rest_framework.test import APITestCase, APIClient
 from rest_framework import status
 from rest_framework_simplejwt.tokens import RefreshToken
-from .models import User, WorkerProfile
+from .models import User, WorkerProfile, WorkerImportJob
+from .importer import import_workers, read_rows, run_import_job
+from services.models import Service, ServiceCategory
 from .serializers import UserSerializer, WorkerProfileSerializer
+from channels.routing import URLRouter
+from asgiref.testing import ApplicationCommunicator
+from .authentication import VersionedRefreshToken, clear_local_snapshots, get_user_snapshot
+from .token_cleanup import delete_expired_tokens
+from .activity import flush_activity, get_activity_buffer, record_activity, reset_activity_buffer
+from .tasks import cleanup_expired_tokens, flush_user_activity
+from .presence import InMemoryPresence, connection_count, online_worker_ids, reset_presence, touch_connection
+from .avatars import current_thumbnails, update_avatar_thumbnails
+from .storage import digest_from_name
+from .blacklist import InMemoryBloomFilter, filter_size, rebuild_blacklist_filter, reset_blacklist_filter
+from .middleware import JWTAuthMiddlewareStack, CLOSE_UNAUTHENTICATED, CLOSE_FORBIDDEN
+from service_marketplace.routing import websocket_urlpatterns
 
 User = get_user_model()
 
@@ -218,3 +248,783 @@ class WorkerProfileAPITest(APITestCase):
         response = self.client.patch(url, data)
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertEqual(response.data['experience_years'], 3)
+
+class SnapshotAuthenticationTest(APITestCase):
+    def setUp(self):
+        self.client = APIClient()
+        cache.clear()
+        clear_local_snapshots()
+        
+        self.user = User.objects.create_user(
+            username='admin',
+            email='admin@example.com',
+            password='adminpass123',
+            role='admin'
+        )
+        self.refresh = VersionedRefreshToken.for_user(self.user)
+    
+    def authenticate(self, access):
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {access}')
+    
+    def test_access_token_claims(self):
+        access = self.refresh.access_token
+        self.assertEqual(access['role'], 'admin')
+        self.assertEqual(access['ver'], 1)
+    
+    def test_cached_snapshot_skips_user_table(self):
+        self.authenticate(self.refresh.access_token)
+        self.assertEqual(self.client.get(reverse('user-list')).status_code, status.HTTP_200_OK)
+        
+        clear_local_snapshots()
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('payment-list'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertFalse([q for q in queries.captured_queries if 'accounts_user' in q['sql']])
+    
+    def test_role_change_invalidates_tokens(self):
+        self.authenticate(self.refresh.access_token)
+        self.assertEqual(self.client.get(reverse('user-list')).status_code, status.HTTP_200_OK)
+        
+        self.user.role = 'client'
+        self.user.save()
+        self.assertEqual(self.user.auth_version, 2)
+        
+        response = self.client.get(reverse('user-list'))
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+        
+        self.client.credentials()
+        response = self.client.post(reverse('token_refresh'), {'refresh': str(self.refresh)})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        
+        self.authenticate(response.data['access'])
+        self.assertEqual(self.client.get(reverse('user-list')).status_code, status.HTTP_403_FORBIDDEN)
+    
+    def test_unrelated_changes_keep_version(self):
+        self.user.first_name = 'Alice'
+        self.user.save()
+        self.assertEqual(self.user.auth_version, 1)
+        
+        user = User.objects.get(pk=self.user.pk)
+        user.is_active = False
+        user.save(update_fields=['is_active'])
+        self.assertEqual(User.objects.get(pk=self.user.pk).auth_version, 2)
+        
+        self.authenticate(self.refresh.access_token)
+        self.assertEqual(self.client.get(reverse('user-list')).status_code, status.HTTP_401_UNAUTHORIZED)
+    
+    def test_tokens_without_version_claim_still_work(self):
+        self.authenticate(RefreshToken.for_user(self.user).access_token)
+        self.assertEqual(self.client.get(reverse('user-list')).status_code, status.HTTP_200_OK)
+
+async def websocket_connect(application, token=None, headers=None):
+    """
+    Handshake against the ASGI app directly (channels.testing needs daphne).
+    Returns the communicator and the accept/close message.
+    """
+    communicator = ApplicationCommunicator(application, {
+        'type': 'websocket',
+        'path': '/ws/notifications/',
+        'query_string': f'token={token}'.encode() if token else b'',
+        'headers': headers or [],
+        'subprotocols': [],
+    })
+    await communicator.send_input({'type': 'websocket.connect'})
+    return communicator, await communicator.receive_output(1)
+
+async def websocket_disconnect(communicator):
+    await communicator.send_input({'type': 'websocket.disconnect', 'code': 1000})
+    await communicator.wait(1)
+
+async def websocket_handshake(application, token=None, headers=None):
+    communicator, message = await websocket_connect(application, token, headers)
+    if message['type'] == 'websocket.accept':
+        await websocket_disconnect(communicator)
+    return message
+
+@override_settings(
+    CHANNEL_LAYERS={'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}},
+    WORKER_PRESENCE='memory'
+)
+class WebSocketJWTMiddlewareTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        clear_local_snapshots()
+        
+        self.user = User.objects.create_user(
+            username='client',
+            email='client@example.com',
+            password='clientpass123',
+            role='client'
+        )
+        self.access = str(VersionedRefreshToken.for_user(self.user).access_token)
+        self.application = JWTAuthMiddlewareStack(URLRouter(websocket_urlpatterns))
+    
+    @patch('accounts.middleware.is_cache_shared', return_value=True)
+    def test_valid_token_connects_without_queries(self, mock_shared):
+        async def handshake():
+            communicator, message = await websocket_connect(self.application, self.access)
+            greeting = await communicator.receive_output(1)
+            await websocket_disconnect(communicator)
+            return message, json.loads(greeting['text'])
+        
+        with self.assertNumQueries(0):
+            message, greeting = async_to_sync(handshake)()
+        self.assertEqual(message['type'], 'websocket.accept')
+        self.assertEqual(greeting['type'], 'connection_established')
+    
+    def test_claims_not_trusted_with_process_local_cache(self):
+        # The test settings use LocMemCache: another process's role change would go unseen
+        User.objects.filter(pk=self.user.pk).update(is_active=False, auth_version=2)
+        
+        with self.assertNumQueries(1):
+            message = async_to_sync(websocket_handshake)(self.application, self.access)
+        self.assertEqual(message, {'type': 'websocket.close', 'code': CLOSE_UNAUTHENTICATED})
+        
+        access = str(VersionedRefreshToken.for_user(User.objects.get(pk=self.user.pk)).access_token)
+        message = async_to_sync(websocket_handshake)(self.application, access)
+        self.assertEqual(message, {'type': 'websocket.close', 'code': CLOSE_FORBIDDEN})
+    
+    async def test_bad_tokens_rejected_before_consumer(self):
+        with patch('orders.consumers.NotificationConsumer.connect') as mock_connect:
+            for token in (None, 'not-a-token', self.access[:-2] + 'xx'):
+                message = await websocket_handshake(self.application, token)
+                self.assertEqual(message, {'type': 'websocket.close', 'code': CLOSE_UNAUTHENTICATED})
+        mock_connect.assert_not_called()
+    
+    async def test_header_token_accepted(self):
+        message = await websocket_handshake(
+            self.application, headers=[(b'authorization', f'Bearer {self.access}'.encode())]
+        )
+        self.assertEqual(message['type'], 'websocket.accept')
+    
+    def test_inactive_cached_snapshot_rejected(self):
+        self.user.is_active = False
+        self.user.save()
+        access = str(VersionedRefreshToken.for_user(self.user).access_token)
+        get_user_snapshot(self.user.id, self.user.auth_version)
+        
+        message = async_to_sync(websocket_handshake)(self.application, access)
+        self.assertEqual(message, {'type': 'websocket.close', 'code': CLOSE_FORBIDDEN})
+    
+    def test_deactivated_user_rejected_on_local_cache_miss(self):
+        self.user.is_active = False
+        self.user.save()
+        clear_local_snapshots()
+        
+        with self.assertNumQueries(0):
+            message = async_to_sync(websocket_handshake)(self.application, self.access)
+        self.assertEqual(message, {'type': 'websocket.close', 'code': CLOSE_UNAUTHENTICATED})
+    
+    def test_demoted_user_old_token_rejected(self):
+        self.user.role = 'worker'
+        self.user.save()
+        clear_local_snapshots()
+        
+        message = async_to_sync(websocket_handshake)(self.application, self.access)
+        self.assertEqual(message, {'type': 'websocket.close', 'code': CLOSE_UNAUTHENTICATED})
+        
+        access = str(VersionedRefreshToken.for_user(self.user).access_token)
+        message = async_to_sync(websocket_handshake)(self.application, access)
+        self.assertEqual(message['type'], 'websocket.accept')
+    
+    def test_tokens_without_version_claim_fall_back_to_database(self):
+        access = str(RefreshToken.for_user(self.user).access_token)
+        
+        message = async_to_sync(websocket_handshake)(self.application, access)
+        self.assertEqual(message['type'], 'websocket.accept')
+
+@override_settings(TOKEN_BLACKLIST_BLOOM='memory', TOKEN_BLACKLIST_BLOOM_CAPACITY=1000)
+class TokenBlacklistFilterTest(APITestCase):
+    def setUp(self):
+        self.client = APIClient()
+        cache.clear()
+        clear_local_snapshots()
+        reset_blacklist_filter()
+        
+        self.user = User.objects.create_user(
+            username='client',
+            email='client@example.com',
+            password='clientpass123',
+            role='client'
+        )
+    
+    def tearDown(self):
+        reset_blacklist_filter()
+    
+    def refresh(self, token):
+        return self.client.post(reverse('token_refresh'), {'refresh': str(token)})
+    
+    def blacklist_queries(self, queries):
+        # Lookups by jti, not the get_or_create done when the token is rotated
+        return [
+            q for q in queries.captured_queries
+            if 'token_blacklist_blacklistedtoken' in q['sql'] and '"jti" =' in q['sql']
+        ]
+    
+    def test_filter_has_no_false_negatives(self):
+        bits, hashes = filter_size(1000, 0.01)
+        self.assertEqual((bits, hashes), (9586, 7))
+        
+        bloom = InMemoryBloomFilter(bits, hashes)
+        self.assertIsNone(bloom.might_contain('anything'))
+        bloom.replace(f'jti-{i}' for i in range(1000))
+        
+        self.assertTrue(all(bloom.might_contain(f'jti-{i}') for i in range(1000)))
+        false_positives = sum(bool(bloom.might_contain(f'other-{i}')) for i in range(10000))
+        self.assertLess(false_positives, 300)
+    
+    def test_refresh_skips_blacklist_table_when_filter_built(self):
+        rebuild_blacklist_filter()
+        token = VersionedRefreshToken.for_user(self.user)
+        
+        with CaptureQueriesContext(connection) as queries:
+            response = self.refresh(token)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(self.blacklist_queries(queries)), 0)
+    
+    def test_rotated_token_rejected(self):
+        rebuild_blacklist_filter()
+        token = VersionedRefreshToken.for_user(self.user)
+        self.assertEqual(self.refresh(token).status_code, status.HTTP_200_OK)
+        
+        # Blacklisted on rotation: probable hit in the filter, confirmed in the database
+        with CaptureQueriesContext(connection) as queries:
+            response = self.refresh(token)
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+        self.assertEqual(len(self.blacklist_queries(queries)), 1)
+    
+    def test_unbuilt_filter_falls_back_to_database(self):
+        token = VersionedRefreshToken.for_user(self.user)
+        self.assertEqual(self.refresh(token).status_code, status.HTTP_200_OK)
+        self.assertEqual(self.refresh(token).status_code, status.HTTP_401_UNAUTHORIZED)
+        
+        rebuild_blacklist_filter()
+        self.assertEqual(self.refresh(token).status_code, status.HTTP_401_UNAUTHORIZED)
+
+class ExpiredTokenCleanupTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='client',
+            email='client@example.com',
+            password='clientpass123',
+            role='client'
+        )
+        
+        now = timezone.now()
+        tokens = []
+        for i in range(25):
+            expires_at = now - timedelta(days=1) if i % 5 else now + timedelta(days=1)
+            tokens.append(OutstandingToken(
+                user=self.user, jti=f'jti-{i}', token='token', created_at=now, expires_at=expires_at
+            ))
+        OutstandingToken.objects.bulk_create(tokens)
+        BlacklistedToken.objects.bulk_create([
+            BlacklistedToken(token=token) for token in OutstandingToken.objects.filter(jti__in=['jti-1', 'jti-2', 'jti-5'])
+        ])
+    
+    def test_deletes_expired_tokens_in_batches(self):
+        with CaptureQueriesContext(connection) as queries:
+            stats = delete_expired_tokens(batch_size=8, pause=0)
+        
+        self.assertEqual((stats.outstanding, stats.blacklisted, stats.batches), (20, 2, 3))
+        self.assertEqual(OutstandingToken.objects.count(), 5)
+        self.assertFalse(OutstandingToken.objects.filter(expires_at__lt=timezone.now()).exists())
+        self.assertEqual(list(BlacklistedToken.objects.values_list('token__jti', flat=True)), ['jti-5'])
+        
+        deletes = [q['sql'] for q in queries.captured_queries if q['sql'].startswith('DELETE')]
+        self.assertEqual(len(deletes), 6)
+    
+    def test_max_batches(self):
+        stats = delete_expired_tokens(batch_size=8, pause=0, max_batches=1)
+        self.assertEqual(stats.outstanding, 8)
+        self.assertEqual(OutstandingToken.objects.count(), 17)
+    
+    @override_settings(TOKEN_CLEANUP_PAUSE=0)
+    def test_cleanup_task(self):
+        self.assertEqual(cleanup_expired_tokens(), "Cleaned up 20 expired tokens")
+
+@override_settings(USER_ACTIVITY_BUFFER='memory', USER_ACTIVITY_FLUSH_INTERVAL=3600, USER_ACTIVITY_RESOLUTION=60)
+class UserActivityWriteBehindTest(APITestCase):
+    def setUp(self):
+        self.client = APIClient()
+        cache.clear()
+        clear_local_snapshots()
+        reset_activity_buffer()
+        
+        self.user = User.objects.create_user(
+            username='client',
+            email='client@example.com',
+            password='clientpass123',
+            role='client'
+        )
+    
+    def tearDown(self):
+        reset_activity_buffer()
+    
+    def user_writes(self, queries):
+        return [q for q in queries.captured_queries if q['sql'].startswith('UPDATE "accounts_user"')]
+    
+    def login(self):
+        return self.client.post(reverse('login'), {'username': 'client', 'password': 'clientpass123'})
+    
+    def test_logins_buffered_until_flush(self):
+        with CaptureQueriesContext(connection) as queries:
+            for _ in range(5):
+                self.assertEqual(self.login().status_code, status.HTTP_200_OK)
+        self.assertEqual(self.user_writes(queries), [])
+        self.assertIsNone(User.objects.get(pk=self.user.pk).last_login)
+        
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(flush_user_activity(), "Flushed activity for 1 users")
+        self.assertEqual(len(self.user_writes(queries)), 1)
+        self.assertIsNotNone(User.objects.get(pk=self.user.pk).last_login)
+    
+    def test_requests_recorded_once_per_resolution(self):
+        access = VersionedRefreshToken.for_user(self.user).access_token
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {access}')
+        for _ in range(3):
+            self.assertEqual(self.client.get(reverse('user-detail', args=[self.user.pk])).status_code, status.HTTP_200_OK)
+        
+        self.assertEqual(flush_activity(), 1)
+        self.assertIsNotNone(User.objects.get(pk=self.user.pk).last_activity)
+        self.assertEqual(flush_activity(), 0)
+    
+    def test_flush_does_not_touch_other_columns(self):
+        updated_at = User.objects.get(pk=self.user.pk).updated_at
+        record_activity(self.user.pk)
+        flush_activity()
+        
+        user = User.objects.get(pk=self.user.pk)
+        self.assertEqual(user.updated_at, updated_at)
+        self.assertEqual(user.auth_version, 1)
+    
+    @override_settings(USER_ACTIVITY_FLUSH_INTERVAL=0)
+    def test_inline_flush_errors_do_not_fail_requests(self):
+        access = VersionedRefreshToken.for_user(self.user).access_token
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {access}')
+        with patch.object(User.objects, 'bulk_update', side_effect=RuntimeError('database is locked')):
+            response = self.client.get(reverse('user-detail', args=[self.user.pk]))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        
+        # The failed batch was kept for the next flush
+        self.assertEqual(flush_activity(), 1)
+        self.assertIsNotNone(User.objects.get(pk=self.user.pk).last_activity)
+    
+    def test_failed_flush_keeps_newer_events(self):
+        record_activity(self.user.pk)
+        later = timezone.now() + timedelta(minutes=5)
+        
+        def record_then_fail(*args, **kwargs):
+            # Another request lands while the batch is being written
+            get_activity_buffer().record(self.user.pk, 'last_activity', later)
+            raise RuntimeError('database is locked')
+        
+        with patch.object(User.objects, 'bulk_update', side_effect=record_then_fail):
+            with self.assertRaises(RuntimeError):
+                flush_activity()
+        
+        self.assertEqual(flush_activity(), 1)
+        self.assertEqual(User.objects.get(pk=self.user.pk).last_activity, later)
+    
+    @patch('accounts.activity.atexit')
+    def test_memory_buffer_flushed_at_exit(self, mock_atexit):
+        reset_activity_buffer()
+        record_activity(self.user.pk)
+        mock_atexit.register.assert_called_once()
+        callback, database_name = mock_atexit.register.call_args.args
+        
+        with patch.dict(connection.settings_dict, NAME='other.sqlite3'):
+            callback(database_name)
+        self.assertIsNone(User.objects.get(pk=self.user.pk).last_activity)
+        
+        callback(database_name)
+        self.assertIsNotNone(User.objects.get(pk=self.user.pk).last_activity)
+        
+        reset_activity_buffer()
+        mock_atexit.unregister.assert_called_once_with(callback)
+    
+    @override_settings(USER_ACTIVITY_BUFFER='')
+    def test_write_through_without_buffer(self):
+        self.assertEqual(self.login().status_code, status.HTTP_200_OK)
+        self.assertIsNotNone(User.objects.get(pk=self.user.pk).last_login)
+
+class RegistrationPipelineTest(APITestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.register_url = reverse('register')
+        
+        self.user_data = {
+            'username': 'worker',
+            'email': 'Worker@Example.com',
+            'password': 'workerpass123',
+            'role': 'worker'
+        }
+    
+    @patch('accounts.serializers.send_welcome_email')
+    def test_worker_registration_single_insert_path(self, mock_email):
+        with CaptureQueriesContext(connection) as queries, self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(self.register_url, self.user_data)
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        
+        sql = [q['sql'] for q in queries.captured_queries]
+        self.assertFalse([q for q in sql if q.startswith('SELECT') and 'accounts_user' in q])
+        self.assertEqual(len([q for q in sql if q.startswith('INSERT INTO "accounts_user"')]), 1)
+        self.assertFalse([q for q in sql if q.startswith('UPDATE "accounts_user"')])
+        
+        user = User.objects.get(username='worker')
+        self.assertTrue(user.check_password('workerpass123'))
+        self.assertTrue(WorkerProfile.objects.filter(user=user).exists())
+        mock_email.delay.assert_called_once_with(user.id)
+    
+    @patch('accounts.serializers.send_welcome_email')
+    def test_profile_failure_rolls_back_user(self, mock_email):
+        with patch('accounts.serializers.WorkerProfile.objects.create', side_effect=RuntimeError('boom')):
+            with self.assertRaises(RuntimeError):
+                self.client.post(self.register_url, self.user_data)
+        self.assertFalse(User.objects.filter(username='worker').exists())
+        mock_email.delay.assert_not_called()
+    
+    def test_email_unique_case_insensitive(self):
+        User.objects.create_user(username='other', email='worker@example.com', password='otherpass123')
+        
+        response = self.client.post(self.register_url, self.user_data)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('email', response.data)
+        self.assertNotIn('username', response.data)
+    
+    def test_username_normalized_and_unique_case_insensitive(self):
+        User.objects.create_user(username='Worker', email='other@example.com', password='otherpass123')
+        
+        # Full-width letters normalize (NFKC) to 'worker'
+        for username in ['worker', '\uff57\uff4f\uff52\uff4b\uff45\uff52']:
+            response = self.client.post(self.register_url, dict(self.user_data, username=username))
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+            self.assertIn('username', response.data)
+            self.assertNotIn('email', response.data)
+        self.assertEqual(User.objects.count(), 1)
+    
+    def test_blank_emails_allowed(self):
+        User.objects.create_user(username='other', email='', password='otherpass123')
+        
+        data = dict(self.user_data, email='')
+        response = self.client.post(self.register_url, data)
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+    
+    def test_update_to_taken_username(self):
+        User.objects.create_user(username='other', email='other@example.com', password='otherpass123')
+        user = User.objects.create_user(username='worker', email='worker@example.com', password='workerpass123')
+        self.client.force_authenticate(user=user)
+        
+        response = self.client.patch(reverse('user-detail', args=[user.pk]), {'username': 'other'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('username', response.data)
+
+@override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+class WorkerImportTest(APITestCase):
+    def setUp(self):
+        self.client = APIClient()
+        
+        self.admin_user = User.objects.create_user(
+            username='admin',
+            email='admin@example.com',
+            password='adminpass123',
+            role='admin'
+        )
+        User.objects.create_user(username='taken', email='taken@example.com', password='takenpass123')
+        
+        self.category = ServiceCategory.objects.create(
+            name='Cleaning',
+            description='Cleaning services'
+        )
+        self.service = Service.objects.create(
+            name='House Cleaning',
+            description='Full house cleaning',
+            base_price=50.00,
+            category=self.category,
+            duration_hours=3
+        )
+        
+        self.csv = (
+            "username,email,password,first_name,experience_years,hourly_rate,specializations\n"
+            f"alice,alice@example.com,alicepass123,Alice,3,25.50,{self.service.id}\n"
+            "bob,BOB@example.com,bobpass123,Bob,,,\n"
+            "TAKEN,new@example.com,pass12345,,,,\n"
+            "carol,Taken@Example.com,pass12345,,,,\n"
+            "Alice,alice2@example.com,pass12345,,,,\n"
+            "dave,dave@example.com,,,-1,abc,999\n"
+        )
+    
+    def test_import_creates_users_profiles_and_specializations(self):
+        errors = []
+        result = import_workers(
+            read_rows(io.StringIO(self.csv)), batch_size=4, processes=1,
+            on_error=lambda line, row, row_errors: errors.append((line, row_errors))
+        )
+        
+        self.assertEqual(tuple(result), (6, 2, 4))
+        alice = User.objects.get(username='alice')
+        self.assertEqual(alice.role, 'worker')
+        self.assertTrue(alice.check_password('alicepass123'))
+        self.assertEqual(alice.worker_profile.hourly_rate, Decimal('25.50'))
+        self.assertEqual(list(alice.worker_profile.specializations.all()), [self.service])
+        self.assertEqual(User.objects.get(username='bob').email, 'BOB@example.com')
+        
+        by_line = dict(errors)
+        self.assertEqual(set(by_line), {4, 5, 6, 7})
+        self.assertIn('username', by_line[4])
+        self.assertIn('email', by_line[5])
+        self.assertIn('username', by_line[6])
+        self.assertEqual(set(by_line[7]), {'password', 'experience_years', 'hourly_rate', 'specializations'})
+    
+    def test_import_bulk_inserts_per_batch(self):
+        with CaptureQueriesContext(connection) as queries:
+            import_workers(read_rows(io.StringIO(self.csv)), batch_size=100, processes=1)
+        inserts = [q['sql'] for q in queries.captured_queries if q['sql'].startswith('INSERT')]
+        self.assertEqual(len(inserts), 3)
+    
+    def test_import_hashes_in_process_pool(self):
+        result = import_workers(read_rows(io.StringIO(self.csv)), processes=2)
+        self.assertEqual(result.created, 2)
+        self.assertTrue(User.objects.get(username='bob').check_password('bobpass123'))
+    
+    def test_missing_columns(self):
+        with self.assertRaises(ValueError):
+            list(read_rows(io.StringIO("username,email\nalice,alice@example.com\n")))
+    
+    @patch('accounts.views.import_workers_job')
+    def test_import_api_queues_job(self, mock_task):
+        with tempfile.TemporaryDirectory() as media, tempfile.TemporaryDirectory() as private, \
+                self.settings(MEDIA_ROOT=media, PRIVATE_MEDIA_ROOT=private):
+            self.client.force_authenticate(user=self.admin_user)
+            upload = SimpleUploadedFile('workers.csv', self.csv.encode(), content_type='text/csv')
+            response = self.client.post(reverse('worker-import'), {'file': upload}, format='multipart')
+            self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+            mock_task.delay.assert_called_once_with(response.data['id'])
+            
+            job = WorkerImportJob.objects.get(id=response.data['id'])
+            self.assertEqual(job.source.name, f'imports/workers/{job.id}.csv')
+            self.assertTrue(os.path.exists(os.path.join(private, job.source.name)))
+            self.assertEqual(os.listdir(media), [])
+            
+            job = run_import_job(job, processes=1)
+            self.assertFalse(os.path.exists(os.path.join(private, job.source.name)))
+            self.assertEqual(job.status, 'completed')
+            self.assertEqual((job.processed_count, job.created_count, job.error_count), (6, 2, 4))
+            self.assertEqual([error['line'] for error in job.errors], [4, 5, 6, 7])
+            self.assertNotIn('pass12345', json.dumps(job.errors))
+            
+            response = self.client.get(reverse('worker-import-job', args=[job.id]))
+            self.assertEqual(response.data['created_count'], 2)
+    
+    def test_import_api_admin_only(self):
+        self.client.force_authenticate(user=User.objects.get(username='taken'))
+        upload = SimpleUploadedFile('workers.csv', self.csv.encode(), content_type='text/csv')
+        response = self.client.post(reverse('worker-import'), {'file': upload}, format='multipart')
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+class AvatarStorageTest(APITestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.media_root = tempfile.TemporaryDirectory()
+        self.media_override = override_settings(MEDIA_ROOT=self.media_root.name)
+        self.media_override.enable()
+        
+        self.user = User.objects.create_user(
+            username='client',
+            email='client@example.com',
+            password='clientpass123',
+            role='client'
+        )
+        self.other_user = User.objects.create_user(
+            username='other',
+            email='other@example.com',
+            password='otherpass123',
+            role='client'
+        )
+    
+    def tearDown(self):
+        self.media_override.disable()
+        self.media_root.cleanup()
+    
+    def image_file(self, name='avatar.png', color='red', size=(600, 400)):
+        output = io.BytesIO()
+        Image.new('RGB', size, color).save(output, format='PNG')
+        return SimpleUploadedFile(name, output.getvalue(), content_type='image/png')
+    
+    def upload(self, user, image):
+        self.client.force_authenticate(user=user)
+        return self.client.patch(reverse('user-detail', args=[user.pk]), {'avatar': image}, format='multipart')
+    
+    def avatar_files(self):
+        return [
+            os.path.join(directory, name)
+            for directory, _, names in os.walk(os.path.join(self.media_root.name, 'avatars'))
+            for name in names
+        ]
+    
+    @patch('accounts.tasks.generate_avatar_thumbnails.delay')
+    def test_identical_uploads_share_one_file(self, mock_delay):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.upload(self.user, self.image_file('first.png'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        mock_delay.assert_called_once_with(self.user.pk)
+        
+        with self.captureOnCommitCallbacks(execute=True):
+            self.upload(self.other_user, self.image_file('Снимок экрана.PNG'))
+        
+        self.user.refresh_from_db()
+        self.other_user.refresh_from_db()
+        digest = digest_from_name(self.user.avatar.name)
+        self.assertIsNotNone(digest)
+        self.assertEqual(self.user.avatar.name, f'avatars/{digest[:2]}/{digest[2:4]}/{digest}.png')
+        self.assertEqual(self.other_user.avatar.name, self.user.avatar.name)
+        self.assertEqual(len(self.avatar_files()), 1)
+    
+    @patch('accounts.tasks.generate_avatar_thumbnails.delay')
+    def test_thumbnails_rendered_and_exposed(self, mock_delay):
+        self.upload(self.user, self.image_file())
+        self.assertEqual(UserSerializer(User.objects.get(pk=self.user.pk)).data['avatar_thumbnails'], {})
+        
+        thumbnails = update_avatar_thumbnails(self.user.pk)
+        self.assertEqual(set(thumbnails), {'small', 'medium'})
+        user = User.objects.get(pk=self.user.pk)
+        with Image.open(os.path.join(self.media_root.name, user.avatar_thumbnails['small'])) as small:
+            self.assertEqual((small.format, small.size), ('WEBP', (64, 64)))
+        
+        data = self.client.get(reverse('user-detail', args=[self.user.pk])).data
+        self.assertTrue(data['avatar_thumbnails']['small'].startswith('http://testserver/media/avatars/thumbs/64/'))
+        
+        # A new avatar hides the old thumbnails until its own are rendered
+        self.upload(self.user, self.image_file(color='blue'))
+        self.assertEqual(current_thumbnails(User.objects.get(pk=self.user.pk)), {})
+    
+    def test_migrate_avatars_command(self):
+        for name in ['photo.png', 'photo_qZgQGIt.png', 'orphan_Xy12AbC.png']:
+            path = os.path.join(self.media_root.name, 'avatars', name)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, 'wb') as output:
+                output.write(self.image_file().read())
+        User.objects.filter(pk=self.user.pk).update(avatar='avatars/photo.png')
+        User.objects.filter(pk=self.other_user.pk).update(avatar='avatars/photo_qZgQGIt.png')
+        
+        call_command('migrate_avatars', sync=True, delete_legacy=True, stdout=io.StringIO())
+        
+        self.user.refresh_from_db()
+        self.other_user.refresh_from_db()
+        self.assertEqual(self.user.avatar.name, self.other_user.avatar.name)
+        self.assertIsNotNone(digest_from_name(self.user.avatar.name))
+        self.assertEqual(set(self.user.avatar_thumbnails), {'small', 'medium'})
+        originals = [path for path in self.avatar_files() if '/thumbs/' not in path]
+        self.assertEqual(len(originals), 1)
+
+@override_settings(
+    CHANNEL_LAYERS={'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}},
+    WORKER_PRESENCE='memory',
+    WORKER_PRESENCE_TTL=60
+)
+class WorkerPresenceTest(APITestCase):
+    def setUp(self):
+        self.client = APIClient()
+        cache.clear()
+        clear_local_snapshots()
+        reset_presence()
+        
+        self.category = ServiceCategory.objects.create(
+            name='Cleaning',
+            description='Cleaning services'
+        )
+        self.service = Service.objects.create(
+            name='Window Cleaning',
+            description='Windows',
+            base_price=Decimal('50.00'),
+            category=self.category,
+            duration_hours=2
+        )
+        self.other_service = Service.objects.create(
+            name='Carpet Cleaning',
+            description='Carpets',
+            base_price=Decimal('80.00'),
+            category=self.category,
+            duration_hours=3
+        )
+        
+        self.worker = User.objects.create_user(
+            username='worker',
+            email='worker@example.com',
+            password='workerpass123',
+            role='worker'
+        )
+        profile = WorkerProfile.objects.create(user=self.worker)
+        profile.specializations.add(self.service)
+        
+        self.access = str(VersionedRefreshToken.for_user(self.worker).access_token)
+        self.application = JWTAuthMiddlewareStack(URLRouter(websocket_urlpatterns))
+    
+    def tearDown(self):
+        reset_presence()
+    
+    def test_connections_maintain_presence(self):
+        async def two_devices():
+            first, _ = await websocket_connect(self.application, self.access)
+            await first.receive_output(1)
+            second, _ = await websocket_connect(self.application, self.access)
+            await second.receive_output(1)
+            connected = (online_worker_ids(self.service.id), connection_count(self.worker.id))
+            
+            await websocket_disconnect(first)
+            one_left = (online_worker_ids(self.service.id), connection_count(self.worker.id))
+            
+            await websocket_disconnect(second)
+            return connected, one_left, (online_worker_ids(self.service.id), connection_count(self.worker.id))
+        
+        connected, one_left, gone = async_to_sync(two_devices)()
+        self.assertEqual(connected, ([self.worker.id], 2))
+        self.assertEqual(one_left, ([self.worker.id], 1))
+        self.assertEqual(gone, ([], 0))
+    
+    def test_entries_expire_without_heartbeat(self):
+        presence = InMemoryPresence()
+        with patch('accounts.presence.time.time', return_value=1000.0):
+            presence.touch(self.worker.id, 'channel-1', ['all', str(self.service.id)], ttl=60)
+        
+        with patch('accounts.presence.time.time', return_value=1059.0):
+            self.assertEqual(presence.online(str(self.service.id)), [self.worker.id])
+            presence.touch(self.worker.id, 'channel-1', ['all', str(self.service.id)], ttl=60)
+        with patch('accounts.presence.time.time', return_value=1100.0):
+            self.assertEqual(presence.online(str(self.service.id)), [self.worker.id])
+        with patch('accounts.presence.time.time', return_value=1120.0):
+            self.assertEqual(presence.online(str(self.service.id)), [])
+            self.assertEqual(presence.connection_count(self.worker.id), 0)
+            self.assertEqual(presence.prune(), 3)
+    
+    @override_settings(WORKER_PRESENCE_REFRESH_INTERVAL=0)
+    def test_ping_refreshes_presence(self):
+        async def ping():
+            communicator, _ = await websocket_connect(self.application, self.access)
+            await communicator.receive_output(1)
+            with patch('orders.consumers.touch_connection') as mock_touch:
+                await communicator.send_input({'type': 'websocket.receive', 'text': json.dumps({'type': 'ping'})})
+                pong = await communicator.receive_output(1)
+            await websocket_disconnect(communicator)
+            return pong, mock_touch.call_count
+        
+        pong, touches = async_to_sync(ping)()
+        self.assertEqual(json.loads(pong['text'])['type'], 'pong')
+        self.assertEqual(touches, 1)
+    
+    def test_online_workers_api(self):
+        touch_connection(self.worker.id, 'channel-1', ['all', str(self.service.id)])
+        self.client.force_authenticate(user=self.worker)
+        
+        response = self.client.get(reverse('online-workers'), {'service': self.service.id})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data, {'service': self.service.id, 'count': 1, 'workers': [self.worker.id]})
+        
+        response = self.client.get(reverse('online-workers'), {'service': self.other_service.id})
+        self.assertEqual(response.data['workers'], [])
+        
+        response = self.client.get(reverse('online-workers'))
+        self.assertEqual(response.data['count'], 1)
+        
+        response = self.client.get(reverse('online-workers'), {'service': 'x'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
@@ -1,6 +1,9 @@
 from django.urls import path
 from rest_framework_simplejwt.views import TokenRefreshView
-from .views import RegisterView, LoginView, UserListView, UserDetailView, WorkerProfileView
+from .views import (
+    RegisterView, LoginView, UserListView, UserDetailView, WorkerProfileView, WorkerImportView, WorkerImportJobView,
+    OnlineWorkersView
+)
 
 urlpatterns = [
     path('register/', RegisterView.as_view(), name='register'),
@@ -9,4 +12,7 @@ urlpatterns = [
     path('users/', UserListView.as_view(), name='user-list'),
     path('users/<int:pk>/', UserDetailView.as_view(), name='user-detail'),
     path('worker-profile/', WorkerProfileView.as_view(), name='worker-profile'),
+    path('workers/import/', WorkerImportView.as_view(), name='worker-import'),
+    path('workers/online/', OnlineWorkersView.as_view(), name='online-workers'),
+    path('workers/import/<uuid:pk>/', WorkerImportJobView.as_view(), name='worker-import-job'),
 ]
\ No newline at end of file
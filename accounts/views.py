@@ -1,9 +1,17 @@
 from rest_framework import generics, status, permissions
+from rest_framework.parsers import MultiPartParser
 from rest_framework.response import Response
-from rest_framework_simplejwt.tokens import RefreshToken
+from rest_framework.views import APIView
+from .activity import record_login
+from .authentication import VersionedRefreshToken
 from drf_spectacular.utils import extend_schema, extend_schema_view
-from .models import User, WorkerProfile
-from .serializers import UserSerializer, WorkerProfileSerializer, LoginSerializer
+from .importer import create_import_job
+from .models import User, WorkerProfile, WorkerImportJob
+from .presence import count_online_workers, online_worker_ids
+from .serializers import (
+    UserSerializer, WorkerProfileSerializer, LoginSerializer, WorkerImportSerializer, WorkerImportJobSerializer
+)
+from .tasks import import_workers_job
 from .permissions import IsAdmin, IsOwnerOrAdmin
 
 @extend_schema(
@@ -29,7 +37,8 @@ class LoginView(generics.GenericAPIView):
         serializer = self.get_serializer(data=request.data)
         if serializer.is_valid():
             user = serializer.validated_data['user']
-            refresh = RefreshToken.for_user(user)
+            record_login(user)
+            refresh = VersionedRefreshToken.for_user(user)
             return Response({
                 'refresh': str(refresh),
                 'access': str(refresh.access_token),
@@ -97,4 +106,63 @@ class WorkerProfileView(generics.RetrieveUpdateAPIView):
             raise PermissionDenied("Only workers can access worker profiles")
         
         profile, created = WorkerProfile.objects.get_or_create(user=self.request.user)
-        return profile
\ No newline at end of file
+        return profile
+
+@extend_schema(
+    summary="Import workers from CSV",
+    description="Queue a bulk import of workers (admin only). Columns: username, password, email, first_name, "
+                "last_name, phone, experience_years, hourly_rate, bio, specializations (service ids separated by ';')",
+    tags=["Workers"]
+)
+class WorkerImportView(APIView):
+    """
+    Queue a worker import. Progress is polled from WorkerImportJobView.
+    """
+    permission_classes = [IsAdmin]
+    parser_classes = [MultiPartParser]
+    
+    def post(self, request):
+        serializer = WorkerImportSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        
+        job = create_import_job(serializer.validated_data['file'], requested_by=request.user)
+        import_workers_job.delay(str(job.id))
+        
+        return Response(WorkerImportJobSerializer(job).data, status=status.HTTP_202_ACCEPTED)
+
+@extend_schema(
+    summary="Get worker import progress",
+    tags=["Workers"]
+)
+class WorkerImportJobView(generics.RetrieveAPIView):
+    serializer_class = WorkerImportJobSerializer
+    permission_classes = [IsAdmin]
+    queryset = WorkerImportJob.objects.all()
+
+@extend_schema(
+    summary="List online workers",
+    description="Ids of workers with a live WebSocket connection, optionally for one service (?service=<id>). "
+                "At most ?limit= ids are returned (default 100), count covers all of them.",
+    tags=["Workers"]
+)
+class OnlineWorkersView(APIView):
+    permission_classes = [permissions.IsAuthenticated]
+    MAX_LIMIT = 1000
+    
+    def get(self, request):
+        try:
+            service_id = int(request.query_params['service']) if request.query_params.get('service') else None
+            limit = min(int(request.query_params.get('limit', 100)), self.MAX_LIMIT)
+            if limit < 1:
+                raise ValueError
+        except ValueError:
+            return Response({'error': 'service and limit must be positive integers'},
+                          status=status.HTTP_400_BAD_REQUEST)
+        
+        worker_ids = online_worker_ids(service_id, limit)
+        count = count_online_workers(service_id)
+        if worker_ids is None or count is None:
+            return Response({'error': 'Presence registry unavailable'}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+        
+        return Response({'service': service_id, 'count': count, 'workers': worker_ids})
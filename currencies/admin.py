@@ -0,0 +1,7 @@
+from django.contrib import admin
+from .models import ExchangeRate
+
+@admin.register(ExchangeRate)
+class ExchangeRateAdmin(admin.ModelAdmin):
+    list_display = ['currency', 'rate', 'source', 'updated_at']
+    readonly_fields = ['updated_at']
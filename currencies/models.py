@@ -0,0 +1,25 @@
+from django.db import models
+
+CURRENCY_CHOICES = [
+    ('USD', 'US Dollar'),
+    ('UZS', 'Uzbekistani Som'),
+    ('EUR', 'Euro'),
+    ('RUB', 'Russian Ruble'),
+]
+
+
+class ExchangeRate(models.Model):
+    """
+    Units of `currency` per one unit of FX_BASE_CURRENCY.
+    Read through currencies.rates, never directly on the request path.
+    """
+    currency = models.CharField(max_length=3, choices=CURRENCY_CHOICES, unique=True)
+    rate = models.DecimalField(max_digits=20, decimal_places=8)
+    source = models.CharField(max_length=50, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['currency']
+
+    def __str__(self):
+        return f"1 base = {self.rate} {self.currency}"
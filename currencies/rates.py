@@ -0,0 +1,131 @@
+"""
+In-process FX rate cache. The first lookup in a process loads the ExchangeRate table
+synchronously; after that lookups only read a dict, and when the cached table is older than
+FX_CACHE_TTL it keeps being served while a background thread reloads it.
+"""
+import json
+import threading
+import time
+import urllib.request
+from decimal import Decimal
+from django.conf import settings
+from django.db import connection
+
+CENTS = Decimal('0.01')
+
+
+class UnknownCurrencyError(KeyError):
+    pass
+
+
+_cache = {'rates': None, 'loaded_at': None}
+_lock = threading.Lock()
+_refreshing = threading.Event()
+
+
+def get_base_currency():
+    return settings.FX_BASE_CURRENCY
+
+
+def fallback_rates():
+    rates = {currency: Decimal(str(rate)) for currency, rate in settings.FX_FALLBACK_RATES.items()}
+    rates[get_base_currency()] = Decimal('1')
+    return rates
+
+
+def load_rates():
+    """
+    Reload the cache from the database. Called by the refresh task and the background refresher.
+    """
+    from .models import ExchangeRate
+
+    rates = fallback_rates()
+    rates.update(dict(ExchangeRate.objects.values_list('currency', 'rate')))
+    rates[get_base_currency()] = Decimal('1')
+    with _lock:
+        _cache['rates'] = rates
+        _cache['loaded_at'] = time.monotonic()
+    return rates
+
+
+def _background_load():
+    try:
+        load_rates()
+    except Exception:
+        # Keep serving the previous table, the next lookup past the TTL tries again
+        pass
+    finally:
+        connection.close()
+        _refreshing.clear()
+
+
+def _schedule_refresh():
+    if not settings.FX_BACKGROUND_REFRESH:
+        load_rates()
+        return
+    with _lock:
+        if _refreshing.is_set():
+            return
+        _refreshing.set()
+    threading.Thread(target=_background_load, name='fx-rate-refresh', daemon=True).start()
+
+
+def get_rates():
+    rates, loaded_at = _cache['rates'], _cache['loaded_at']
+    if rates is None:
+        # Nothing loaded yet in this process: never price against the configured defaults alone
+        return load_rates()
+    if time.monotonic() - loaded_at > settings.FX_CACHE_TTL:
+        _schedule_refresh()
+        rates = _cache['rates']
+    return rates
+
+
+def clear_cache():
+    with _lock:
+        _cache['rates'] = None
+        _cache['loaded_at'] = None
+
+
+def get_rate(currency):
+    if currency == get_base_currency():
+        return Decimal('1')
+    try:
+        return get_rates()[currency]
+    except KeyError:
+        raise UnknownCurrencyError(currency)
+
+
+def cross_rate(from_currency, to_currency):
+    """
+    Units of to_currency per unit of from_currency
+    """
+    if from_currency == to_currency:
+        return Decimal('1')
+    return get_rate(to_currency) / get_rate(from_currency)
+
+
+def convert(amount, from_currency, to_currency):
+    amount = Decimal(str(amount))
+    if from_currency == to_currency:
+        return amount.quantize(CENTS)
+    return (amount * cross_rate(from_currency, to_currency)).quantize(CENTS)
+
+
+def to_base(amount, currency):
+    return convert(amount, currency, get_base_currency())
+
+
+def fetch_provider_rates(url, timeout=10):
+    """
+    Fetch {"base": "USD", "rates": {"UZS": 12650.0, ...}} from an FX provider.
+    Rates are rebased onto FX_BASE_CURRENCY if the provider uses another base.
+    """
+    with urllib.request.urlopen(url, timeout=timeout) as response:
+        payload = json.loads(response.read())
+
+    rates = {currency: Decimal(str(rate)) for currency, rate in payload['rates'].items()}
+    provider_base = payload.get('base', get_base_currency())
+    rates[provider_base] = Decimal('1')
+    base_rate = rates[get_base_currency()]
+    return {currency: (rate / base_rate).quantize(Decimal('0.00000001')) for currency, rate in rates.items()}
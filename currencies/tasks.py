@@ -0,0 +1,36 @@
+from celery import shared_task
+from django.conf import settings
+from django.db import transaction
+from .models import ExchangeRate, CURRENCY_CHOICES
+from .rates import fetch_provider_rates, load_rates
+import logging
+
+logger = logging.getLogger(__name__)
+
+@shared_task
+def refresh_exchange_rates():
+    """
+    Pull rates from FX_RATES_URL (if configured) into ExchangeRate and reload this worker's cache.
+    Web processes pick the new table up within FX_CACHE_TTL.
+    """
+    try:
+        updated = 0
+        if settings.FX_RATES_URL:
+            supported = {code for code, name in CURRENCY_CHOICES}
+            rates = fetch_provider_rates(settings.FX_RATES_URL)
+            with transaction.atomic():
+                for currency, rate in rates.items():
+                    if currency in supported and currency != settings.FX_BASE_CURRENCY:
+                        ExchangeRate.objects.update_or_create(
+                            currency=currency,
+                            defaults={'rate': rate, 'source': 'provider'}
+                        )
+                        updated += 1
+        
+        load_rates()
+        logger.info(f"Refreshed {updated} exchange rates")
+        return f"Refreshed {updated} exchange rates"
+    
+    except Exception as e:
+        logger.error(f"Error refreshing exchange rates: {e}")
+        return f"Error: {e}"
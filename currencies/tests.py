@@ -0,0 +1,163 @@
+import json
+from decimal import Decimal
+from unittest.mock import patch, MagicMock
+from django.test import TestCase, override_settings
+from django.contrib.auth import get_user_model
+from django.utils import timezone
+from .models import ExchangeRate
+from .rates import (
+    get_rate, get_rates, load_rates, clear_cache, convert, to_base, fetch_provider_rates, UnknownCurrencyError
+)
+from .tasks import refresh_exchange_rates
+from orders.models import Order
+from payments.models import Payment
+from payments.reporting import refresh_daily_rollup, summarize
+from services.models import Service, ServiceCategory
+
+User = get_user_model()
+
+@override_settings(FX_BACKGROUND_REFRESH=False, FX_CACHE_TTL=300)
+class ExchangeRateCacheTest(TestCase):
+    def setUp(self):
+        clear_cache()
+
+    def tearDown(self):
+        clear_cache()
+
+    def test_fallback_then_database_rates(self):
+        ExchangeRate.objects.create(currency='UZS', rate=Decimal('12500'))
+
+        self.assertEqual(get_rate('UZS'), Decimal('12500'))
+        self.assertEqual(get_rate('EUR'), Decimal('0.92'))
+        self.assertEqual(get_rate('USD'), Decimal('1'))
+        with self.assertRaises(UnknownCurrencyError):
+            get_rate('GBP')
+
+    def test_fresh_cache_never_queries(self):
+        load_rates()
+        with self.assertNumQueries(0):
+            for _ in range(100):
+                get_rate('UZS')
+
+    @override_settings(FX_BACKGROUND_REFRESH=True, FX_CACHE_TTL=0)
+    @patch('currencies.rates.threading.Thread')
+    def test_stale_cache_refreshes_in_background(self, mock_thread):
+        ExchangeRate.objects.create(currency='UZS', rate=Decimal('12500'))
+        load_rates()
+        with self.assertNumQueries(0):
+            self.assertEqual(get_rate('UZS'), Decimal('12500'))
+            get_rate('UZS')
+
+        # Only one refresh in flight at a time
+        mock_thread.assert_called_once()
+        mock_thread.return_value.start.assert_called_once()
+
+    @override_settings(FX_BACKGROUND_REFRESH=True)
+    @patch('currencies.rates.threading.Thread')
+    def test_cold_cache_loads_synchronously(self, mock_thread):
+        ExchangeRate.objects.create(currency='UZS', rate=Decimal('12500'))
+
+        with self.assertNumQueries(1):
+            self.assertEqual(get_rate('UZS'), Decimal('12500'))
+        mock_thread.assert_not_called()
+
+    def test_conversion(self):
+        ExchangeRate.objects.create(currency='UZS', rate=Decimal('12500'))
+        ExchangeRate.objects.create(currency='EUR', rate=Decimal('0.8'))
+        load_rates()
+
+        self.assertEqual(convert(Decimal('100'), 'USD', 'UZS'), Decimal('1250000.00'))
+        self.assertEqual(to_base(Decimal('1250000'), 'UZS'), Decimal('100.00'))
+        self.assertEqual(convert(Decimal('80'), 'EUR', 'UZS'), Decimal('1250000.00'))
+        self.assertEqual(convert(Decimal('10.005'), 'USD', 'USD'), Decimal('10.00'))
+
+    @patch('currencies.rates.urllib.request.urlopen')
+    def test_fetch_provider_rates_rebases(self, mock_urlopen):
+        response = MagicMock()
+        response.read.return_value = json.dumps({'base': 'EUR', 'rates': {'USD': 1.25, 'UZS': 15625}}).encode()
+        mock_urlopen.return_value.__enter__.return_value = response
+
+        rates = fetch_provider_rates('http://fx.example.com/latest')
+        self.assertEqual(rates['USD'], Decimal('1'))
+        self.assertEqual(rates['UZS'], Decimal('12500'))
+        self.assertEqual(rates['EUR'], Decimal('0.8'))
+
+    @override_settings(FX_RATES_URL='http://fx.example.com/latest')
+    @patch('currencies.tasks.fetch_provider_rates')
+    def test_refresh_task_updates_table_and_cache(self, mock_fetch):
+        mock_fetch.return_value = {'USD': Decimal('1'), 'UZS': Decimal('12800'), 'GBP': Decimal('0.79')}
+
+        result = refresh_exchange_rates()
+        self.assertEqual(result, "Refreshed 1 exchange rates")
+        self.assertEqual(ExchangeRate.objects.get(currency='UZS').rate, Decimal('12800'))
+        self.assertFalse(ExchangeRate.objects.filter(currency='GBP').exists())
+        with self.assertNumQueries(0):
+            self.assertEqual(get_rate('UZS'), Decimal('12800'))
+
+@override_settings(FX_BACKGROUND_REFRESH=False)
+class MultiCurrencyPricingTest(TestCase):
+    def setUp(self):
+        clear_cache()
+        ExchangeRate.objects.create(currency='UZS', rate=Decimal('12500'))
+        load_rates()
+
+        self.client_user = User.objects.create_user(
+            username='client',
+            email='client@example.com',
+            password='clientpass123',
+            role='client'
+        )
+
+        self.category = ServiceCategory.objects.create(
+            name='Web Development',
+            description='All web development services'
+        )
+
+        self.service = Service.objects.create(
+            name='WordPress Website',
+            description='Custom WordPress development',
+            base_price=100.00,
+            category=self.category,
+            duration_hours=40
+        )
+
+    def tearDown(self):
+        clear_cache()
+
+    def create_order(self, currency=''):
+        return Order.objects.create(
+            client=self.client_user,
+            service=self.service,
+            description='Need a business website',
+            address='123 Main St',
+            scheduled_date=timezone.now(),
+            quantity=2,
+            currency=currency
+        )
+
+    def test_order_priced_in_requested_currency(self):
+        order = self.create_order('UZS')
+        self.assertEqual(order.total_price, Decimal('2500000.00'))
+        self.assertEqual(order.fx_rate, Decimal('12500'))
+
+        order = self.create_order()
+        self.assertEqual(order.currency, 'USD')
+        self.assertEqual(order.total_price, Decimal('200.00'))
+
+    def test_rollups_normalized_to_base_currency(self):
+        for currency in ('UZS', 'USD'):
+            order = self.create_order(currency)
+            Payment.objects.create(
+                order=order,
+                user=self.client_user,
+                amount=order.total_price,
+                currency=currency,
+                payment_method='card',
+                status='completed'
+            )
+
+        rollups = refresh_daily_rollup(timezone.now().date())
+        by_currency = {rollup.currency: rollup for rollup in rollups}
+        self.assertEqual(by_currency['UZS'].total_amount, Decimal('2500000.00'))
+        self.assertEqual(by_currency['UZS'].total_amount_base, Decimal('200.00'))
+        self.assertEqual(summarize(rollups)['total_amount'], Decimal('400.00'))
@@ -0,0 +1,30 @@
+from django.contrib import admin
+from .models import LedgerAccount, LedgerEntry, LedgerBalanceSnapshot
+
+@admin.register(LedgerAccount)
+class LedgerAccountAdmin(admin.ModelAdmin):
+    list_display = ['code', 'account_type', 'balance', 'entry_count']
+    list_filter = ['account_type']
+    search_fields = ['code']
+    readonly_fields = ['balance', 'entry_count', 'created_at']
+
+@admin.register(LedgerEntry)
+class LedgerEntryAdmin(admin.ModelAdmin):
+    list_display = ['id', 'transaction_id', 'account', 'entry_type', 'amount', 'currency', 'created_at']
+    list_filter = ['entry_type', 'currency', 'created_at']
+    search_fields = ['transaction_id', 'account__code', 'payment__id']
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+@admin.register(LedgerBalanceSnapshot)
+class LedgerBalanceSnapshotAdmin(admin.ModelAdmin):
+    list_display = ['account', 'entry', 'balance', 'created_at']
+    search_fields = ['account__code']
+    readonly_fields = ['account', 'entry', 'balance', 'created_at']
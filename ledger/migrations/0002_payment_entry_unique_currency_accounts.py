@@ -0,0 +1,62 @@
+# Generated by Django 5.2.5 on 2026-10-19 03:37
+
+from decimal import Decimal
+from django.conf import settings
+from django.db import migrations, models
+
+
+def split_accounts_by_currency(apps, schema_editor):
+    """
+    Move entries to one account per currency (code + ':' + currency), then recompute the
+    running balances and snapshots of the accounts that were split
+    """
+    LedgerAccount = apps.get_model('ledger', 'LedgerAccount')
+    LedgerEntry = apps.get_model('ledger', 'LedgerEntry')
+    LedgerBalanceSnapshot = apps.get_model('ledger', 'LedgerBalanceSnapshot')
+    interval = getattr(settings, 'LEDGER_SNAPSHOT_INTERVAL', 100)
+
+    for account in list(LedgerAccount.objects.all()):
+        currencies = list(
+            LedgerEntry.objects.filter(account=account).order_by('currency')
+            .values_list('currency', flat=True).distinct()
+        )
+        if not currencies:
+            account.delete()
+            continue
+        if len(currencies) == 1:
+            account.code = f'{account.code}:{currencies[0]}'
+            account.save(update_fields=['code'])
+            continue
+
+        LedgerBalanceSnapshot.objects.filter(account=account).delete()
+        for currency in currencies:
+            target = LedgerAccount.objects.create(code=f'{account.code}:{currency}', account_type=account.account_type)
+            LedgerEntry.objects.filter(account=account, currency=currency).update(account=target)
+
+            balance = Decimal('0.00')
+            count = 0
+            for entry in LedgerEntry.objects.filter(account=target).order_by('id').iterator():
+                balance += entry.amount
+                count += 1
+                if count % interval == 0:
+                    LedgerBalanceSnapshot.objects.create(account=target, entry=entry, balance=balance)
+            target.balance = balance
+            target.entry_count = count
+            target.save(update_fields=['balance', 'entry_count'])
+        account.delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ledger', '0001_initial'),
+        ('payments', '0014_rollup_state'),
+    ]
+
+    operations = [
+        migrations.RunPython(split_accounts_by_currency, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='ledgerentry',
+            constraint=models.UniqueConstraint(fields=('payment', 'entry_type', 'account'), name='unique_ledger_payment_entry'),
+        ),
+    ]
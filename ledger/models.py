@@ -0,0 +1,96 @@
+from django.db import models
+import uuid
+
+
+class ImmutableLedgerError(Exception):
+    pass
+
+
+class LedgerEntryQuerySet(models.QuerySet):
+    def update(self, **kwargs):
+        raise ImmutableLedgerError("Ledger entries are append-only")
+
+    def delete(self):
+        raise ImmutableLedgerError("Ledger entries are append-only")
+
+
+class LedgerAccount(models.Model):
+    ACCOUNT_TYPE_CHOICES = [
+        ('asset', 'Asset'),
+        ('liability', 'Liability'),
+        ('expense', 'Expense'),
+    ]
+
+    code = models.CharField(max_length=100, unique=True)
+    account_type = models.CharField(max_length=10, choices=ACCOUNT_TYPE_CHOICES)
+
+    # Running totals, only changed while the row is locked by posting.post_transaction
+    balance = models.DecimalField(max_digits=16, decimal_places=2, default=0)
+    entry_count = models.PositiveIntegerField(default=0)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.code} ({self.balance})"
+
+
+class LedgerEntry(models.Model):
+    ENTRY_TYPE_CHOICES = [
+        ('charge', 'Charge'),
+        ('fee', 'Gateway Fee'),
+        ('refund', 'Refund'),
+        ('payout', 'Worker Payout'),
+    ]
+
+    transaction_id = models.UUIDField(default=uuid.uuid4, db_index=True)
+    account = models.ForeignKey(LedgerAccount, on_delete=models.PROTECT, related_name='entries')
+    entry_type = models.CharField(max_length=10, choices=ENTRY_TYPE_CHOICES)
+
+    # Debits are positive, credits negative; entries of one transaction sum to zero
+    amount = models.DecimalField(max_digits=16, decimal_places=2)
+    currency = models.CharField(max_length=3, default='USD')
+
+    payment = models.ForeignKey('payments.Payment', on_delete=models.PROTECT,
+                                null=True, blank=True, related_name='ledger_entries')
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    objects = LedgerEntryQuerySet.as_manager()
+
+    class Meta:
+        ordering = ['id']
+        verbose_name_plural = "Ledger entries"
+        indexes = [
+            models.Index(fields=['account', 'id'], name='ledger_entry_account_idx'),
+        ]
+        constraints = [
+            # A payment is charged, refunded or paid out once
+            models.UniqueConstraint(fields=['payment', 'entry_type', 'account'], name='unique_ledger_payment_entry'),
+        ]
+
+    def __str__(self):
+        return f"{self.entry_type} {self.account.code} {self.amount}"
+
+    def save(self, *args, **kwargs):
+        if self.pk is not None:
+            raise ImmutableLedgerError("Ledger entries are append-only")
+        super().save(*args, **kwargs)
+
+    def delete(self, *args, **kwargs):
+        raise ImmutableLedgerError("Ledger entries are append-only")
+
+
+class LedgerBalanceSnapshot(models.Model):
+    account = models.ForeignKey(LedgerAccount, on_delete=models.CASCADE, related_name='snapshots')
+    # Last entry included in the balance
+    entry = models.ForeignKey(LedgerEntry, on_delete=models.PROTECT, related_name='+')
+    balance = models.DecimalField(max_digits=16, decimal_places=2)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['-entry_id']
+        indexes = [
+            models.Index(fields=['account', 'created_at'], name='ledger_snapshot_time_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.account.code} @ entry {self.entry_id}: {self.balance}"
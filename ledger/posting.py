@@ -0,0 +1,160 @@
+from decimal import Decimal
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Sum
+from .models import LedgerAccount, LedgerEntry, LedgerBalanceSnapshot
+import uuid
+
+CENTS = Decimal('0.01')
+
+# Account code prefix -> account type. Codes end with the currency, amounts in different
+# currencies never share a balance: gateway:card:USD, escrow:EUR, worker:12:USD
+ACCOUNT_TYPES = {
+    'gateway': 'asset',      # money held at a payment gateway, per payment method
+    'escrow': 'liability',   # client money held until the order is completed or refunded
+    'fees': 'expense',       # gateway fees, per payment method
+    'worker': 'liability',   # amounts owed to a worker
+}
+
+
+def get_snapshot_interval():
+    return getattr(settings, 'LEDGER_SNAPSHOT_INTERVAL', 100)
+
+
+def account_code(*parts, currency):
+    return ':'.join(str(part) for part in (*parts, currency))
+
+
+def get_account(code):
+    account_type = ACCOUNT_TYPES[code.split(':')[0]]
+    account, created = LedgerAccount.objects.get_or_create(code=code, defaults={'account_type': account_type})
+    return account
+
+
+def post_transaction(entry_type, legs, payment=None, currency='USD'):
+    """
+    Append a balanced set of entries. `legs` is a list of (account_code, amount) where
+    debits are positive and credits negative. Joins the caller's transaction if there is one.
+    """
+    legs = [(code, Decimal(str(amount)).quantize(CENTS)) for code, amount in legs]
+    if sum(amount for code, amount in legs) != 0:
+        raise ValueError(f"Unbalanced ledger transaction: {legs}")
+
+    interval = get_snapshot_interval()
+    transaction_id = uuid.uuid4()
+    codes = sorted({code for code, amount in legs})
+
+    with transaction.atomic():
+        for code in codes:
+            get_account(code)
+        # Lock in a fixed order so concurrent postings can't deadlock
+        accounts = {
+            account.code: account
+            for account in LedgerAccount.objects.select_for_update().filter(code__in=codes).order_by('code')
+        }
+
+        entries = []
+        for code, amount in legs:
+            account = accounts[code]
+            entry = LedgerEntry.objects.create(
+                transaction_id=transaction_id,
+                account=account,
+                entry_type=entry_type,
+                amount=amount,
+                currency=currency,
+                payment=payment,
+            )
+            account.balance += amount
+            account.entry_count += 1
+            if account.entry_count % interval == 0:
+                LedgerBalanceSnapshot.objects.create(account=account, entry=entry, balance=account.balance)
+            entries.append(entry)
+
+        for account in accounts.values():
+            account.save(update_fields=['balance', 'entry_count'])
+
+    return entries
+
+
+def balance_at(code, at=None):
+    """
+    Balance of an account at a point in time: nearest snapshot plus at most
+    LEDGER_SNAPSHOT_INTERVAL entries after it.
+    """
+    account = LedgerAccount.objects.filter(code=code).first()
+    if account is None:
+        return Decimal('0.00')
+    if at is None:
+        return account.balance
+
+    entries = account.entries.filter(created_at__lte=at)
+    balance = Decimal('0.00')
+
+    snapshot = account.snapshots.filter(created_at__lte=at).order_by('-entry_id').first()
+    if snapshot:
+        entries = entries.filter(id__gt=snapshot.entry_id)
+        balance = snapshot.balance
+
+    total = entries.order_by().aggregate(total=Sum('amount'))['total']
+    return (balance + (total or 0)).quantize(CENTS)
+
+
+def _already_posted(payment, entry_type):
+    return LedgerEntry.objects.filter(payment=payment, entry_type=entry_type).exists()
+
+
+def _post_once(entry_type, legs, payment):
+    """
+    Post a payment's transaction of entry_type unless it already has one. The unique
+    (payment, entry_type, account) constraint catches a concurrent posting that got past the check.
+    """
+    if _already_posted(payment, entry_type):
+        return []
+    try:
+        return post_transaction(entry_type, legs, payment=payment, currency=payment.currency)
+    except IntegrityError:
+        return []
+
+
+def gateway_fee(gateway_result):
+    """
+    Fee reported by the gateway, from either the full result or its gateway_response
+    """
+    if not gateway_result:
+        return Decimal('0')
+    response = gateway_result.get('gateway_response', gateway_result) or {}
+    return Decimal(str(response.get('gateway_fee') or '0')).quantize(CENTS)
+
+
+def record_charge(payment, fee=Decimal('0')):
+    """
+    Client charge into escrow, plus the gateway fee if there is one
+    """
+    gateway = account_code('gateway', payment.payment_method, currency=payment.currency)
+    entries = _post_once('charge', [
+        (gateway, payment.amount),
+        (account_code('escrow', currency=payment.currency), -payment.amount),
+    ], payment)
+    if fee:
+        entries += _post_once('fee', [
+            (account_code('fees', payment.payment_method, currency=payment.currency), fee),
+            (gateway, -fee),
+        ], payment)
+    return entries
+
+
+def record_refund(payment):
+    return _post_once('refund', [
+        (account_code('escrow', currency=payment.currency), payment.amount),
+        (account_code('gateway', payment.payment_method, currency=payment.currency), -payment.amount),
+    ], payment)
+
+
+def record_worker_payout(payment, worker):
+    """
+    Release escrowed funds to the worker once the order is completed
+    """
+    return _post_once('payout', [
+        (account_code('escrow', currency=payment.currency), payment.amount),
+        (account_code('worker', worker.id, currency=payment.currency), -payment.amount),
+    ], payment)
@@ -0,0 +1,154 @@
+from decimal import Decimal
+from unittest.mock import patch
+from django.test import TestCase, override_settings
+from django.contrib.auth import get_user_model
+from django.utils import timezone
+from .models import LedgerAccount, LedgerEntry, LedgerBalanceSnapshot, ImmutableLedgerError
+from .posting import post_transaction, balance_at, record_charge, record_refund, record_worker_payout, gateway_fee
+from orders.models import Order
+from payments.models import Payment
+from services.models import Service, ServiceCategory
+
+User = get_user_model()
+
+class LedgerPostingTest(TestCase):
+    def test_unbalanced_transaction_rejected(self):
+        with self.assertRaises(ValueError):
+            post_transaction('charge', [('gateway:card', 100), ('escrow', -90)])
+        self.assertFalse(LedgerEntry.objects.exists())
+    
+    def test_running_balances(self):
+        post_transaction('charge', [('gateway:card', 100), ('escrow', -100)])
+        post_transaction('charge', [('gateway:card', 50), ('escrow', -50)])
+        
+        account = LedgerAccount.objects.get(code='gateway:card')
+        self.assertEqual(account.balance, Decimal('150.00'))
+        self.assertEqual(account.entry_count, 2)
+        self.assertEqual(balance_at('escrow'), Decimal('-150.00'))
+    
+    def test_entries_are_immutable(self):
+        entry = post_transaction('charge', [('gateway:card', 100), ('escrow', -100)])[0]
+        
+        entry.amount = 1
+        with self.assertRaises(ImmutableLedgerError):
+            entry.save()
+        with self.assertRaises(ImmutableLedgerError):
+            entry.delete()
+        with self.assertRaises(ImmutableLedgerError):
+            LedgerEntry.objects.filter(pk=entry.pk).update(amount=1)
+    
+    @override_settings(LEDGER_SNAPSHOT_INTERVAL=2)
+    def test_snapshots_every_n_entries(self):
+        for amount in (10, 20, 30, 40, 50):
+            post_transaction('charge', [('gateway:card', amount), ('escrow', -amount)])
+        
+        snapshots = LedgerBalanceSnapshot.objects.filter(account__code='gateway:card').order_by('entry_id')
+        self.assertEqual([s.balance for s in snapshots], [Decimal('30.00'), Decimal('100.00')])
+    
+    @override_settings(LEDGER_SNAPSHOT_INTERVAL=2)
+    def test_balance_at_point_in_time(self):
+        for amount in (10, 20, 30):
+            post_transaction('charge', [('gateway:card', amount), ('escrow', -amount)])
+        checkpoint = timezone.now()
+        post_transaction('charge', [('gateway:card', 40), ('escrow', -40)])
+        
+        self.assertEqual(balance_at('gateway:card', checkpoint), Decimal('60.00'))
+        self.assertEqual(balance_at('gateway:card'), Decimal('100.00'))
+        self.assertEqual(balance_at('gateway:payme', checkpoint), Decimal('0.00'))
+
+class PaymentLedgerTest(TestCase):
+    def setUp(self):
+        self.client_user = User.objects.create_user(
+            username='client',
+            email='client@example.com',
+            password='clientpass123',
+            role='client'
+        )
+        
+        self.worker_user = User.objects.create_user(
+            username='worker',
+            email='worker@example.com',
+            password='workerpass123',
+            role='worker'
+        )
+        
+        self.category = ServiceCategory.objects.create(
+            name='Web Development',
+            description='All web development services'
+        )
+        
+        self.service = Service.objects.create(
+            name='WordPress Website',
+            description='Custom WordPress development',
+            base_price=500.00,
+            category=self.category,
+            duration_hours=40
+        )
+        
+        self.order = Order.objects.create(
+            client=self.client_user,
+            worker=self.worker_user,
+            service=self.service,
+            description='Need a business website',
+            address='123 Main St',
+            scheduled_date='2024-01-01 10:00:00',
+            total_price=500.00
+        )
+        
+        self.payment = Payment.objects.create(
+            order=self.order,
+            user=self.client_user,
+            amount=500.00,
+            payment_method='card',
+            status='completed'
+        )
+    
+    def test_gateway_fee_from_result(self):
+        result = {'status': 'success', 'gateway_response': {'gateway_fee': '15.0000'}}
+        self.assertEqual(gateway_fee(result), Decimal('15'))
+        self.assertEqual(gateway_fee(None), Decimal('0'))
+    
+    def test_charge_fee_refund(self):
+        record_charge(self.payment, Decimal('15.00'))
+        record_charge(self.payment, Decimal('15.00'))  # idempotent
+        
+        self.assertEqual(balance_at('gateway:card:USD'), Decimal('485.00'))
+        self.assertEqual(balance_at('fees:card:USD'), Decimal('15.00'))
+        self.assertEqual(balance_at('escrow:USD'), Decimal('-500.00'))
+        
+        record_refund(self.payment)
+        self.assertEqual(balance_at('escrow:USD'), Decimal('0.00'))
+        self.assertEqual(balance_at('gateway:card:USD'), Decimal('-15.00'))
+    
+    def test_worker_payout(self):
+        record_charge(self.payment)
+        record_worker_payout(self.payment, self.worker_user)
+        
+        self.assertEqual(balance_at('escrow:USD'), Decimal('0.00'))
+        self.assertEqual(balance_at(f'worker:{self.worker_user.id}:USD'), Decimal('-500.00'))
+    
+    def test_currencies_kept_in_separate_accounts(self):
+        record_charge(self.payment)
+        self.order.pk = None
+        self.order.save()
+        record_charge(Payment.objects.create(
+            order=self.order,
+            user=self.client_user,
+            amount=Decimal('80.00'),
+            currency='EUR',
+            payment_method='card',
+            status='completed'
+        ))
+        
+        self.assertEqual(balance_at('gateway:card:USD'), Decimal('500.00'))
+        self.assertEqual(balance_at('gateway:card:EUR'), Decimal('80.00'))
+        self.assertEqual(balance_at('escrow:EUR'), Decimal('-80.00'))
+    
+    def test_concurrent_posting_rejected_by_constraint(self):
+        record_charge(self.payment)
+        # Another worker got past the existence check at the same time
+        with patch('ledger.posting._already_posted', return_value=False):
+            self.assertEqual(record_charge(self.payment), [])
+        
+        self.assertEqual(LedgerEntry.objects.filter(payment=self.payment).count(), 2)
+        self.assertEqual(balance_at('gateway:card:USD'), Decimal('500.00'))
@@ -0,0 +1,9 @@
+from django.contrib import admin
+from .models import OutboxMessage
+
+@admin.register(OutboxMessage)
+class OutboxMessageAdmin(admin.ModelAdmin):
+    list_display = ['id', 'group', 'attempts', 'last_error', 'created_at', 'delivered_at', 'dead_at']
+    list_filter = ['delivered_at', 'dead_at']
+    search_fields = ['group']
+    readonly_fields = ['created_at', 'delivered_at', 'claimed_by', 'claimed_at', 'dead_at', 'attempts', 'last_error']
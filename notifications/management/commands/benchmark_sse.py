@@ -0,0 +1,82 @@
+import asyncio
+import time
+import tracemalloc
+from asgiref.testing import ApplicationCommunicator
+from channels.layers import get_channel_layer
+from channels.routing import URLRouter
+from django.core.management.base import BaseCommand, CommandError
+from django.test import override_settings
+from accounts.authentication import VersionedRefreshToken
+from accounts.models import User
+from notifications.outbox import user_group
+from notifications.routing import http_urlpatterns
+
+
+class Command(BaseCommand):
+    help = (
+        'Hold idle SSE notification streams open in this process and report memory per stream, including '
+        'the in-process test client of each one, then check one event reaches all of them'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--connections', type=int, default=2000)
+        parser.add_argument('--username', help='User the streams belong to, defaults to the first active user')
+
+    def handle(self, *args, **options):
+        if options['connections'] < 1:
+            raise CommandError('--connections must be positive')
+
+        users = User.objects.filter(is_active=True).order_by('id')
+        if options['username']:
+            users = users.filter(username=options['username'])
+        user = users.first()
+        if user is None:
+            raise CommandError('No active user to mint tokens for')
+        token = str(VersionedRefreshToken.for_user(user).access_token)
+
+        with override_settings(CHANNEL_LAYERS={'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}}):
+            opened, elapsed, per_stream, delivered = asyncio.run(self.run(user, token, options['connections']))
+
+        self.stdout.write(f'{opened} streams opened in {elapsed:.2f}s, {per_stream / 1024:.1f} KiB each')
+        self.stdout.write(self.style.SUCCESS(f'One event delivered to {delivered} of {opened} streams'))
+
+    async def run(self, user, token, connections):
+        application = URLRouter(http_urlpatterns)
+        scope = {
+            'type': 'http',
+            'method': 'GET',
+            'path': '/sse/notifications/',
+            'query_string': f'token={token}'.encode(),
+            'headers': [],
+        }
+
+        async def open_stream():
+            communicator = ApplicationCommunicator(application, dict(scope))
+            await communicator.send_input({'type': 'http.request', 'body': b''})
+            await communicator.receive_output(5)
+            await communicator.receive_output(5)
+            return communicator
+
+        # Warm up the first stream so module-level state isn't counted
+        first = await open_stream()
+        tracemalloc.start()
+        before = tracemalloc.take_snapshot()
+        started = time.perf_counter()
+        opened = [first] + list(await asyncio.gather(*(open_stream() for _ in range(connections - 1))))
+        elapsed = time.perf_counter() - started
+        after = tracemalloc.take_snapshot()
+        tracemalloc.stop()
+        growth = sum(stat.size_diff for stat in after.compare_to(before, 'filename'))
+        per_stream = growth / max(connections - 1, 1)
+
+        # The in-memory layer scans every channel on each receive, so this is slow with many streams
+        await get_channel_layer().group_send(user_group(user.id), {'type': 'status_update', 'event_id': 0})
+        received = await asyncio.gather(
+            *(communicator.receive_output(30) for communicator in opened), return_exceptions=True
+        )
+        delivered = sum(1 for message in received if isinstance(message, dict))
+
+        for communicator in opened:
+            await communicator.send_input({'type': 'http.disconnect'})
+        await asyncio.gather(*(communicator.wait(5) for communicator in opened), return_exceptions=True)
+        return len(opened), elapsed, per_stream, delivered
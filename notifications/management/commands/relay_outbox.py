@@ -0,0 +1,25 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from notifications.outbox import relay_pending, run_relay
+
+
+class Command(BaseCommand):
+    help = 'Deliver outbox notifications to the channel layer, once or continuously'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=settings.NOTIFICATION_OUTBOX_BATCH_SIZE)
+        parser.add_argument('--once', action='store_true', help='Drain the outbox once and exit')
+        parser.add_argument('--interval', type=float, default=settings.NOTIFICATION_OUTBOX_POLL_INTERVAL,
+                            help='Seconds between polls for new messages')
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be positive')
+
+        if options['once']:
+            result = relay_pending(options['batch_size'])
+            self.stdout.write(f'Delivered {result.delivered} notifications, {result.failed} failed')
+            return
+
+        self.stdout.write(f'Relaying outbox every {options["interval"]}s')
+        run_relay(options['interval'], options['batch_size'])
@@ -0,0 +1,182 @@
+import asyncio
+import json
+import time
+from channels.layers import InMemoryChannelLayer, get_channel_layer
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.test import override_settings
+from accounts.models import User
+from notifications.outbound import metrics
+from orders.consumers import CLOSE_SLOW_CONSUMER, NotificationConsumer
+
+
+class SoakChannelLayer(InMemoryChannelLayer):
+    """
+    In-memory layer without the expiry sweep, which scans every channel and group on each
+    receive. Nothing expires during a soak run.
+    """
+
+    def _clean_expired(self):
+        pass
+
+
+class SoakClient:
+    """
+    Plays the server side of one WebSocket, taking `delay` seconds to write each message
+    """
+
+    def __init__(self, user, delay):
+        self.user = user
+        self.delay = delay
+        self.inbox = asyncio.Queue()
+        self.accepted = asyncio.Event()
+        self.done = asyncio.Event()
+        self.close_code = None
+        self.kept = set()
+        self.statuses = {}
+
+    async def receive(self):
+        return await self.inbox.get()
+
+    async def send(self, message):
+        if message['type'] == 'websocket.accept':
+            self.accepted.set()
+        elif message['type'] == 'websocket.close':
+            self.close_code = message.get('code')
+            self.done.set()
+            await self.inbox.put({'type': 'websocket.disconnect', 'code': self.close_code})
+        elif message['type'] == 'websocket.send':
+            if self.delay:
+                await asyncio.sleep(self.delay)
+            event = json.loads(message['text'])
+            if event['type'] == 'status_update':
+                self.statuses[event['order_id']] = event['event_id']
+            elif event['type'] == 'payment_notification':
+                self.kept.add(event['event_id'])
+                if event.get('final'):
+                    self.done.set()
+
+    def start(self, application):
+        scope = {
+            'type': 'websocket',
+            'path': '/ws/notifications/',
+            'query_string': b'',
+            'headers': [],
+            'subprotocols': [],
+            'user': self.user,
+        }
+        self.task = asyncio.get_running_loop().create_task(application(scope, self.receive, self.send))
+        self.inbox.put_nowait({'type': 'websocket.connect'})
+
+
+class Command(BaseCommand):
+    help = (
+        'Soak test the WebSocket outbound queues: connect many consumers, some of them slow readers, push '
+        'status updates (coalesced), new order offers (droppable) and payments (kept) at them and report queue '
+        'depth, drops and slow consumer disconnects'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--consumers', type=int, default=2000)
+        parser.add_argument('--slow-ratio', type=float, default=0.2, help='Fraction of consumers that read slowly')
+        parser.add_argument('--slow-delay', type=float, default=0.5, help='Seconds a slow consumer takes per message')
+        parser.add_argument('--rounds', type=int, default=100, help='Events sent to every consumer')
+        parser.add_argument('--interval', type=float, default=0.01, help='Seconds between rounds')
+        parser.add_argument('--orders', type=int, default=5, help='Orders the status updates rotate over')
+        parser.add_argument('--queue-size', type=int, help='Overrides WS_OUTBOUND_QUEUE_SIZE')
+        parser.add_argument('--slow-timeout', type=float, help='Overrides WS_SLOW_CONSUMER_TIMEOUT')
+
+    def handle(self, *args, **options):
+        if options['consumers'] < 1 or options['rounds'] < 1 or options['orders'] < 1:
+            raise CommandError('--consumers, --rounds and --orders must be positive')
+
+        overrides = {
+            'CHANNEL_LAYERS': {'default': {'BACKEND': f'{__name__}.SoakChannelLayer'}},
+            'WORKER_PRESENCE': '',
+        }
+        if options['queue_size']:
+            overrides['WS_OUTBOUND_QUEUE_SIZE'] = options['queue_size']
+        if options['slow_timeout'] is not None:
+            overrides['WS_SLOW_CONSUMER_TIMEOUT'] = options['slow_timeout']
+
+        metrics.reset()
+        with override_settings(**overrides):
+            queue_size = settings.WS_OUTBOUND_QUEUE_SIZE
+            report = asyncio.run(self.run(options))
+
+        fast, slow = report['fast'], report['slow']
+        self.stdout.write(
+            f'{len(fast) + len(slow)} consumers ({len(slow)} slow), {options["rounds"]} rounds, '
+            f'{report["sent"]} messages in {report["elapsed"]:.2f}s'
+        )
+        self.stdout.write(
+            f'Peak queued: {report["peak_queued"]} messages, deepest queue: {metrics.high_water} (limit {queue_size})'
+        )
+        self.stdout.write(
+            f'Dropped {metrics.dropped}, coalesced {metrics.coalesced}, '
+            f'slow consumers disconnected: {sum(1 for client in slow if client.close_code == CLOSE_SLOW_CONSUMER)}'
+            f'/{len(slow)}'
+        )
+        missing = sum(report['expected_kept'] - len(client.kept) for client in fast)
+        stale = sum(1 for client in fast if client.statuses != report['final_statuses'])
+        disconnected = sum(1 for client in fast if client.close_code is not None)
+        result = f'Fast consumers: {missing} missing payments, {stale} stale statuses, {disconnected} disconnected'
+        self.stdout.write(self.style.SUCCESS(result) if not (missing or stale or disconnected) else self.style.ERROR(result))
+
+    async def run(self, options):
+        application = NotificationConsumer.as_asgi()
+        slow_every = int(1 / options['slow_ratio']) if options['slow_ratio'] > 0 else 0
+        clients = [
+            SoakClient(
+                User(id=index + 1, username=f'soak{index}', role='client'),
+                options['slow_delay'] if slow_every and index % slow_every == 0 else 0
+            )
+            for index in range(options['consumers'])
+        ]
+        for client in clients:
+            client.start(application)
+        await asyncio.gather(*(client.accepted.wait() for client in clients))
+
+        channel_layer = get_channel_layer()
+        event_id = sent = peak_queued = expected_kept = 0
+        final_statuses = {}
+        started = time.perf_counter()
+        for round_number in range(options['rounds']):
+            event_id += 1
+            final = round_number == options['rounds'] - 1
+            if final or round_number % 10 == 0:
+                event = {'type': 'payment_notification', 'notification_type': 'payment_success', 'final': final}
+                expected_kept += 1
+            elif round_number % 3 == 0:
+                event = {'type': 'order_notification', 'notification_type': 'new_order_available'}
+            else:
+                event = {'type': 'status_update'}
+            order_id = round_number % options['orders']
+            event.update(order_id=order_id, event_id=event_id)
+            if event['type'] == 'status_update':
+                final_statuses[order_id] = event_id
+
+            for client in clients:
+                await channel_layer.group_send(f'user_{client.user.id}', event)
+            sent += len(clients)
+            peak_queued = max(peak_queued, metrics.snapshot()['queued'])
+            await asyncio.sleep(options['interval'])
+
+        fast = [client for client in clients if not client.delay]
+        slow = [client for client in clients if client.delay]
+        await asyncio.wait_for(asyncio.gather(*(client.done.wait() for client in fast)), 30)
+        elapsed = time.perf_counter() - started
+
+        for client in clients:
+            if client.close_code is None:
+                await client.inbox.put({'type': 'websocket.disconnect', 'code': 1000})
+        await asyncio.gather(*(client.task for client in clients), return_exceptions=True)
+        return {
+            'fast': fast,
+            'slow': slow,
+            'sent': sent,
+            'elapsed': elapsed,
+            'peak_queued': peak_queued,
+            'expected_kept': expected_kept,
+            'final_statuses': final_statuses,
+        }
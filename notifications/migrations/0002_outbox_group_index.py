@@ -0,0 +1,17 @@
+# Generated by Django 5.2.5 on 2026-10-19 02:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notifications', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='outboxmessage',
+            index=models.Index(fields=['group', 'id'], name='outbox_group_id_idx'),
+        ),
+    ]
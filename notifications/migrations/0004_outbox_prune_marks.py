@@ -0,0 +1,21 @@
+# Generated by Django 5.2.5 on 2026-10-19 04:06
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notifications', '0003_outbox_claims'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OutboxPruneMark',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('group', models.CharField(max_length=100, unique=True)),
+                ('pruned_through', models.BigIntegerField()),
+            ],
+        ),
+    ]
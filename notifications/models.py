@@ -0,0 +1,43 @@
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import models
+
+class OutboxMessage(models.Model):
+    """
+    Channel layer message written in the same transaction as the change it announces,
+    delivered at least once by the outbox relay
+    """
+    group = models.CharField(max_length=100)
+    payload = models.JSONField(encoder=DjangoJSONEncoder)
+    attempts = models.PositiveIntegerField(default=0)
+    last_error = models.CharField(max_length=255, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    delivered_at = models.DateTimeField(blank=True, null=True)
+    # Set by the relay that is sending the row, a claim older than NOTIFICATION_OUTBOX_CLAIM_TIMEOUT is taken over
+    claimed_by = models.CharField(max_length=32, blank=True)
+    claimed_at = models.DateTimeField(blank=True, null=True)
+    # Given up on after NOTIFICATION_OUTBOX_MAX_ATTEMPTS failures
+    dead_at = models.DateTimeField(blank=True, null=True)
+    
+    class Meta:
+        ordering = ['id']
+        indexes = [
+            models.Index(fields=['id'], condition=models.Q(delivered_at__isnull=True, dead_at__isnull=True),
+                         name='outbox_pending_idx'),
+            # Replay reads one user's events after an id
+            models.Index(fields=['group', 'id'], name='outbox_group_id_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.group} - {self.payload.get('type')} #{self.id}"
+
+
+class OutboxPruneMark(models.Model):
+    """
+    Highest message id pruned from a group, so a replay knows whether events after
+    a client's last_event_id are gone
+    """
+    group = models.CharField(max_length=100, unique=True)
+    pruned_through = models.BigIntegerField()
+    
+    def __str__(self):
+        return f"{self.group} pruned through #{self.pruned_through}"
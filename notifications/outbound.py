@@ -0,0 +1,158 @@
+"""
+Bounded outbound queue per WebSocket connection. Channel layer handlers put messages here
+instead of awaiting the send, and a writer task (only while there is a backlog) drains the
+queue in order. A slow client then grows its own queue, up to WS_OUTBOUND_QUEUE_SIZE, instead
+of stalling the consumer and leaving messages to pile up in the channel layer.
+
+WS_OUTBOUND_POLICIES decides what happens to a message, by notification_type or type:
+- coalesce: replaces the queued message with the same type and order_id, at the end of the queue
+- drop: discarded when the queue is full, and evicted first to make room for other messages
+- anything else is kept. A full queue with nothing to evict, or a message waiting longer than
+  WS_SLOW_CONSUMER_TIMEOUT, makes the client a slow consumer to be disconnected. It reconnects
+  with last_event_id and gets the missed events replayed.
+"""
+import asyncio
+import itertools
+import time
+import weakref
+from collections import OrderedDict
+from django.conf import settings
+import logging
+
+logger = logging.getLogger(__name__)
+
+KEEP = 'keep'
+DROP = 'drop'
+COALESCE = 'coalesce'
+
+
+def message_policy(message):
+    policies = settings.WS_OUTBOUND_POLICIES
+    return policies.get(message.get('notification_type')) or policies.get(message.get('type'), KEEP)
+
+
+class OutboundMetrics:
+    """
+    Process-wide counters over every open queue
+    """
+
+    def __init__(self):
+        self.queues = weakref.WeakSet()
+        self.reset()
+
+    def reset(self):
+        self.high_water = 0
+        self.dropped = 0
+        self.coalesced = 0
+        self.slow_consumers = 0
+
+    def snapshot(self):
+        while True:
+            try:
+                depths = [len(queue) for queue in list(self.queues)]
+                break
+            except RuntimeError:
+                # A connection opened on the event loop thread while we iterated
+                continue
+        return {
+            'connections': len(depths),
+            'backlogged': sum(1 for depth in depths if depth),
+            'queued': sum(depths),
+            'max_depth': max(depths, default=0),
+            'high_water': self.high_water,
+            'dropped': self.dropped,
+            'coalesced': self.coalesced,
+            'slow_consumers': self.slow_consumers,
+        }
+
+
+metrics = OutboundMetrics()
+
+
+class OutboundQueue:
+    def __init__(self, send, maxsize=None, timeout=None):
+        """
+        send is the coroutine function that writes one message to the client
+        """
+        self.send = send
+        self.maxsize = maxsize or settings.WS_OUTBOUND_QUEUE_SIZE
+        self.timeout = settings.WS_SLOW_CONSUMER_TIMEOUT if timeout is None else timeout
+        # key -> (policy, message, queued at). Keys are (type, order_id) for coalesced messages
+        self.entries = OrderedDict()
+        self.keys = itertools.count()
+        # When the message being written now was queued
+        self.in_flight_since = None
+        self.writer = None
+        self.closed = False
+        metrics.queues.add(self)
+
+    def __len__(self):
+        return len(self.entries)
+
+    def waiting_since(self):
+        if self.in_flight_since is not None:
+            return self.in_flight_since
+        if self.entries:
+            return next(iter(self.entries.values()))[2]
+        return None
+
+    def put(self, message):
+        """
+        Queue message for the writer. Returns False if the client is a slow consumer.
+        """
+        if self.closed:
+            return True
+        now = time.monotonic()
+        oldest = self.waiting_since()
+        if oldest is not None and now - oldest > self.timeout:
+            return False
+
+        policy = message_policy(message)
+        if policy == COALESCE:
+            key = (message.get('type'), message.get('order_id'))
+            if self.entries.pop(key, None) is not None:
+                metrics.coalesced += 1
+        else:
+            key = next(self.keys)
+
+        if len(self.entries) >= self.maxsize:
+            if policy == DROP:
+                metrics.dropped += 1
+                return True
+            if not self.evict():
+                return False
+
+        self.entries[key] = (policy, message, now)
+        metrics.high_water = max(metrics.high_water, len(self.entries))
+        if self.writer is None or self.writer.done():
+            self.writer = asyncio.get_running_loop().create_task(self.drain())
+        return True
+
+    def evict(self):
+        for key, (policy, _, _) in self.entries.items():
+            if policy == DROP:
+                del self.entries[key]
+                metrics.dropped += 1
+                return True
+        return False
+
+    async def drain(self):
+        while self.entries and not self.closed:
+            _, (_, message, queued_at) = self.entries.popitem(last=False)
+            self.in_flight_since = queued_at
+            try:
+                await self.send(message)
+            except Exception as e:
+                logger.info(f"Outbound send failed, dropping {len(self.entries)} queued messages: {e}")
+                self.entries.clear()
+            finally:
+                self.in_flight_since = None
+
+    def close(self, slow=False):
+        if slow and not self.closed:
+            metrics.slow_consumers += 1
+        self.closed = True
+        self.entries.clear()
+        if self.writer is not None and not self.writer.done() and self.writer is not asyncio.current_task():
+            self.writer.cancel()
+        metrics.queues.discard(self)
@@ -0,0 +1,245 @@
+"""
+Transactional outbox for channel layer notifications. Views write OutboxMessage rows in the
+same transaction as the change they announce, so a request never waits on Redis and a
+rolled back change sends nothing. The relay claims pending rows in id order, sends each
+batch concurrently (one ordered stream per group) and marks the sent rows delivered.
+A crash between sending and marking resends the message once its claim goes stale:
+delivery is at least once. A message that keeps failing is dead-lettered after
+NOTIFICATION_OUTBOX_MAX_ATTEMPTS, unblocking the rest of its group.
+
+Rows double as each user's recent event log. Every message carries its row id
+as event_id, and a reconnecting client passes the last one it saw to get what it missed
+(missed_events). Rows older than NOTIFICATION_RETENTION are pruned, and OutboxPruneMark keeps the
+highest pruned id per group so a replay can tell whether anything after a client's id is gone.
+"""
+import asyncio
+import time
+import uuid
+from collections import defaultdict, namedtuple
+from datetime import timedelta
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+from .models import OutboxMessage, OutboxPruneMark
+import logging
+
+logger = logging.getLogger(__name__)
+
+RelayResult = namedtuple('RelayResult', ['delivered', 'failed'])
+
+
+def user_group(user_id):
+    return f"user_{user_id}"
+
+
+def enqueue(group, message):
+    """
+    Queue message for group. Call it inside the transaction that makes the change.
+    """
+    return OutboxMessage.objects.create(group=group, payload=message)
+
+
+def notify_user(user_id, message):
+    return enqueue(user_group(user_id), message)
+
+
+def notify_users(user_ids, message):
+    return OutboxMessage.objects.bulk_create([
+        OutboxMessage(group=user_group(user_id), payload=message) for user_id in user_ids
+    ])
+
+
+def notify_each(messages):
+    """
+    Queue a different message per user from (user_id, message) pairs, in one INSERT
+    """
+    return OutboxMessage.objects.bulk_create([
+        OutboxMessage(group=user_group(user_id), payload=message) for user_id, message in messages
+    ])
+
+
+def event_payload(message):
+    return {**message.payload, 'event_id': message.id}
+
+
+async def _send_group(channel_layer, messages):
+    """
+    Send one group's messages in order, stopping at the first failure so later ones
+    can't overtake it. Returns (sent ids, failed message, error).
+    """
+    sent = []
+    for message in messages:
+        try:
+            await channel_layer.group_send(message.group, event_payload(message))
+        except Exception as e:
+            return sent, message, e
+        sent.append(message.id)
+    return sent, None, None
+
+
+async def _send_batch(channel_layer, by_group):
+    return await asyncio.gather(*(_send_group(channel_layer, messages) for messages in by_group.values()))
+
+
+def claim_batch(batch_size):
+    """
+    Claim up to batch_size pending rows for this relay with a conditional UPDATE, which works
+    on every backend (SQLite ignores SELECT ... SKIP LOCKED). Groups with rows another relay is
+    sending are skipped so their messages stay in order. Returns the claimed rows in id order.
+    """
+    now = timezone.now()
+    token = uuid.uuid4().hex
+    stale = now - timedelta(seconds=settings.NOTIFICATION_OUTBOX_CLAIM_TIMEOUT)
+    pending = OutboxMessage.objects.filter(delivered_at__isnull=True, dead_at__isnull=True)
+    claimed = pending.filter(claimed_at__gte=stale)
+    claimable = pending.filter(Q(claimed_at__isnull=True) | Q(claimed_at__lt=stale))
+
+    ids = list(
+        claimable.exclude(group__in=claimed.values('group'))
+        .order_by('id').values_list('id', flat=True)[:batch_size]
+    )
+    if not ids:
+        return []
+    # Rows another relay claimed since the SELECT no longer match
+    claimable.filter(id__in=ids).update(claimed_by=token, claimed_at=now)
+    return list(OutboxMessage.objects.filter(claimed_by=token).order_by('id'))
+
+
+def relay_batch(batch_size=None, channel_layer=None):
+    """
+    Deliver one batch of pending messages. The rows are claimed first, so concurrent relays
+    don't send the same batch, and no transaction is held while sending.
+    """
+    batch_size = batch_size or settings.NOTIFICATION_OUTBOX_BATCH_SIZE
+    channel_layer = channel_layer or get_channel_layer()
+
+    messages = claim_batch(batch_size)
+    if not messages:
+        return RelayResult(0, 0)
+
+    by_group = defaultdict(list)
+    for message in messages:
+        by_group[message.group].append(message)
+    results = async_to_sync(_send_batch)(channel_layer, by_group)
+
+    delivered, failures = [], []
+    for sent, failed, error in results:
+        delivered += sent
+        if failed is not None:
+            failures.append((failed, error))
+
+    now = timezone.now()
+    with transaction.atomic():
+        if delivered:
+            OutboxMessage.objects.filter(id__in=delivered).update(delivered_at=now, claimed_by='', claimed_at=None)
+        # A failure only counts towards dead-lettering if other messages went through: when
+        # nothing did, the channel layer is down and the whole backlog would die with it
+        counted = bool(delivered)
+        for message, error in failures:
+            logger.warning(f"Outbox message {message.id} to {message.group} not delivered: {error}")
+            attempts = message.attempts + 1 if counted else message.attempts
+            dead = attempts >= settings.NOTIFICATION_OUTBOX_MAX_ATTEMPTS
+            if dead:
+                logger.error(f"Dead-lettering outbox message {message.id} to {message.group} after {attempts} attempts")
+            OutboxMessage.objects.filter(id=message.id).update(
+                attempts=attempts, last_error=str(error)[:255], dead_at=now if dead else None
+            )
+        # Unsent rows, failed or behind a failure in their group, go back to the pool
+        OutboxMessage.objects.filter(id__in=[m.id for m in messages], delivered_at__isnull=True).update(
+            claimed_by='', claimed_at=None
+        )
+
+    return RelayResult(len(delivered), len(failures))
+
+
+def relay_pending(batch_size=None, max_batches=None):
+    """
+    Relay batches until the outbox is drained, max_batches is reached or a batch delivers
+    nothing (the channel layer is down, retry on the next run). Returns the totals.
+    """
+    batch_size = batch_size or settings.NOTIFICATION_OUTBOX_BATCH_SIZE
+    channel_layer = get_channel_layer()
+    delivered = failed = batches = 0
+    while max_batches is None or batches < max_batches:
+        result = relay_batch(batch_size, channel_layer)
+        batches += 1
+        delivered += result.delivered
+        failed += result.failed
+        if result.delivered == 0 or result.delivered + result.failed < batch_size:
+            break
+    return RelayResult(delivered, failed)
+
+
+def run_relay(interval=None, batch_size=None, stop=None):
+    """
+    Poll the outbox until stop() returns True. Used by the relay_outbox command.
+    """
+    interval = settings.NOTIFICATION_OUTBOX_POLL_INTERVAL if interval is None else interval
+    while not (stop and stop()):
+        try:
+            result = relay_pending(batch_size)
+        except Exception as e:
+            logger.error(f"Outbox relay failed: {e}")
+            result = RelayResult(0, 1)
+        # Back off while the channel layer is failing
+        time.sleep(max(interval, 1.0) if result.failed else interval)
+
+
+def missed_events(user_id, last_event_id, limit=None):
+    """
+    Events for user_id after last_event_id, oldest first, at most `limit` (the newest). Rows the
+    relay hasn't sent yet are included, the client drops the copy that arrives live.
+    Returns (events, truncated). truncated means some events are not included, either over the
+    limit or already pruned, and the client has to resync from the API.
+    """
+    limit = limit or settings.NOTIFICATION_REPLAY_LIMIT
+    group = user_group(user_id)
+    messages = list(OutboxMessage.objects.filter(group=group, id__gt=last_event_id).order_by('-id')[:limit + 1])
+    truncated = len(messages) > limit
+    if not truncated:
+        truncated = OutboxPruneMark.objects.filter(group=group, pruned_through__gt=last_event_id).exists()
+    return [event_payload(message) for message in reversed(messages[:limit])], truncated
+
+
+def prune_outbox(retention=None, batch_size=1000, now=None):
+    """
+    Delete delivered and dead messages older than `retention` seconds in id-ordered chunks.
+    Each group's prune mark is raised before its rows go. Returns the number of rows deleted.
+    """
+    retention = settings.NOTIFICATION_RETENTION if retention is None else retention
+    cutoff = (now or timezone.now()) - timedelta(seconds=retention)
+    deleted = 0
+    while True:
+        rows = list(
+            OutboxMessage.objects.filter(Q(delivered_at__lt=cutoff) | Q(dead_at__lt=cutoff))
+            .order_by('id').values_list('id', 'group')[:batch_size]
+        )
+        if not rows:
+            break
+        # Ids ascend, so the last one seen per group is its highest
+        raise_prune_marks({group: message_id for message_id, group in rows})
+        # Nothing references outbox rows, so this is a single DELETE without loading them
+        deleted += OutboxMessage.objects.filter(id__in=[message_id for message_id, _ in rows]).delete()[0]
+        if len(rows) < batch_size:
+            break
+    return deleted
+
+
+def raise_prune_marks(pruned):
+    """
+    Record {group: highest pruned id}, never lowering a group's existing mark
+    """
+    marks = {mark.group: mark for mark in OutboxPruneMark.objects.filter(group__in=pruned)}
+    created, raised = [], []
+    for group, message_id in pruned.items():
+        mark = marks.get(group)
+        if mark is None:
+            created.append(OutboxPruneMark(group=group, pruned_through=message_id))
+        elif mark.pruned_through < message_id:
+            mark.pruned_through = message_id
+            raised.append(mark)
+    OutboxPruneMark.objects.bulk_create(created)
+    OutboxPruneMark.objects.bulk_update(raised, ['pruned_through'])
@@ -0,0 +1,6 @@
+from django.urls import path
+from .sse import NotificationStreamConsumer
+
+http_urlpatterns = [
+    path('sse/notifications/', NotificationStreamConsumer.as_asgi()),
+]
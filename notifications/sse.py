@@ -0,0 +1,177 @@
+"""
+Server-Sent Events stream of the notifications NotificationConsumer sends over WebSocket, for
+clients that can't keep a socket open. The stream joins the same channel groups and sends each
+event as one SSE message with its event_id as the id, so EventSource reconnects with a
+Last-Event-ID header and gets what it missed from the outbox.
+
+An idle stream is only its channel layer subscription: there is no task per connection,
+one KeepAlive task per event loop writes the keep-alive comments for all of them.
+"""
+import asyncio
+import json
+from urllib.parse import parse_qs
+from channels.db import database_sync_to_async
+from channels.exceptions import StopConsumer
+from channels.generic.http import AsyncHttpConsumer
+from django.conf import settings
+from accounts.middleware import CLOSE_FORBIDDEN, authenticate_scope
+from .outbox import missed_events, user_group
+import logging
+
+logger = logging.getLogger(__name__)
+
+STREAM_HEADERS = [
+    (b'content-type', b'text/event-stream'),
+    (b'cache-control', b'no-cache'),
+    # Stop nginx from buffering the stream
+    (b'x-accel-buffering', b'no'),
+]
+KEEPALIVE = b': keep-alive\n\n'
+ALLOWED_METHODS = b'GET, OPTIONS'
+# EventSource polyfills send the token in a header, which makes the browser preflight
+PREFLIGHT_HEADERS = [
+    (b'access-control-allow-methods', b'GET'),
+    (b'access-control-allow-headers', b'authorization, last-event-id, cache-control'),
+    (b'access-control-max-age', b'86400'),
+]
+
+
+def format_event(data, event_id=None):
+    """
+    One SSE message. The data is the same JSON a WebSocket client receives.
+    """
+    head = f'id: {event_id}\n' if event_id is not None else ''
+    return f'{head}data: {json.dumps(data)}\n\n'.encode()
+
+
+def get_header(scope, name):
+    for header, value in scope.get('headers', []):
+        if header == name:
+            return value
+    return None
+
+
+def last_event_id(scope):
+    """
+    Last-Event-ID header sent by a reconnecting EventSource, else ?last_event_id=
+    """
+    header = get_header(scope, b'last-event-id')
+    if header is not None:
+        raw = header.decode()
+    else:
+        raw = parse_qs(scope.get('query_string', b'').decode()).get('last_event_id', [''])[0]
+    try:
+        return int(raw)
+    except ValueError:
+        return None
+
+
+def cors_headers(scope):
+    """
+    The Django CORS middleware never sees this consumer, so allow CORS_ALLOWED_ORIGINS here
+    """
+    origin = get_header(scope, b'origin')
+    if origin is None:
+        return []
+    if not getattr(settings, 'CORS_ALLOW_ALL_ORIGINS', False) and origin.decode() not in settings.CORS_ALLOWED_ORIGINS:
+        return []
+    return [(b'access-control-allow-origin', origin), (b'vary', b'origin')]
+
+
+class KeepAlive:
+    """
+    Writes a comment to every open stream each SSE_KEEPALIVE_INTERVAL seconds so proxies don't
+    drop idle ones. The task runs while there are streams and restarts with the next one.
+    """
+
+    def __init__(self):
+        self.streams = set()
+        self.task = None
+
+    def add(self, stream):
+        self.streams.add(stream)
+        loop = asyncio.get_running_loop()
+        if self.task is None or self.task.done() or self.task.get_loop() is not loop:
+            self.task = loop.create_task(self.run())
+
+    def discard(self, stream):
+        self.streams.discard(stream)
+
+    async def run(self):
+        while self.streams:
+            await asyncio.sleep(settings.SSE_KEEPALIVE_INTERVAL)
+            streams = list(self.streams)
+            results = await asyncio.gather(
+                *(stream.send_body(KEEPALIVE, more_body=True) for stream in streams), return_exceptions=True
+            )
+            for stream, result in zip(streams, results):
+                if isinstance(result, Exception):
+                    logger.info(f"Dropping SSE stream after failed keep-alive: {result}")
+                    self.streams.discard(stream)
+
+
+keepalive = KeepAlive()
+
+
+class NotificationStreamConsumer(AsyncHttpConsumer):
+    async def http_request(self, message):
+        # The stream stays open after the request, unlike AsyncHttpConsumer.handle()
+        if message.get('more_body'):
+            return
+
+        cors = cors_headers(self.scope)
+        method = self.scope.get('method', 'GET')
+        if method == 'OPTIONS':
+            await self.send_response(204, b'', headers=cors + PREFLIGHT_HEADERS + [(b'allow', ALLOWED_METHODS)])
+            raise StopConsumer()
+        if method != 'GET':
+            await self.send_response(405, b'', headers=cors + [(b'allow', ALLOWED_METHODS)])
+            raise StopConsumer()
+
+        user, _, code = await authenticate_scope(self.scope)
+        if user is None:
+            status = 403 if code == CLOSE_FORBIDDEN else 401
+            await self.send_response(status, b'', headers=cors + [(b'content-type', b'text/plain')])
+            raise StopConsumer()
+
+        self.user = user
+        self.groups = [user_group(user.id), f"role_{user.role}"]
+        for group in self.groups:
+            await self.channel_layer.group_add(group, self.channel_name)
+
+        await self.send_headers(headers=STREAM_HEADERS + cors)
+        await self.send_body(f'retry: {settings.SSE_RETRY}\n\n'.encode(), more_body=True)
+        await self.replay_missed_events()
+        keepalive.add(self)
+
+    async def replay_missed_events(self):
+        """
+        Resend what came after Last-Event-ID. A truncated replay is announced first so the
+        client reloads the order list once.
+        """
+        after = last_event_id(self.scope)
+        if after is None:
+            return
+
+        events, truncated = await database_sync_to_async(missed_events)(self.user.id, after)
+        body = format_event({'type': 'resync', 'last_event_id': after}) if truncated else b''
+        body += b''.join(format_event(event, event['event_id']) for event in events)
+        if body:
+            await self.send_body(body, more_body=True)
+
+    async def disconnect(self):
+        keepalive.discard(self)
+        for group in getattr(self, 'groups', []):
+            await self.channel_layer.group_discard(group, self.channel_name)
+
+    async def send_event(self, event):
+        await self.send_body(format_event(event, event.get('event_id')), more_body=True)
+
+    async def order_notification(self, event):
+        await self.send_event(event)
+
+    async def payment_notification(self, event):
+        await self.send_event(event)
+
+    async def status_update(self, event):
+        await self.send_event(event)
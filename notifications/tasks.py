@@ -0,0 +1,38 @@
+from celery import shared_task
+import logging
+
+logger = logging.getLogger(__name__)
+
+@shared_task
+def relay_notification_outbox(batch_size=500, max_batches=20):
+    """
+    Deliver pending outbox notifications to the channel layer
+    """
+    try:
+        from notifications.outbox import relay_pending
+        
+        result = relay_pending(batch_size=batch_size, max_batches=max_batches)
+        
+        if result.delivered or result.failed:
+            logger.info(f"Relayed {result.delivered} notifications, {result.failed} failed")
+        return f"Relayed {result.delivered} notifications, {result.failed} failed"
+    
+    except Exception as e:
+        logger.error(f"Error relaying notifications: {e}")
+        return f"Error: {e}"
+
+@shared_task
+def prune_notification_outbox():
+    """
+    Delete delivered notifications past the replay retention window
+    """
+    try:
+        from notifications.outbox import prune_outbox
+        
+        deleted = prune_outbox()
+        logger.info(f"Pruned {deleted} delivered notifications")
+        return f"Pruned {deleted} delivered notifications"
+    
+    except Exception as e:
+        logger.error(f"Error pruning notifications: {e}")
+        return f"Error: {e}"
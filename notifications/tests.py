@@ -0,0 +1,555 @@
+import asyncio
+import io
+import json
+import os
+from datetime import timedelta
+from django.core.management import call_command
+from django.db import transaction
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APITestCase, APIClient
+from rest_framework import status
+from asgiref.sync import async_to_sync
+from asgiref.testing import ApplicationCommunicator
+from channels.layers import get_channel_layer
+from channels.routing import URLRouter
+from accounts.authentication import VersionedRefreshToken
+from accounts.middleware import JWTAuthMiddlewareStack
+from accounts.models import User, WorkerProfile
+from accounts.presence import reset_presence
+from orders.routing import websocket_urlpatterns
+from services.models import Service, ServiceCategory
+from .models import OutboxMessage
+from .outbound import OutboundQueue, metrics
+from .outbox import missed_events, notify_user, notify_users, prune_outbox, relay_batch, relay_pending
+from .routing import http_urlpatterns
+from .sse import keepalive
+
+
+class FlakyChannelLayer:
+    """
+    Records sends and fails for the groups in failing_groups
+    """
+
+    def __init__(self, failing_groups=()):
+        self.failing_groups = set(failing_groups)
+        self.sent = []
+
+    async def group_send(self, group, message):
+        if group in self.failing_groups:
+            raise ConnectionError('Connection refused')
+        self.sent.append((group, message))
+
+
+@override_settings(CHANNEL_LAYERS={'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}})
+class OutboxRelayTest(TestCase):
+    def setUp(self):
+        self.client_user = User.objects.create_user(
+            username='client',
+            email='client@example.com',
+            password='clientpass123',
+            role='client'
+        )
+
+    def test_rolled_back_change_sends_nothing(self):
+        with self.assertRaises(RuntimeError):
+            with transaction.atomic():
+                notify_user(self.client_user.id, {'type': 'order_notification', 'order_id': 1})
+                raise RuntimeError('boom')
+        self.assertFalse(OutboxMessage.objects.exists())
+
+    def test_relay_delivers_to_channel_layer(self):
+        notify_users([1, 2], {'type': 'status_update', 'order_id': 7})
+        notify_user(1, {'type': 'status_update', 'order_id': 8})
+
+        async def join():
+            channel_layer = get_channel_layer()
+            channel = await channel_layer.new_channel()
+            await channel_layer.group_add('user_1', channel)
+            return channel_layer, channel
+
+        channel_layer, channel = async_to_sync(join)()
+        result = relay_pending(batch_size=2)
+        self.assertEqual(result, (3, 0))
+        self.assertFalse(OutboxMessage.objects.filter(delivered_at__isnull=True).exists())
+
+        async def receive_two():
+            return [await channel_layer.receive(channel), await channel_layer.receive(channel)]
+
+        self.assertEqual([message['order_id'] for message in async_to_sync(receive_two)()], [7, 8])
+
+    def test_failed_group_keeps_order_and_retries(self):
+        first = notify_user(1, {'type': 'status_update', 'order_id': 1})
+        notify_user(2, {'type': 'status_update', 'order_id': 2})
+        blocked = notify_user(1, {'type': 'status_update', 'order_id': 3})
+
+        channel_layer = FlakyChannelLayer(failing_groups={'user_1'})
+        self.assertEqual(relay_batch(channel_layer=channel_layer), (1, 1))
+        self.assertEqual(channel_layer.sent, [('user_2', {'type': 'status_update', 'order_id': 2, 'event_id': 2})])
+
+        first.refresh_from_db()
+        blocked.refresh_from_db()
+        self.assertIsNone(first.delivered_at)
+        self.assertEqual(first.attempts, 1)
+        self.assertIn('Connection refused', first.last_error)
+        self.assertEqual(blocked.attempts, 0)
+
+        channel_layer.failing_groups.clear()
+        self.assertEqual(relay_batch(channel_layer=channel_layer), (2, 0))
+        self.assertEqual([message['order_id'] for _, message in channel_layer.sent], [2, 1, 3])
+
+    @override_settings(NOTIFICATION_OUTBOX_MAX_ATTEMPTS=2)
+    def test_failing_message_dead_lettered(self):
+        poison = notify_user(1, {'type': 'status_update', 'order_id': 1})
+        blocked = notify_user(1, {'type': 'status_update', 'order_id': 2})
+        channel_layer = FlakyChannelLayer(failing_groups={'user_1'})
+
+        # Nothing went through: the layer is down, the attempt isn't counted
+        self.assertEqual(relay_batch(channel_layer=channel_layer), (0, 1))
+        poison.refresh_from_db()
+        self.assertEqual(poison.attempts, 0)
+
+        for order_id in (3, 4):
+            notify_user(2, {'type': 'status_update', 'order_id': order_id})
+            self.assertEqual(relay_batch(channel_layer=channel_layer), (1, 1))
+        poison.refresh_from_db()
+        self.assertEqual(poison.attempts, 2)
+        self.assertIsNotNone(poison.dead_at)
+
+        channel_layer.failing_groups.clear()
+        self.assertEqual(relay_batch(channel_layer=channel_layer), (1, 0))
+        blocked.refresh_from_db()
+        self.assertIsNotNone(blocked.delivered_at)
+        self.assertEqual(OutboxMessage.objects.filter(claimed_at__isnull=False).count(), 0)
+
+    def test_claimed_groups_skipped_until_claim_is_stale(self):
+        claimed = notify_user(1, {'type': 'status_update', 'order_id': 1})
+        later = notify_user(1, {'type': 'status_update', 'order_id': 2})
+        other = notify_user(2, {'type': 'status_update', 'order_id': 3})
+        OutboxMessage.objects.filter(id=claimed.id).update(claimed_by='other-relay', claimed_at=timezone.now())
+
+        channel_layer = FlakyChannelLayer()
+        self.assertEqual(relay_batch(channel_layer=channel_layer), (1, 0))
+        self.assertEqual([message['event_id'] for _, message in channel_layer.sent], [other.id])
+
+        OutboxMessage.objects.filter(id=claimed.id).update(claimed_at=timezone.now() - timedelta(minutes=5))
+        self.assertEqual(relay_batch(channel_layer=channel_layer), (2, 0))
+        self.assertEqual([message['event_id'] for _, message in channel_layer.sent], [other.id, claimed.id, later.id])
+
+    def test_relay_outbox_command(self):
+        notify_user(1, {'type': 'status_update', 'order_id': 1})
+
+        out = io.StringIO()
+        call_command('relay_outbox', once=True, stdout=out)
+        self.assertIn('Delivered 1 notifications', out.getvalue())
+
+
+class OutboxViewTest(APITestCase):
+    def setUp(self):
+        self.client = APIClient()
+
+        self.client_user = User.objects.create_user(
+            username='client',
+            email='client@example.com',
+            password='clientpass123',
+            role='client'
+        )
+
+        self.category = ServiceCategory.objects.create(
+            name='Web Development',
+            description='All web development services'
+        )
+
+        self.service = Service.objects.create(
+            name='WordPress Website',
+            description='Custom WordPress development',
+            base_price=500.00,
+            category=self.category,
+            duration_hours=40
+        )
+
+    @override_settings(CHANNEL_LAYERS={'default': {'BACKEND': 'channels_redis.core.RedisChannelLayer',
+                                                   'CONFIG': {'hosts': ['redis://127.0.0.1:1']}}},
+                       WORKER_PRESENCE='')
+    def test_order_created_without_channel_layer(self):
+        self.client.force_authenticate(user=self.client_user)
+
+        response = self.client.post(reverse('order-create'), {
+            'service': self.service.id,
+            'description': 'Need a business website',
+            'address': '123 Main St',
+            'scheduled_date': '2030-01-01T10:00:00Z',
+        })
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+        message = OutboxMessage.objects.get()
+        self.assertEqual(message.group, f'user_{self.client_user.id}')
+        self.assertEqual(message.payload['notification_type'], 'order_created')
+        self.assertIsNone(message.delivered_at)
+
+    @override_settings(WORKER_PRESENCE='memory')
+    def test_new_order_reaches_offline_workers(self):
+        worker = User.objects.create_user(
+            username='worker',
+            email='worker@example.com',
+            password='workerpass123',
+            role='worker'
+        )
+        WorkerProfile.objects.create(user=worker).specializations.add(self.service)
+        reset_presence()
+        self.addCleanup(reset_presence)
+        self.client.force_authenticate(user=self.client_user)
+
+        response = self.client.post(reverse('order-create'), {
+            'service': self.service.id,
+            'description': 'Need a business website',
+            'address': '123 Main St',
+            'scheduled_date': '2030-01-01T10:00:00Z',
+        })
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+        message = OutboxMessage.objects.get(group=f'user_{worker.id}')
+        self.assertEqual(message.payload['notification_type'], 'new_order_available')
+
+
+@override_settings(
+    CHANNEL_LAYERS={'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}},
+    WORKER_PRESENCE='',
+    NOTIFICATION_REPLAY_LIMIT=3
+)
+class NotificationReplayTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='client',
+            email='client@example.com',
+            password='clientpass123',
+            role='client'
+        )
+        self.access = str(VersionedRefreshToken.for_user(self.user).access_token)
+        self.application = JWTAuthMiddlewareStack(URLRouter(websocket_urlpatterns))
+    
+    def deliver(self, user_id, order_id):
+        message = notify_user(user_id, {'type': 'status_update', 'order_id': order_id})
+        OutboxMessage.objects.filter(id=message.id).update(delivered_at=timezone.now())
+        return message.id
+    
+    def connect_with(self, last_event_id):
+        async def connect():
+            communicator = ApplicationCommunicator(self.application, {
+                'type': 'websocket',
+                'path': '/ws/notifications/',
+                'query_string': f'token={self.access}&last_event_id={last_event_id}'.encode(),
+                'headers': [],
+                'subprotocols': [],
+            })
+            await communicator.send_input({'type': 'websocket.connect'})
+            await communicator.receive_output(1)
+            await communicator.receive_output(1)
+            replay = await communicator.receive_output(1)
+            await communicator.send_input({'type': 'websocket.disconnect', 'code': 1000})
+            await communicator.wait(1)
+            return json.loads(replay['text'])
+        
+        return async_to_sync(connect)()
+    
+    def test_missed_events_for_user_only(self):
+        seen = self.deliver(self.user.id, 1)
+        self.deliver(self.user.id + 1, 2)
+        missed = self.deliver(self.user.id, 3)
+        pending = notify_user(self.user.id, {'type': 'status_update', 'order_id': 4}).id
+        
+        events, truncated = missed_events(self.user.id, seen)
+        self.assertEqual(events, [
+            {'type': 'status_update', 'order_id': 3, 'event_id': missed},
+            {'type': 'status_update', 'order_id': 4, 'event_id': pending},
+        ])
+        self.assertFalse(truncated)
+    
+    def test_truncation_checks_the_users_own_events(self):
+        notify_user(self.user.id + 1, {'type': 'status_update', 'order_id': 1})
+        seen = self.deliver(self.user.id, 2)
+        self.deliver(self.user.id, 3)
+        kept = self.deliver(self.user.id, 4)
+        OutboxMessage.objects.filter(id__lte=seen + 1).exclude(delivered_at=None).update(
+            delivered_at=timezone.now() - timedelta(days=2)
+        )
+        self.assertEqual(prune_outbox(retention=86400), 2)
+        
+        # The other user's pending row is older, but this user's events after seen are gone
+        events, truncated = missed_events(self.user.id, seen)
+        self.assertEqual([event['event_id'] for event in events], [kept])
+        self.assertTrue(truncated)
+    
+    def test_replay_capped_and_pruned_events_truncate(self):
+        first = self.deliver(self.user.id, 1)
+        for order_id in range(2, 7):
+            self.deliver(self.user.id, order_id)
+        
+        events, truncated = missed_events(self.user.id, first)
+        self.assertEqual([event['order_id'] for event in events], [4, 5, 6])
+        self.assertTrue(truncated)
+        
+        OutboxMessage.objects.filter(id__lte=first + 2).update(delivered_at=timezone.now() - timedelta(days=2))
+        # SELECTs of the ids and prune marks, one mark INSERT and one DELETE per chunk, no rows loaded
+        with self.assertNumQueries(4):
+            self.assertEqual(prune_outbox(retention=86400, batch_size=10), 3)
+        events, truncated = missed_events(self.user.id, first)
+        self.assertEqual([event['order_id'] for event in events], [4, 5, 6])
+        self.assertTrue(truncated)
+        
+        events, truncated = missed_events(self.user.id, first + 3)
+        self.assertEqual([event['order_id'] for event in events], [5, 6])
+        self.assertFalse(truncated)
+    
+    def test_nothing_pruned_after_last_event_id_is_not_truncated(self):
+        other = self.deliver(self.user.id + 1, 1)
+        seen = self.deliver(self.user.id, 2)
+        OutboxMessage.objects.filter(id__lte=seen).update(delivered_at=timezone.now() - timedelta(days=2))
+        self.assertEqual(prune_outbox(retention=86400), 2)
+        missed = self.deliver(self.user.id, 3)
+        
+        # The client's own last event is gone, but nothing after it
+        events, truncated = missed_events(self.user.id, seen)
+        self.assertEqual([event['event_id'] for event in events], [missed])
+        self.assertFalse(truncated)
+        
+        # A user who never saw an event, or whose events were never pruned
+        self.assertEqual(missed_events(self.user.id + 2, 0), ([], False))
+        events, truncated = missed_events(self.user.id + 1, other)
+        self.assertFalse(truncated)
+        self.assertTrue(missed_events(self.user.id + 1, 0)[1])
+    
+    def test_consumer_replays_on_connect(self):
+        seen = self.deliver(self.user.id, 1)
+        missed = [self.deliver(self.user.id, 2), self.deliver(self.user.id, 3)]
+        
+        replay = self.connect_with(seen)
+        self.assertEqual(replay['type'], 'replay')
+        self.assertEqual([event['event_id'] for event in replay['events']], missed)
+        self.assertEqual(replay['last_event_id'], missed[-1])
+        self.assertFalse(replay['truncated'])
+
+
+@override_settings(
+    CHANNEL_LAYERS={'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}},
+    SSE_KEEPALIVE_INTERVAL=0.05
+)
+class NotificationStreamTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='client',
+            email='client@example.com',
+            password='clientpass123',
+            role='client'
+        )
+        self.access = str(VersionedRefreshToken.for_user(self.user).access_token)
+        self.application = URLRouter(http_urlpatterns)
+
+    def open_stream(self, query_string=b'', headers=(), method='GET'):
+        return ApplicationCommunicator(self.application, {
+            'type': 'http',
+            'method': method,
+            'path': '/sse/notifications/',
+            'query_string': query_string,
+            'headers': list(headers),
+        })
+
+    async def start(self, communicator):
+        await communicator.send_input({'type': 'http.request', 'body': b''})
+        start = await communicator.receive_output(1)
+        retry = await communicator.receive_output(1)
+        return start, retry
+
+    async def close(self, communicator):
+        await communicator.send_input({'type': 'http.disconnect'})
+        await communicator.wait(1)
+
+    def test_rejects_missing_and_bad_tokens(self):
+        async def request(query_string):
+            communicator = self.open_stream(query_string)
+            await communicator.send_input({'type': 'http.request', 'body': b''})
+            start = await communicator.receive_output(1)
+            await communicator.receive_output(1)
+            await communicator.wait(1)
+            return start['status']
+
+        self.assertEqual(async_to_sync(request)(b''), 401)
+        self.assertEqual(async_to_sync(request)(f'token={self.access[:-2]}xx'.encode()), 401)
+
+    def test_cors_preflight_and_methods(self):
+        origin = (b'origin', b'http://localhost:3000')
+
+        async def request(method, headers, query_string=b''):
+            communicator = self.open_stream(query_string, headers, method)
+            await communicator.send_input({'type': 'http.request', 'body': b''})
+            start = await communicator.receive_output(1)
+            if method == 'GET' and start['status'] == 200:
+                await communicator.receive_output(1)
+                await self.close(communicator)
+            else:
+                await communicator.receive_output(1)
+                await communicator.wait(1)
+            return start['status'], dict(start['headers'])
+
+        status, headers = async_to_sync(request)('OPTIONS', [origin])
+        self.assertEqual(status, 204)
+        self.assertEqual(headers[b'access-control-allow-origin'], b'http://localhost:3000')
+        self.assertIn(b'last-event-id', headers[b'access-control-allow-headers'])
+
+        status, headers = async_to_sync(request)('POST', [origin])
+        self.assertEqual(status, 405)
+        self.assertEqual(headers[b'allow'], b'GET, OPTIONS')
+
+        status, headers = async_to_sync(request)('GET', [origin], f'token={self.access}'.encode())
+        self.assertEqual(status, 200)
+        self.assertEqual(headers[b'access-control-allow-origin'], b'http://localhost:3000')
+
+        status, headers = async_to_sync(request)('GET', [(b'origin', b'https://evil.example')], b'')
+        self.assertEqual(status, 401)
+        self.assertNotIn(b'access-control-allow-origin', headers)
+
+    def test_streams_group_events_and_keepalives(self):
+        async def stream():
+            communicator = self.open_stream(f'token={self.access}'.encode())
+            start, retry = await self.start(communicator)
+            await get_channel_layer().group_send(
+                f'user_{self.user.id}', {'type': 'status_update', 'order_id': 5, 'event_id': 12}
+            )
+            event = await communicator.receive_output(1)
+            ping = await communicator.receive_output(1)
+            await self.close(communicator)
+            return start, retry, event, ping
+
+        start, retry, event, ping = async_to_sync(stream)()
+        self.assertEqual(start['status'], 200)
+        self.assertIn((b'content-type', b'text/event-stream'), start['headers'])
+        self.assertEqual(retry['body'], b'retry: 5000\n\n')
+        self.assertEqual(
+            event['body'],
+            b'id: 12\ndata: {"type": "status_update", "order_id": 5, "event_id": 12}\n\n'
+        )
+        self.assertTrue(event['more_body'])
+        self.assertEqual(ping['body'], b': keep-alive\n\n')
+        self.assertFalse(keepalive.streams)
+
+    @override_settings(NOTIFICATION_REPLAY_LIMIT=2)
+    def test_last_event_id_replays_missed_events(self):
+        ids = []
+        for order_id in range(1, 5):
+            message = notify_user(self.user.id, {'type': 'status_update', 'order_id': order_id})
+            ids.append(message.id)
+        OutboxMessage.objects.update(delivered_at=timezone.now())
+
+        async def reconnect(after):
+            communicator = self.open_stream(
+                f'token={self.access}'.encode(), headers=[(b'last-event-id', str(after).encode())]
+            )
+            await self.start(communicator)
+            replay = await communicator.receive_output(1)
+            await self.close(communicator)
+            return replay['body'].decode()
+
+        replay = async_to_sync(reconnect)(ids[1])
+        self.assertEqual(replay.count('data: '), 2)
+        self.assertTrue(replay.startswith(f'id: {ids[2]}\n'))
+        self.assertIn(f'id: {ids[3]}\n', replay)
+        self.assertNotIn('resync', replay)
+
+        replay = async_to_sync(reconnect)(ids[0])
+        self.assertTrue(replay.startswith(f'data: {{"type": "resync", "last_event_id": {ids[0]}}}\n\n'))
+        self.assertEqual(replay.count('id: '), 2)
+
+
+class OutboundQueueTest(SimpleTestCase):
+    def setUp(self):
+        metrics.reset()
+
+    def run_queue(self, puts, maxsize=10, timeout=30):
+        """
+        Queue messages while the first one is being sent, then let the client catch up.
+        Returns (put results, event ids sent).
+        """
+        async def run():
+            sent, release = [], asyncio.Event()
+
+            async def send(message):
+                await release.wait()
+                sent.append(message['event_id'])
+
+            queue = OutboundQueue(send, maxsize=maxsize, timeout=timeout)
+            results = [queue.put(message) for message in puts]
+            release.set()
+            if queue.writer:
+                await queue.writer
+            return results, sent
+
+        return async_to_sync(run)()
+
+    def test_status_updates_coalesce_per_order(self):
+        results, sent = self.run_queue([
+            {'type': 'status_update', 'order_id': 1, 'event_id': 1},
+            {'type': 'status_update', 'order_id': 2, 'event_id': 2},
+            {'type': 'payment_notification', 'order_id': 1, 'event_id': 3},
+            {'type': 'status_update', 'order_id': 1, 'event_id': 4},
+        ])
+        self.assertTrue(all(results))
+        self.assertEqual(sent, [2, 3, 4])
+        self.assertEqual(metrics.coalesced, 1)
+
+    def test_full_queue_drops_offers_then_reports_slow_consumer(self):
+        offer = {'type': 'order_notification', 'notification_type': 'new_order_available'}
+        payment = {'type': 'payment_notification', 'notification_type': 'payment_success'}
+        results, sent = self.run_queue([
+            dict(offer, event_id=1),
+            dict(payment, event_id=2),
+            dict(payment, event_id=3),
+            dict(offer, event_id=4),
+            dict(payment, event_id=5),
+            dict(payment, event_id=6),
+        ], maxsize=3)
+        self.assertEqual(results, [True, True, True, True, True, False])
+        self.assertEqual(sent, [2, 3, 5])
+        self.assertEqual(metrics.dropped, 2)
+        self.assertEqual(metrics.high_water, 3)
+
+    def test_message_waiting_too_long_reports_slow_consumer(self):
+        async def run():
+            queue = OutboundQueue(lambda message: asyncio.Event().wait(), timeout=0.05)
+            first = queue.put({'type': 'payment_notification', 'event_id': 1})
+            await asyncio.sleep(0.1)
+            second = queue.put({'type': 'payment_notification', 'event_id': 2})
+            snapshot = metrics.snapshot()
+            queue.close(slow=True)
+            return first, second, snapshot
+
+        first, second, snapshot = async_to_sync(run)()
+        self.assertTrue(first)
+        self.assertFalse(second)
+        self.assertEqual(snapshot['connections'], 1)
+        self.assertEqual(metrics.slow_consumers, 1)
+
+    def test_soak_disconnects_slow_consumers_only(self):
+        out = io.StringIO()
+        call_command(
+            'soak_websockets', consumers=50, rounds=60, interval=0.01, slow_delay=0.2, slow_timeout=0.1, stdout=out
+        )
+        self.assertIn('slow consumers disconnected: 10/10', out.getvalue())
+        self.assertIn('Fast consumers: 0 missing payments, 0 stale statuses, 0 disconnected', out.getvalue())
+
+
+class OutboundMetricsViewTest(APITestCase):
+    def test_admin_only(self):
+        admin = User.objects.create_user(username='admin', password='adminpass123', role='admin')
+        client_user = User.objects.create_user(username='client', password='clientpass123', role='client')
+
+        self.client.force_authenticate(user=client_user)
+        self.assertEqual(self.client.get(reverse('outbound-metrics')).status_code, status.HTTP_403_FORBIDDEN)
+
+        self.client.force_authenticate(user=admin)
+        response = self.client.get(reverse('outbound-metrics'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn('queued', response.data)
+        self.assertIn('slow_consumers', response.data)
+        self.assertEqual(response.data['scope'], 'process')
+        self.assertEqual(response.data['pid'], os.getpid())
@@ -0,0 +1,26 @@
+import os
+import socket
+from rest_framework.response import Response
+from rest_framework.views import APIView
+from drf_spectacular.utils import extend_schema
+from accounts.permissions import IsAdmin
+from .outbound import metrics
+
+@extend_schema(
+    summary="WebSocket outbound queue metrics",
+    description="Queue depth of the WebSocket connections held by the ASGI process that serves the request, "
+                "and how many messages it dropped, coalesced or lost to slow consumer disconnects since it "
+                "started. The counters are not aggregated across processes: `host` and `pid` say which one "
+                "answered, scrape every process to get the totals",
+    tags=["Notifications"]
+)
+class OutboundMetricsView(APIView):
+    permission_classes = [IsAdmin]
+    
+    def get(self, request):
+        return Response({
+            'scope': 'process',
+            'host': socket.gethostname(),
+            'pid': os.getpid(),
+            **metrics.snapshot()
+        })
@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Order, OrderStatus
+from .models import Order, OrderStatus, Review
 
 @admin.register(Order)
 class OrderAdmin(admin.ModelAdmin):
@@ -13,4 +13,11 @@ class OrderStatusAdmin(admin.ModelAdmin):
     list_display = ['order', 'status', 'created_by', 'created_at']
     list_filter = ['status', 'created_at']
     search_fields = ['order__id']
-    readonly_fields = ['created_at']
\ No newline at end of file
+    readonly_fields = ['created_at']
+
+@admin.register(Review)
+class ReviewAdmin(admin.ModelAdmin):
+    list_display = ['order', 'client', 'worker', 'rating', 'created_at']
+    list_filter = ['rating', 'created_at']
+    search_fields = ['order__id', 'worker__username', 'client__username']
+    readonly_fields = ['order', 'client', 'worker', 'rating', 'created_at']
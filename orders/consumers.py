@@ -1,18 +1,24 @@
 import json
-from channels.generic.websocket import AsyncWebsocketConsumer
+import time
+from urllib.parse import parse_qs
+from asgiref.sync import sync_to_async
 from channels.db import database_sync_to_async
-from django.contrib.auth import get_user_model
-from rest_framework_simplejwt.tokens import UntypedToken
-from rest_framework_simplejwt.exceptions import InvalidToken, TokenError
-from django.contrib.auth.models import AnonymousUser
+from channels.generic.websocket import AsyncWebsocketConsumer
+from django.conf import settings
+from accounts.presence import leave_connection, presence_groups, touch_connection, worker_service_ids
+from notifications.outbox import missed_events
+from notifications.outbound import OutboundQueue
 import logging
 
-User = get_user_model()
 logger = logging.getLogger(__name__)
 
+# Client fell too far behind, it should reconnect with last_event_id
+CLOSE_SLOW_CONSUMER = 4408
+
 class NotificationConsumer(AsyncWebsocketConsumer):
     async def connect(self):
-        self.user = await self.get_user_from_token()
+        # Set by JWTAuthMiddleware, which closes unauthenticated connections before we get here
+        self.user = self.scope.get('user')
         
         if self.user and self.user.is_authenticated:
             self.group_name = f"user_{self.user.id}"
@@ -21,19 +27,59 @@ class NotificationConsumer(AsyncWebsocketConsumer):
             self.role_group = f"role_{self.user.role}"
             await self.channel_layer.group_add(self.role_group, self.channel_name)
             
+            self.outbound = OutboundQueue(self.send_message)
             await self.accept()
+            await self.join_presence()
             await self.send(text_data=json.dumps({
                 'type': 'connection_established',
                 'message': 'Connected to notifications'
             }))
+            await self.replay_missed_events()
         else:
             await self.close()
 
     async def disconnect(self, close_code):
+        if hasattr(self, 'outbound'):
+            self.outbound.close()
         if hasattr(self, 'group_name'):
             await self.channel_layer.group_discard(self.group_name, self.channel_name)
         if hasattr(self, 'role_group'):
             await self.channel_layer.group_discard(self.role_group, self.channel_name)
+        if hasattr(self, 'presence_groups'):
+            await sync_to_async(leave_connection, thread_sensitive=False)(
+                self.user.id, self.channel_name, self.presence_groups
+            )
+
+    async def replay_missed_events(self):
+        """
+        Send everything after ?last_event_id= in one message. The group was joined first, so an
+        event may arrive both live and in the replay; clients drop repeated event_ids.
+        """
+        query = parse_qs(self.scope.get('query_string', b'').decode())
+        try:
+            last_event_id = int(query['last_event_id'][0])
+        except (KeyError, ValueError):
+            return
+        
+        events, truncated = await database_sync_to_async(missed_events)(self.user.id, last_event_id)
+        await self.send(text_data=json.dumps({
+            'type': 'replay',
+            'events': events,
+            'truncated': truncated,
+            'last_event_id': events[-1]['event_id'] if events else last_event_id
+        }))
+
+    async def join_presence(self):
+        # Specializations are read once, a change takes effect on the next connection
+        service_ids = await database_sync_to_async(worker_service_ids)(self.user.id) if self.user.role == 'worker' else []
+        self.presence_groups = presence_groups(self.user.id, self.user.role, service_ids)
+        await self.refresh_presence()
+
+    async def refresh_presence(self):
+        self.presence_refreshed = time.monotonic()
+        await sync_to_async(touch_connection, thread_sensitive=False)(
+            self.user.id, self.channel_name, self.presence_groups
+        )
 
     async def receive(self, text_data):
         try:
@@ -41,47 +87,37 @@ class NotificationConsumer(AsyncWebsocketConsumer):
             message_type = text_data_json.get('type')
             
             if message_type == 'ping':
-                await self.send(text_data=json.dumps({
+                # The heartbeat keeps presence alive, refreshed a few times per TTL at most
+                if hasattr(self, 'presence_groups') and (
+                    time.monotonic() - self.presence_refreshed >= settings.WORKER_PRESENCE_REFRESH_INTERVAL
+                ):
+                    await self.refresh_presence()
+                await self.queue_message({
                     'type': 'pong',
                     'timestamp': text_data_json.get('timestamp')
-                }))
+                })
         except json.JSONDecodeError:
             logger.error("Invalid JSON received")
 
 
+    async def send_message(self, message):
+        await self.send(text_data=json.dumps(message))
+
+    async def queue_message(self, message):
+        """
+        Hand the message to the outbound queue, closing the connection if the client can't keep up
+        """
+        if self.outbound.put(message):
+            return
+        logger.warning(f"Closing slow WebSocket of user {self.user.id} with {len(self.outbound)} queued messages")
+        self.outbound.close(slow=True)
+        await self.close(code=CLOSE_SLOW_CONSUMER)
+
     async def order_notification(self, event):
-        await self.send(text_data=json.dumps(event))
+        await self.queue_message(event)
 
     async def payment_notification(self, event):
-        await self.send(text_data=json.dumps(event))
+        await self.queue_message(event)
 
     async def status_update(self, event):
-        await self.send(text_data=json.dumps(event))
-
-    @database_sync_to_async
-    def get_user_from_token(self):
-        try:
-
-            token = None
-            query_string = self.scope.get('query_string', b'').decode()
-            if query_string:
-                for param in query_string.split('&'):
-                    key, value = param.split('=') if '=' in param else (param, '')
-                    if key == 'token':
-                        token = value
-                        break
-            
-            if not token:
-                return AnonymousUser()
-            
-            UntypedToken(token)
-            
-            from rest_framework_simplejwt.authentication import JWTAuthentication
-            jwt_auth = JWTAuthentication()
-            validated_token = jwt_auth.get_validated_token(token)
-            user = jwt_auth.get_user(validated_token)
-            
-            return user
-        except (InvalidToken, TokenError, Exception) as e:
-            logger.error(f"Token validation error: {e}")
-            return AnonymousUser()
\ No newline at end of file
+        await self.queue_message(event)
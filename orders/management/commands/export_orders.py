@@ -0,0 +1,14 @@
+from orders.models import Order
+from orders.views import ORDER_EXPORT_FIELDS
+from service_marketplace.export_command import ExportCommand
+
+
+class Command(ExportCommand):
+    help = 'Stream orders created in a date range as CSV or JSONL'
+    export_name = 'orders'
+
+    def get_queryset(self):
+        return Order.objects.order_by('id')
+
+    def get_fields(self):
+        return ORDER_EXPORT_FIELDS
@@ -0,0 +1,35 @@
+# Generated by Django 5.2.5 on 2026-10-19 01:54
+
+from django.db import migrations, models
+
+
+def set_existing_currency(apps, schema_editor):
+    # Every order before multi-currency was priced in USD
+    Order = apps.get_model('orders', 'Order')
+    Order.objects.filter(currency='').update(currency='USD')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0002_order_order_created_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='currency',
+            field=models.CharField(blank=True, choices=[('USD', 'US Dollar'), ('UZS', 'Uzbekistani Som'), ('EUR', 'Euro'), ('RUB', 'Russian Ruble')], max_length=3),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='fx_rate',
+            field=models.DecimalField(decimal_places=8, default=1, max_digits=20),
+        ),
+        migrations.AlterField(
+            model_name='order',
+            name='total_price',
+            field=models.DecimalField(decimal_places=2, max_digits=14),
+        ),
+        migrations.RunPython(set_existing_currency, migrations.RunPython.noop),
+    ]
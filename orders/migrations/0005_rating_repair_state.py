@@ -0,0 +1,20 @@
+# Generated by Django 5.2.5 on 2026-10-19 04:08
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0004_review'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RatingRepairState',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('cursor', models.BigIntegerField(default=0)),
+            ],
+        ),
+    ]
@@ -1,6 +1,9 @@
 from django.db import models
+from django.core.validators import MaxValueValidator, MinValueValidator
 from django.contrib.auth import get_user_model
 from services.models import Service
+from currencies.models import CURRENCY_CHOICES
+from currencies.rates import cross_rate, CENTS
 from decimal import Decimal
 
 User = get_user_model()
@@ -23,7 +26,10 @@ class Order(models.Model):
     scheduled_date = models.DateTimeField()
     
     quantity = models.PositiveIntegerField(default=1)
-    total_price = models.DecimalField(max_digits=10, decimal_places=2)
+    total_price = models.DecimalField(max_digits=14, decimal_places=2)
+    # Currency the client pays in, and the service->order rate used when pricing
+    currency = models.CharField(max_length=3, choices=CURRENCY_CHOICES, blank=True)
+    fx_rate = models.DecimalField(max_digits=20, decimal_places=8, default=1)
     
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
     
@@ -33,13 +39,20 @@ class Order(models.Model):
     
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['created_at'], name='order_created_idx'),
+        ]
     
     def __str__(self):
         return f"Order #{self.id} - {self.client.username} - {self.service.name}"
     
     def save(self, *args, **kwargs):
+        if not self.currency:
+            self.currency = self.service.currency
         if not self.total_price:
-            self.total_price = self.service.base_price * Decimal(str(self.quantity))
+            self.fx_rate = cross_rate(self.service.currency, self.currency)
+            price = Decimal(str(self.service.base_price)) * Decimal(str(self.quantity))
+            self.total_price = (price * self.fx_rate).quantize(CENTS)
         super().save(*args, **kwargs)
 
 class OrderStatus(models.Model):
@@ -54,4 +67,37 @@ class OrderStatus(models.Model):
         verbose_name_plural = "Order Statuses"
     
     def __str__(self):
-        return f"Order #{self.order.id} - {self.status}"
\ No newline at end of file
+        return f"Order #{self.order.id} - {self.status}"
+
+class Review(models.Model):
+    """
+    Client review of a completed order. Worker rating aggregates are kept up to date by orders.reviews.
+    """
+    order = models.OneToOneField(Order, on_delete=models.CASCADE, related_name='review')
+    client = models.ForeignKey(User, on_delete=models.CASCADE, related_name='reviews_given')
+    worker = models.ForeignKey(User, on_delete=models.CASCADE, related_name='reviews_received')
+    rating = models.PositiveSmallIntegerField(validators=[MinValueValidator(1), MaxValueValidator(5)])
+    comment = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['worker', 'created_at'], name='review_worker_created_idx'),
+        ]
+        constraints = [
+            models.CheckConstraint(condition=models.Q(rating__gte=1, rating__lte=5), name='review_rating_range'),
+        ]
+    
+    def __str__(self):
+        return f"Review for order #{self.order_id} - {self.rating}"
+
+
+class RatingRepairState(models.Model):
+    """
+    Single row: WorkerProfile pk after which repair_worker_ratings resumes, 0 to start over
+    """
+    cursor = models.BigIntegerField(default=0)
+    
+    def __str__(self):
+        return f"Rating repair resumes after profile {self.cursor}"
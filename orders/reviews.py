@@ -0,0 +1,101 @@
+"""
+Worker rating aggregates. Each review adds to WorkerProfile.rating_sum/rating_count in the
+same transaction as the insert, with the profile row locked, and WorkerProfile.rating holds the
+Bayesian-smoothed score (prior_weight * prior_mean + sum) / (prior_weight + count).
+repair_worker_ratings re-checks the aggregates against the reviews a chunk at a time.
+"""
+from decimal import Decimal, ROUND_HALF_UP
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Count, Sum
+from accounts.models import WorkerProfile
+from .models import Review, RatingRepairState
+
+
+class ReviewError(Exception):
+    pass
+
+
+def bayesian_score(rating_sum, rating_count):
+    """
+    Smoothed score in exact decimal arithmetic, so the write path and the repair always agree
+    """
+    prior = settings.WORKER_RATING_PRIOR
+    weight, mean = Decimal(str(prior['weight'])), Decimal(str(prior['mean']))
+    score = (weight * mean + rating_sum) / (weight + rating_count)
+    return score.quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
+
+
+def create_review(order, client, rating, comment=''):
+    """
+    Insert the review and fold it into the worker's aggregates atomically
+    """
+    if order.client_id != client.id:
+        raise ReviewError('Only the client who placed the order can review it')
+    if order.status != 'completed':
+        raise ReviewError('Only completed orders can be reviewed')
+    if not order.worker_id:
+        raise ReviewError('Order has no assigned worker')
+
+    try:
+        with transaction.atomic():
+            review = Review.objects.create(
+                order=order, client=client, worker_id=order.worker_id, rating=rating, comment=comment
+            )
+            profile, _ = WorkerProfile.objects.select_for_update().only(
+                'pk', 'rating_sum', 'rating_count'
+            ).get_or_create(user_id=order.worker_id)
+            rating_sum, rating_count = profile.rating_sum + rating, profile.rating_count + 1
+            WorkerProfile.objects.filter(pk=profile.pk).update(
+                rating_sum=rating_sum, rating_count=rating_count, rating=bayesian_score(rating_sum, rating_count)
+            )
+    except IntegrityError:
+        raise ReviewError('Order has already been reviewed')
+    return review
+
+
+def repair_worker_ratings(chunk_size=None, max_chunks=None):
+    """
+    Compare aggregates with the reviews for the next `max_chunks` chunks of worker profiles,
+    resuming where the previous run stopped, and fix any that drifted.
+    Returns (profiles checked, profiles repaired).
+    """
+    chunk_size = chunk_size or settings.WORKER_RATING_REPAIR_CHUNK_SIZE
+    max_chunks = max_chunks or settings.WORKER_RATING_REPAIR_CHUNKS
+    # Kept in the database: every worker process sees it and it survives restarts
+    state, _ = RatingRepairState.objects.get_or_create(pk=1)
+    cursor = state.cursor
+    checked = repaired = 0
+
+    for _ in range(max_chunks):
+        profiles = list(
+            WorkerProfile.objects.filter(pk__gt=cursor).order_by('pk')
+            .only('pk', 'user_id', 'rating', 'rating_sum', 'rating_count')[:chunk_size]
+        )
+        if not profiles:
+            cursor = 0  # sweep finished, start over next run
+            break
+
+        totals = {
+            row['worker_id']: (row['total'], row['count'])
+            for row in Review.objects.filter(worker_id__in=[profile.user_id for profile in profiles])
+            .values('worker_id').annotate(total=Sum('rating'), count=Count('id'))
+        }
+        drifted = 0
+        for profile in profiles:
+            rating_sum, rating_count = totals.get(profile.user_id, (0, 0))
+            rating = bayesian_score(rating_sum, rating_count)
+            if (profile.rating_sum, profile.rating_count, profile.rating) == (rating_sum, rating_count, rating):
+                continue
+            # Conditional on the values read, so a review landing meanwhile isn't overwritten
+            drifted += WorkerProfile.objects.filter(
+                pk=profile.pk, rating_sum=profile.rating_sum, rating_count=profile.rating_count
+            ).update(rating_sum=rating_sum, rating_count=rating_count, rating=rating)
+
+        checked += len(profiles)
+        repaired += drifted
+        cursor = profiles[-1].pk
+
+    state.cursor = cursor
+    state.save(update_fields=['cursor'])
+    return checked, repaired
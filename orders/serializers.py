@@ -1,5 +1,5 @@
 from rest_framework import serializers
-from .models import Order, OrderStatus
+from .models import Order, OrderStatus, Review
 from services.serializers import ServiceSerializer
 from accounts.serializers import UserSerializer
 
@@ -20,7 +20,7 @@ class OrderSerializer(serializers.ModelSerializer):
     class Meta:
         model = Order
         fields = '__all__'
-        read_only_fields = ['total_price', 'client']
+        read_only_fields = ['total_price', 'fx_rate', 'currency', 'client']
     
     def create(self, validated_data):
         validated_data['client'] = self.context['request'].user
@@ -29,8 +29,14 @@ class OrderSerializer(serializers.ModelSerializer):
 class OrderCreateSerializer(serializers.ModelSerializer):
     class Meta:
         model = Order
-        fields = ['service', 'description', 'address', 'scheduled_date', 'quantity']
+        fields = ['service', 'description', 'address', 'scheduled_date', 'quantity', 'currency']
     
     def create(self, validated_data):
         validated_data['client'] = self.context['request'].user
-        return super().create(validated_data)
\ No newline at end of file
+        return super().create(validated_data)
+
+class ReviewSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Review
+        fields = ['id', 'order', 'client', 'worker', 'rating', 'comment', 'created_at']
+        read_only_fields = ['id', 'order', 'client', 'worker', 'created_at']
@@ -2,6 +2,7 @@ from celery import shared_task
 from django.utils import timezone
 from django.contrib.auth import get_user_model
 from .models import Order, OrderStatus
+from accounts.presence import online_worker_ids
 import logging
 
 User = get_user_model()
@@ -47,11 +48,18 @@ def auto_assign_orders():
             available_workers = User.objects.filter(
                 role='worker',
                 is_active=True,
-                workerprofile__is_verified=True
+                worker_profile__is_available=True,
+                worker_profile__specializations=order.service
             )
-            
-            if available_workers.exists():
+            # Prefer workers who are connected right now
+            online = online_worker_ids(order.service_id)
+            worker = None
+            if online:
+                worker = available_workers.filter(id__in=online).first()
+            if worker is None:
                 worker = available_workers.first()
+            
+            if worker is not None:
                 order.worker = worker
                 order.status = 'assigned'
                 order.save()
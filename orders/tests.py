@@ -1,12 +1,20 @@
+import io
+import json
+import os
+import tempfile
+from decimal import Decimal
+from django.core.cache import cache
 from django.test import TestCase
+from django.core.management import call_command
 from django.contrib.auth import get_user_model
 from django.urls import reverse
 from rest_framework.test import APITestCase, APIClient
 from rest_framework import status
 from rest_framework_simplejwt.tokens import RefreshToken
-from .models import Order, OrderStatus
+from .models import Order, OrderStatus, RatingRepairState, Review
+from .reviews import ReviewError, bayesian_score, create_review, repair_worker_ratings
 from services.models import Service, ServiceCategory
-from accounts.models import User
+from accounts.models import User, WorkerProfile
 
 User = get_user_model()
 
@@ -221,6 +229,18 @@ class OrderAPITest(APITestCase):
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertEqual(response.data['description'], 'Need a business website')
     
+    def test_order_currency_is_read_only(self):
+        token = self.get_jwt_token(self.client_user)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
+        
+        url = reverse('order-detail', kwargs={'pk': self.order.pk})
+        response = self.client.patch(url, {'currency': 'UZS'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.currency, 'USD')
+        self.assertEqual(self.order.total_price, Decimal('500.00'))
+    
     def test_order_assign_worker(self):
         token = self.get_jwt_token(self.worker_user)
         self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
@@ -304,3 +324,204 @@ class OrderStatusAPITest(APITestCase):
         }
         response = self.client.post(url, data)
         self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+class OrderExportTest(APITestCase):
+    def setUp(self):
+        self.client = APIClient()
+        
+        self.client_user = User.objects.create_user(
+            username='client',
+            email='client@example.com',
+            password='clientpass123',
+            role='client'
+        )
+        
+        self.admin_user = User.objects.create_user(
+            username='admin',
+            email='admin@example.com',
+            password='adminpass123',
+            role='admin'
+        )
+        
+        self.category = ServiceCategory.objects.create(
+            name='Web Development',
+            description='All web development services'
+        )
+        
+        self.service = Service.objects.create(
+            name='WordPress Website',
+            description='Custom WordPress development',
+            base_price=500.00,
+            category=self.category,
+            duration_hours=40
+        )
+        
+        self.order = Order.objects.create(
+            client=self.client_user,
+            service=self.service,
+            description='Need a business website',
+            address='123 Main St',
+            scheduled_date='2024-01-01 10:00:00',
+            total_price=500.00
+        )
+    
+    def get_jwt_token(self, user):
+        refresh = RefreshToken.for_user(user)
+        return str(refresh.access_token)
+    
+    def test_order_export_admin(self):
+        token = self.get_jwt_token(self.admin_user)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
+        
+        response = self.client.get(reverse('order-export'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        content = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(content[0].split(',')[0], 'id')
+        self.assertEqual(len(content), 2)
+    
+    def test_export_orders_command(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            output_path = os.path.join(tmpdir, 'orders.jsonl')
+            call_command('export_orders', format='jsonl', output=output_path, stderr=io.StringIO())
+            
+            with open(output_path) as output:
+                rows = [json.loads(line) for line in output]
+        self.assertEqual(rows[0]['id'], self.order.id)
+        self.assertEqual(rows[0]['total_price'], '500.00')
+
+class ReviewRatingTest(APITestCase):
+    def setUp(self):
+        self.client = APIClient()
+        cache.clear()
+        
+        self.client_user = User.objects.create_user(
+            username='client',
+            email='client@example.com',
+            password='clientpass123',
+            role='client'
+        )
+        
+        self.worker_user = User.objects.create_user(
+            username='worker',
+            email='worker@example.com',
+            password='workerpass123',
+            role='worker'
+        )
+        
+        self.category = ServiceCategory.objects.create(
+            name='Web Development',
+            description='All web development services'
+        )
+        
+        self.service = Service.objects.create(
+            name='WordPress Website',
+            description='Custom WordPress development',
+            base_price=500.00,
+            category=self.category,
+            duration_hours=40
+        )
+    
+    def create_order(self, status='completed'):
+        return Order.objects.create(
+            client=self.client_user,
+            worker=self.worker_user,
+            service=self.service,
+            description='Need a business website',
+            address='123 Main St',
+            scheduled_date='2024-01-01 10:00:00',
+            total_price=500.00,
+            status=status
+        )
+    
+    def get_jwt_token(self, user):
+        refresh = RefreshToken.for_user(user)
+        return str(refresh.access_token)
+    
+    def test_reviews_update_aggregates_incrementally(self):
+        for rating in [5, 3, 4]:
+            create_review(self.create_order(), self.client_user, rating)
+        
+        profile = WorkerProfile.objects.get(user=self.worker_user)
+        self.assertEqual(profile.rating_sum, 12)
+        self.assertEqual(profile.rating_count, 3)
+        # (5 * 4.0 + 12) / (5 + 3)
+        self.assertEqual(profile.rating, Decimal('4.00'))
+        self.assertEqual(profile.rating, bayesian_score(12, 3))
+    
+    def test_score_is_smoothed_towards_prior(self):
+        create_review(self.create_order(), self.client_user, 1)
+        
+        profile = WorkerProfile.objects.get(user=self.worker_user)
+        self.assertEqual(profile.rating, Decimal('3.50'))
+    
+    def test_new_worker_starts_at_prior_mean(self):
+        profile = WorkerProfile.objects.create(user=self.worker_user)
+        profile.refresh_from_db()
+        self.assertEqual(profile.rating, bayesian_score(0, 0))
+        self.assertEqual(profile.rating, Decimal('4.00'))
+        # Nothing to repair for a worker without reviews
+        self.assertEqual(repair_worker_ratings(chunk_size=10, max_chunks=1), (1, 0))
+    
+    def test_only_completed_orders_can_be_reviewed(self):
+        with self.assertRaises(ReviewError):
+            create_review(self.create_order(status='in_progress'), self.client_user, 5)
+        self.assertFalse(Review.objects.exists())
+    
+    def test_order_can_only_be_reviewed_once(self):
+        order = self.create_order()
+        create_review(order, self.client_user, 5)
+        
+        with self.assertRaises(ReviewError):
+            create_review(order, self.client_user, 1)
+        profile = WorkerProfile.objects.get(user=self.worker_user)
+        self.assertEqual((profile.rating_sum, profile.rating_count), (5, 1))
+    
+    def test_review_api(self):
+        order = self.create_order()
+        token = self.get_jwt_token(self.client_user)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
+        
+        url = reverse('order-review', kwargs={'order_id': order.id})
+        response = self.client.post(url, {'rating': 5, 'comment': 'Great work'})
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data['worker'], self.worker_user.id)
+        
+        response = self.client.post(url, {'rating': 4})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        
+        response = self.client.post(
+            reverse('order-review', kwargs={'order_id': self.create_order().id}), {'rating': 6}
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        
+        response = self.client.get(reverse('worker-reviews', kwargs={'worker_id': self.worker_user.id}))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['count'], 1)
+    
+    def test_scores_are_exact_decimals(self):
+        # (5 * 4.0 + 147) / (5 + 35) = 4.175, which a float holds as 4.17499...
+        for rating in [5] * 7 + [4] * 28:
+            create_review(self.create_order(), self.client_user, rating)
+        
+        profile = WorkerProfile.objects.get(user=self.worker_user)
+        self.assertEqual((profile.rating_sum, profile.rating_count), (147, 35))
+        self.assertEqual(profile.rating, Decimal('4.18'))
+        self.assertEqual(bayesian_score(147, 35), Decimal('4.18'))
+        self.assertEqual(repair_worker_ratings(chunk_size=10, max_chunks=1), (1, 0))
+    
+    def test_repair_fixes_drifted_aggregates(self):
+        create_review(self.create_order(), self.client_user, 5)
+        create_review(self.create_order(), self.client_user, 2)
+        WorkerProfile.objects.filter(user=self.worker_user).update(rating_sum=40, rating_count=9, rating=Decimal('1.00'))
+        
+        checked, repaired = repair_worker_ratings(chunk_size=1, max_chunks=5)
+        self.assertEqual((checked, repaired), (1, 1))
+        profile = WorkerProfile.objects.get(user=self.worker_user)
+        self.assertEqual((profile.rating_sum, profile.rating_count), (7, 2))
+        self.assertEqual(profile.rating, bayesian_score(7, 2))
+        
+        self.assertEqual(repair_worker_ratings(chunk_size=1, max_chunks=5), (1, 0))
+        
+        # The next run resumes after the last profile checked
+        repair_worker_ratings(chunk_size=1, max_chunks=1)
+        self.assertEqual(RatingRepairState.objects.get().cursor, profile.pk)
@@ -1,13 +1,16 @@
 from django.urls import path
 from .views import (
     OrderCreateView, OrderListView, OrderDetailView,
-    OrderStatusUpdateView, AssignWorkerView
+    OrderStatusUpdateView, AssignWorkerView, OrderExportView, OrderReviewView, WorkerReviewListView
 )
 
 urlpatterns = [
     path('', OrderListView.as_view(), name='order-list'),
     path('create/', OrderCreateView.as_view(), name='order-create'),
+    path('export/', OrderExportView.as_view(), name='order-export'),
     path('<int:pk>/', OrderDetailView.as_view(), name='order-detail'),
     path('<int:order_id>/status/', OrderStatusUpdateView.as_view(), name='order-status-update'),
     path('<int:order_id>/assign/', AssignWorkerView.as_view(), name='assign-worker'),
+    path('<int:order_id>/review/', OrderReviewView.as_view(), name='order-review'),
+    path('reviews/worker/<int:worker_id>/', WorkerReviewListView.as_view(), name='worker-reviews'),
 ]
\ No newline at end of file
@@ -1,55 +1,57 @@
 from rest_framework import generics, status, permissions
 from rest_framework.response import Response
 from rest_framework.views import APIView
+from django.db import transaction
 from django.db.models import Q
-from channels.layers import get_channel_layer
-from asgiref.sync import async_to_sync
 from drf_spectacular.utils import extend_schema, extend_schema_view
-from .models import Order, OrderStatus
-from .serializers import OrderSerializer, OrderCreateSerializer, OrderStatusSerializer
+from .models import Order, OrderStatus, Review
+from .reviews import ReviewError, create_review
+from .serializers import OrderSerializer, OrderCreateSerializer, OrderStatusSerializer, ReviewSerializer
 from accounts.permissions import IsAdmin, IsClient, IsWorker
+from notifications.outbox import notify_user, notify_users
 from services.models import Service
+from ledger.posting import record_worker_payout
+from service_marketplace.exports import ExportError, parse_date_range, filter_created_range, export_response
 import logging
 
 logger = logging.getLogger(__name__)
 
+ORDER_EXPORT_FIELDS = [
+    'id', 'client_id', 'worker_id', 'service_id', 'status', 'quantity', 'total_price', 'currency',
+    'address', 'scheduled_date', 'created_at', 'completed_at',
+]
+
 class OrderCreateView(generics.CreateAPIView):
     serializer_class = OrderCreateSerializer
     permission_classes = [IsClient]
     
     def perform_create(self, serializer):
-        order = serializer.save()
-        
-        self.send_order_notification(order, 'order_created')
+        with transaction.atomic():
+            order = serializer.save()
+            self.send_order_notification(order, 'order_created')
         
         return order
     
     def send_order_notification(self, order, notification_type):
-        channel_layer = get_channel_layer()
-        
-        async_to_sync(channel_layer.group_send)(
-            f"user_{order.client.id}",
-            {
-                'type': 'order_notification',
-                'notification_type': notification_type,
-                'order_id': order.id,
-                'message': f'Order #{order.id} has been created successfully',
-                'data': OrderSerializer(order).data
-            }
-        )
+        # Queued in the outbox, the relay delivers them after commit
+        data = OrderSerializer(order).data
+        notify_user(order.client_id, {
+            'type': 'order_notification',
+            'notification_type': notification_type,
+            'order_id': order.id,
+            'message': f'Order #{order.id} has been created successfully',
+            'data': data
+        })
         
+        # Every available worker gets it, offline ones from the outbox when they reconnect
         workers = order.service.workers.filter(is_available=True)
-        for worker in workers:
-            async_to_sync(channel_layer.group_send)(
-                f"user_{worker.user.id}",
-                {
-                    'type': 'order_notification',
-                    'notification_type': 'new_order_available',
-                    'order_id': order.id,
-                    'message': f'New order available: {order.service.name}',
-                    'data': OrderSerializer(order).data
-                }
-            )
+        notify_users(workers.values_list('user_id', flat=True), {
+            'type': 'order_notification',
+            'notification_type': 'new_order_available',
+            'order_id': order.id,
+            'message': f'New order available: {order.service.name}',
+            'data': data
+        })
 
 class OrderListView(generics.ListAPIView):
     serializer_class = OrderSerializer
@@ -100,17 +102,23 @@ class OrderStatusUpdateView(APIView):
             elif request.user.role == 'worker' and order.worker != request.user:
                 return Response({'error': 'Permission denied'}, status=status.HTTP_403_FORBIDDEN)
             
-            order.status = new_status
-            order.save()
-            
-            OrderStatus.objects.create(
-                order=order,
-                status=new_status,
-                comment=comment,
-                created_by=request.user
-            )
-            
-            self.send_status_update_notification(order, new_status, comment)
+            with transaction.atomic():
+                order.status = new_status
+                order.save()
+                
+                OrderStatus.objects.create(
+                    order=order,
+                    status=new_status,
+                    comment=comment,
+                    created_by=request.user
+                )
+                
+                # Release escrowed funds to the worker in the same transaction
+                payment = getattr(order, 'payment', None)
+                if new_status == 'completed' and order.worker and payment and payment.status == 'completed':
+                    record_worker_payout(payment, order.worker)
+                
+                self.send_status_update_notification(order, new_status, comment)
             
             return Response(OrderSerializer(order).data)
             
@@ -118,30 +126,14 @@ class OrderStatusUpdateView(APIView):
             return Response({'error': 'Order not found'}, status=status.HTTP_404_NOT_FOUND)
     
     def send_status_update_notification(self, order, new_status, comment):
-        channel_layer = get_channel_layer()
-        
-        async_to_sync(channel_layer.group_send)(
-            f"user_{order.client.id}",
-            {
-                'type': 'status_update',
-                'order_id': order.id,
-                'new_status': new_status,
-                'comment': comment,
-                'message': f'Order #{order.id} status updated to {new_status}'
-            }
-        )
-        
-        if order.worker:
-            async_to_sync(channel_layer.group_send)(
-                f"user_{order.worker.id}",
-                {
-                    'type': 'status_update',
-                    'order_id': order.id,
-                    'new_status': new_status,
-                    'comment': comment,
-                    'message': f'Order #{order.id} status updated to {new_status}'
-                }
-            )
+        user_ids = [order.client_id] + ([order.worker_id] if order.worker_id else [])
+        notify_users(user_ids, {
+            'type': 'status_update',
+            'order_id': order.id,
+            'new_status': new_status,
+            'comment': comment,
+            'message': f'Order #{order.id} status updated to {new_status}'
+        })
 
 class AssignWorkerView(APIView):
     permission_classes = [IsWorker]
@@ -159,30 +151,78 @@ class AssignWorkerView(APIView):
                 return Response({'error': 'Order already assigned'}, 
                               status=status.HTTP_400_BAD_REQUEST)
             
-            order.worker = request.user
-            order.status = 'in_progress'
-            order.save()
-            
-            OrderStatus.objects.create(
-                order=order,
-                status='in_progress',
-                comment=f'Assigned to {request.user.get_full_name() or request.user.username}',
-                created_by=request.user
-            )
-            
-            channel_layer = get_channel_layer()
-            async_to_sync(channel_layer.group_send)(
-                f"user_{order.client.id}",
-                {
+            with transaction.atomic():
+                order.worker = request.user
+                order.status = 'in_progress'
+                order.save()
+                
+                OrderStatus.objects.create(
+                    order=order,
+                    status='in_progress',
+                    comment=f'Assigned to {request.user.get_full_name() or request.user.username}',
+                    created_by=request.user
+                )
+                
+                notify_user(order.client_id, {
                     'type': 'order_notification',
                     'notification_type': 'worker_assigned',
                     'order_id': order.id,
                     'message': f'Worker assigned to your order #{order.id}',
                     'worker_name': request.user.get_full_name() or request.user.username
-                }
-            )
+                })
             
             return Response(OrderSerializer(order).data)
             
         except Order.DoesNotExist:
-            return Response({'error': 'Order not found'}, status=status.HTTP_404_NOT_FOUND)
\ No newline at end of file
+            return Response({'error': 'Order not found'}, status=status.HTTP_404_NOT_FOUND)
+
+class OrderExportView(APIView):
+    """
+    Stream orders created in a date range as CSV or JSONL, optionally gzipped
+    """
+    permission_classes = [IsAdmin]
+    
+    def get(self, request):
+        params = request.query_params
+        try:
+            start_at, end_at = parse_date_range(params.get('start'), params.get('end'))
+            queryset = filter_created_range(Order.objects.order_by('id'), start_at, end_at)
+            return export_response(
+                queryset,
+                ORDER_EXPORT_FIELDS,
+                'orders',
+                export_format=params.get('export_format', 'csv'),
+                compress=params.get('gzip') in ('1', 'true')
+            )
+        except ExportError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+class OrderReviewView(APIView):
+    """
+    Review a completed order. The worker's rating is updated in the same transaction.
+    """
+    permission_classes = [IsClient]
+    
+    def post(self, request, order_id):
+        try:
+            order = Order.objects.get(id=order_id, client=request.user)
+        except Order.DoesNotExist:
+            return Response({'error': 'Order not found'}, status=status.HTTP_404_NOT_FOUND)
+        
+        serializer = ReviewSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        
+        try:
+            review = create_review(order, request.user, **serializer.validated_data)
+        except ReviewError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        
+        return Response(ReviewSerializer(review).data, status=status.HTTP_201_CREATED)
+
+class WorkerReviewListView(generics.ListAPIView):
+    serializer_class = ReviewSerializer
+    permission_classes = [permissions.IsAuthenticated]
+    
+    def get_queryset(self):
+        return Review.objects.filter(worker_id=self.kwargs['worker_id'])
@@ -1,9 +1,64 @@
-from django.contrib import admin
-from .models import Payment
+from django.contrib import admin, messages
+from .models import (
+    Payment, PaymentGatewayEvent, PaymentRetry, PaymentDailyRollup, PaymentWebhookEvent, PaymentRefundJob
+)
+from .refunds import create_refund_job
+from .tasks import process_refund_job
+
+class PaymentGatewayEventInline(admin.TabularInline):
+    model = PaymentGatewayEvent
+    fields = ['event_type', 'data', 'created_at']
+    readonly_fields = ['event_type', 'data', 'created_at']
+    extra = 0
+    can_delete = False
+
+    def has_add_permission(self, request, obj=None):
+        return False
 
 @admin.register(Payment)
 class PaymentAdmin(admin.ModelAdmin):
-    list_display = ['id', 'user', 'amount', 'payment_method', 'status', 'created_at']
-    list_filter = ['status', 'payment_method', 'created_at']
+    list_display = ['id', 'user', 'amount', 'payment_method', 'status', 'fraud_action', 'created_at']
+    list_filter = ['status', 'payment_method', 'fraud_action', 'created_at']
     search_fields = ['id', 'user__username', 'gateway_transaction_id']
-    readonly_fields = ['id', 'gateway_transaction_id', 'gateway_response', 'created_at', 'updated_at']
\ No newline at end of file
+    readonly_fields = ['id', 'gateway_transaction_id', 'error_code', 'fee', 'refund_id', 'fraud_score', 'fraud_action',
+                       'created_at', 'updated_at']
+    inlines = [PaymentGatewayEventInline]
+    actions = ['refund_selected']
+
+    @admin.action(description='Refund selected payments (background job)')
+    def refund_selected(self, request, queryset):
+        payment_ids = list(queryset.filter(status='completed').values_list('id', flat=True))
+        if not payment_ids:
+            self.message_user(request, 'No completed payments selected.', messages.WARNING)
+            return
+        job = create_refund_job(payment_ids, requested_by=request.user)
+        process_refund_job.delay(str(job.id))
+        self.message_user(request, f'Refund job {job.id} queued for {job.total} payments.', messages.SUCCESS)
+
+@admin.register(PaymentRetry)
+class PaymentRetryAdmin(admin.ModelAdmin):
+    list_display = ['payment', 'attempts', 'last_error_code', 'next_attempt_at', 'is_active']
+    list_filter = ['is_active', 'last_error_code']
+    search_fields = ['payment__id']
+    readonly_fields = ['created_at', 'updated_at']
+
+@admin.register(PaymentDailyRollup)
+class PaymentDailyRollupAdmin(admin.ModelAdmin):
+    list_display = ['date', 'payment_method', 'status', 'currency', 'payment_count', 'total_amount']
+    list_filter = ['payment_method', 'status', 'currency', 'date']
+    date_hierarchy = 'date'
+    readonly_fields = ['refreshed_at']
+
+@admin.register(PaymentWebhookEvent)
+class PaymentWebhookEventAdmin(admin.ModelAdmin):
+    list_display = ['id', 'gateway', 'transaction_id', 'event_status', 'outcome', 'received_at', 'processed_at']
+    list_filter = ['gateway', 'event_status', 'outcome']
+    search_fields = ['transaction_id']
+    readonly_fields = ['received_at', 'processed_at']
+
+@admin.register(PaymentRefundJob)
+class PaymentRefundJobAdmin(admin.ModelAdmin):
+    list_display = ['id', 'status', 'total', 'refunded_count', 'failed_count', 'skipped_count', 'created_at']
+    list_filter = ['status']
+    readonly_fields = ['id', 'requested_by', 'payment_ids', 'status', 'total', 'refunded_count', 'failed_count',
+                       'skipped_count', 'errors', 'created_at', 'started_at', 'finished_at']
@@ -1,27 +1,157 @@
+import csv
+import itertools
+import json
+import math
 import random
+import threading
 import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
 from decimal import Decimal
 from typing import Dict, Any
 import uuid
 
+ERROR_MESSAGES = {
+    'INSUFFICIENT_FUNDS': 'Insufficient funds',
+    'CARD_DECLINED': 'Card declined by issuer',
+    'INVALID_CARD': 'Invalid card details',
+    'NETWORK_ERROR': 'Network timeout',
+    'FRAUD_DETECTED': 'Transaction flagged as potentially fraudulent'
+}
+
+# Simulator profiles. Latency specs are in seconds:
+#   fixed:     {'seconds'}
+#   uniform:   {'low', 'high'}
+#   lognormal: {'median', 'sigma'}
+#   long_tail: lognormal body, plus a Pareto tail for `tail_probability` of calls, capped at `max`
+# error_mix holds relative weights of the error codes returned on failure.
+SIMULATOR_PROFILES = {
+    'default': {
+        'success_rate': 0.85,
+        'latency': {'distribution': 'uniform', 'low': 1, 'high': 3},
+        'refund_latency': {'distribution': 'uniform', 'low': 0.5, 'high': 1.5},
+        'error_mix': {code: 1 for code in ERROR_MESSAGES},
+    },
+    'fast': {
+        'success_rate': 0.95,
+        'latency': {'distribution': 'fixed', 'seconds': 0.05},
+        'refund_latency': {'distribution': 'fixed', 'seconds': 0.05},
+        'error_mix': {'INSUFFICIENT_FUNDS': 3, 'CARD_DECLINED': 2, 'INVALID_CARD': 1},
+    },
+    'realistic': {
+        'success_rate': 0.9,
+        'latency': {'distribution': 'lognormal', 'median': 0.8, 'sigma': 0.5},
+        'refund_latency': {'distribution': 'lognormal', 'median': 0.6, 'sigma': 0.4},
+        'error_mix': {'INSUFFICIENT_FUNDS': 5, 'CARD_DECLINED': 3, 'INVALID_CARD': 1,
+                      'NETWORK_ERROR': 1, 'FRAUD_DETECTED': 0.5},
+    },
+    'long_tail': {
+        'success_rate': 0.85,
+        'latency': {'distribution': 'long_tail', 'median': 0.5, 'sigma': 0.4,
+                    'tail_probability': 0.02, 'tail_alpha': 1.5, 'max': 30},
+        'refund_latency': {'distribution': 'lognormal', 'median': 0.5, 'sigma': 0.4},
+        'error_mix': {'INSUFFICIENT_FUNDS': 3, 'CARD_DECLINED': 2, 'NETWORK_ERROR': 2},
+    },
+    'degraded': {
+        'success_rate': 0.6,
+        'latency': {'distribution': 'lognormal', 'median': 3, 'sigma': 0.8},
+        'refund_latency': {'distribution': 'lognormal', 'median': 2, 'sigma': 0.8},
+        'error_mix': {'NETWORK_ERROR': 8, 'INSUFFICIENT_FUNDS': 1, 'CARD_DECLINED': 1},
+    },
+}
+
+
+def resolve_profile(profile=None):
+    """
+    Profile name or dict -> full profile dict. Dicts may set a 'base' profile
+    name and override only some of its keys.
+    """
+    if profile is None:
+        profile = 'default'
+    if isinstance(profile, str):
+        if profile not in SIMULATOR_PROFILES:
+            raise ValueError(f"Unknown gateway simulator profile: {profile}")
+        return dict(SIMULATOR_PROFILES[profile])
+    overrides = dict(profile)
+    resolved = resolve_profile(overrides.pop('base', 'default'))
+    resolved.update(overrides)
+    return resolved
+
+
+def sample_latency(rng, spec):
+    distribution = spec.get('distribution', 'fixed')
+    if distribution == 'fixed':
+        return spec.get('seconds', 0)
+    if distribution == 'uniform':
+        return rng.uniform(spec['low'], spec['high'])
+    if distribution in ('lognormal', 'long_tail'):
+        delay = rng.lognormvariate(math.log(spec['median']), spec['sigma'])
+        if distribution == 'long_tail' and rng.random() < spec.get('tail_probability', 0.01):
+            delay *= rng.paretovariate(spec.get('tail_alpha', 1.5))
+        return min(delay, spec.get('max', math.inf))
+    raise ValueError(f"Unknown latency distribution: {distribution}")
+
+
 class FakePaymentGateway:
     """
-    Fake payment gateway that simulates Payme/Click behavior
+    Fake payment gateway that simulates Payme/Click behavior.
+    Behaviour comes from a simulator profile; with a seed the outcomes, error codes,
+    latencies and ids of the n-th call are reproducible, also when calls come from
+    several threads. time_scale multiplies
+    the actual sleeps (0 skips them), reported latencies are always unscaled.
     """
     
-    def __init__(self):
-        self.success_rate = 0.85  # 85% success rate
+    def __init__(self, profile=None, seed=None, time_scale: float = 1.0):
+        self.profile = resolve_profile(profile)
+        self.success_rate = self.profile['success_rate']
+        self.time_scale = time_scale
+        # Gateways are shared between threads (batch refunds, benchmarks)
+        self._lock = threading.Lock()
+        self.reseed(seed)
+    
+    def reseed(self, seed):
+        with self._lock:
+            self.seed = seed
+            self._calls = itertools.count()
+    
+    def _call_rng(self):
+        """
+        Generator for one call, seeded from (seed, call number). Threads only share the
+        counter, so the n-th call draws the same values whatever runs next to it.
+        """
+        with self._lock:
+            call = next(self._calls)
+        if self.seed is None:
+            return random.Random()
+        return random.Random(f'{self.seed}:{call}')
+    
+    def _simulate_latency(self, rng, spec):
+        delay = sample_latency(rng, spec)
+        if self.time_scale:
+            time.sleep(delay * self.time_scale)
+        return delay
+    
+    def _new_id(self, rng):
+        return str(uuid.UUID(int=rng.getrandbits(128), version=4))
+    
+    def _draw_outcome(self, rng):
+        if rng.random() < self.success_rate:
+            return None
+        codes = list(self.profile['error_mix'])
+        return rng.choices(codes, weights=[self.profile['error_mix'][c] for c in codes])[0]
     
     def process_payment(self, amount: Decimal, payment_method: str, card_data: Dict = None) -> Dict[str, Any]:
         """
         Simulate payment processing
         """
-        time.sleep(random.uniform(1, 3))
+        rng = self._call_rng()
+        latency = self._simulate_latency(rng, self.profile['latency'])
         
-        transaction_id = str(uuid.uuid4())
-        is_successful = random.random() < self.success_rate
+        transaction_id = self._new_id(rng)
+        error_code = self._draw_outcome(rng)
         
-        if is_successful:
+        if error_code is None:
             return {
                 'status': 'success',
                 'transaction_id': transaction_id,
@@ -32,32 +162,26 @@ class FakePaymentGateway:
                     'currency': 'USD',
                     'payment_method': payment_method,
                     'timestamp': int(time.time()),
+                    'latency_ms': round(latency * 1000, 1),
                     'gateway_fee': str(Decimal(str(amount)) * Decimal('0.03')),  # 3% fee
                 }
             }
         else:
-            error_codes = {
-                'INSUFFICIENT_FUNDS': 'Insufficient funds',
-                'CARD_DECLINED': 'Card declined by issuer',
-                'INVALID_CARD': 'Invalid card details',
-                'NETWORK_ERROR': 'Network timeout',
-                'FRAUD_DETECTED': 'Transaction flagged as potentially fraudulent'
-            }
-            
-            error_code = random.choice(list(error_codes.keys()))
+            error_message = ERROR_MESSAGES.get(error_code, error_code)
             
             return {
                 'status': 'failed',
                 'transaction_id': transaction_id,
                 'error_code': error_code,
-                'error_message': error_codes[error_code],
+                'error_message': error_message,
                 'gateway_response': {
                     'code': '400',
-                    'message': error_codes[error_code],
+                    'message': error_message,
                     'amount': str(amount),
                     'currency': 'USD',
                     'payment_method': payment_method,
                     'timestamp': int(time.time()),
+                    'latency_ms': round(latency * 1000, 1),
                 }
             }
     
@@ -76,22 +200,110 @@ class FakePaymentGateway:
         """
         Simulate payment refund
         """
-        time.sleep(random.uniform(0.5, 1.5))
+        rng = self._call_rng()
+        self._simulate_latency(rng, self.profile['refund_latency'])
         
         return {
             'status': 'refunded',
-            'refund_id': str(uuid.uuid4()),
+            'refund_id': self._new_id(rng),
             'original_transaction_id': transaction_id,
             'refunded_amount': str(amount) if amount else 'full',
             'timestamp': int(time.time())
         }
 
-payme_gateway = FakePaymentGateway()
-click_gateway = FakePaymentGateway()
-card_gateway = FakePaymentGateway()
+    def write_settlement_file(self, fileobj, transactions, mismatch_rate: float = 0.0, seed: int = None) -> int:
+        """
+        Write a settlement CSV for (transaction_id, amount, status, currency, settled_at) tuples,
+        optionally corrupting a fraction of rows to exercise reconciliation
+        """
+        rng = random.Random(seed)
+        writer = csv.writer(fileobj)
+        writer.writerow(['transaction_id', 'amount', 'currency', 'status', 'settled_at'])
+        
+        statuses = {'completed': 'settled', 'refunded': 'refunded', 'failed': 'failed'}
+        written = 0
+        for transaction_id, amount, status, currency, settled_at in transactions:
+            amount = Decimal(str(amount))
+            settlement_status = statuses.get(status, status)
+            if mismatch_rate and rng.random() < mismatch_rate:
+                if rng.random() < 0.5:
+                    amount += Decimal('1.00')
+                else:
+                    settlement_status = 'failed' if settlement_status == 'settled' else 'settled'
+            writer.writerow([transaction_id, f'{amount:.2f}', currency, settlement_status,
+                             settled_at.isoformat() if settled_at else ''])
+            written += 1
+        return written
+
+    def build_webhook(self, transaction_id: str, status: str = 'success', amount: Decimal = None) -> bytes:
+        """
+        Callback body the gateway would POST for a transaction
+        """
+        return json.dumps({
+            'transaction_id': transaction_id,
+            'status': status,
+            'amount': str(amount) if amount is not None else None,
+            'gateway_fee': str(Decimal(str(amount)) * Decimal('0.03')) if amount is not None and status == 'success' else None,
+            'timestamp': int(time.time()),
+        }).encode()
+    
+    def send_webhooks(self, url: str, transaction_ids, secret: str, status: str = 'success',
+                      duplicates: int = 0, concurrency: int = 10, timeout: float = 5) -> Dict[str, int]:
+        """
+        Fire a burst of signed callbacks at url, each transaction sent 1 + duplicates times
+        """
+        from .webhooks import sign_payload
+        
+        def send(transaction_id):
+            body = self.build_webhook(transaction_id, status)
+            request = urllib.request.Request(url, data=body, method='POST', headers={
+                'Content-Type': 'application/json',
+                'X-Gateway-Signature': sign_payload(secret, body),
+            })
+            try:
+                with urllib.request.urlopen(request, timeout=timeout) as response:
+                    return str(response.status)
+            except urllib.error.HTTPError as e:
+                return str(e.code)
+            except (urllib.error.URLError, OSError):
+                return 'error'
+        
+        calls = [t for t in transaction_ids for _ in range(1 + duplicates)]
+        results = {}
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            for result in executor.map(send, calls):
+                results[result] = results.get(result, 0) + 1
+        return results
+
+def build_gateway(method, simulator_settings=None):
+    """
+    Gateway for one payment method, configured from PAYMENT_GATEWAY_SIMULATOR
+    """
+    from django.conf import settings
+    
+    if simulator_settings is None:
+        simulator_settings = getattr(settings, 'PAYMENT_GATEWAY_SIMULATOR', {})
+    options = simulator_settings.get(method, {})
+    seed = options.get('seed')
+    if seed is None and getattr(settings, 'PAYMENT_GATEWAY_SEED', ''):
+        # Distinct but reproducible stream per gateway
+        seed = f'{settings.PAYMENT_GATEWAY_SEED}:{method}'
+    return FakePaymentGateway(
+        profile=options.get('profile'),
+        seed=seed,
+        time_scale=options.get('time_scale', getattr(settings, 'PAYMENT_GATEWAY_TIME_SCALE', 1.0)),
+    )
+
+
+def configure_gateways(simulator_settings=None):
+    """
+    (Re)build GATEWAY_MAP in place, so modules that imported it see the new gateways
+    """
+    GATEWAY_MAP.clear()
+    for method in ('payme', 'click', 'card'):
+        GATEWAY_MAP[method] = build_gateway(method, simulator_settings)
+    return GATEWAY_MAP
+
 
-GATEWAY_MAP = {
-    'payme': payme_gateway,
-    'click': click_gateway,
-    'card': card_gateway,
-}
\ No newline at end of file
+GATEWAY_MAP = {}
+configure_gateways()
@@ -0,0 +1,62 @@
+import random
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+from django.core.management.base import BaseCommand, CommandError
+from payments.fake_gateway import GATEWAY_MAP, SIMULATOR_PROFILES, FakePaymentGateway, build_gateway
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0
+    index = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+class Command(BaseCommand):
+    help = 'Replay simulated payment traffic against a fake gateway profile and report latency/outcomes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--payment-method', choices=list(GATEWAY_MAP), default='card')
+        parser.add_argument('--profile', choices=list(SIMULATOR_PROFILES),
+                            help='Override the profile configured in PAYMENT_GATEWAY_SIMULATOR')
+        parser.add_argument('--count', type=int, default=1000)
+        parser.add_argument('--concurrency', type=int, default=50)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--time-scale', type=float, default=0.01,
+                            help='Multiplier for simulated sleeps, 0 disables them')
+
+    def handle(self, *args, **options):
+        if options['count'] < 1 or options['concurrency'] < 1:
+            raise CommandError('--count and --concurrency must be positive')
+
+        method = options['payment_method']
+        if options['profile']:
+            gateway = FakePaymentGateway(options['profile'], seed=options['seed'], time_scale=options['time_scale'])
+        else:
+            gateway = build_gateway(method)
+            gateway.reseed(options['seed'])
+            gateway.time_scale = options['time_scale']
+
+        # Amounts are drawn up front from their own stream so they don't depend on thread scheduling
+        amounts_rng = random.Random(options['seed'])
+        amounts = [
+            Decimal(str(round(amounts_rng.lognormvariate(4, 0.8), 2))) for _ in range(options['count'])
+        ]
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=options['concurrency']) as executor:
+            results = list(executor.map(lambda amount: gateway.process_payment(amount, method), amounts))
+        elapsed = time.perf_counter() - started
+
+        outcomes = Counter(result.get('error_code', 'success') for result in results)
+        latencies = sorted(result['gateway_response']['latency_ms'] for result in results)
+
+        self.stdout.write(f'{len(results)} payments in {elapsed:.2f}s ({len(results) / elapsed:.0f}/s wall)')
+        self.stdout.write('Outcomes: ' + ', '.join(f'{code}={count}' for code, count in outcomes.most_common()))
+        self.stdout.write(
+            'Simulated latency ms: '
+            f'p50={percentile(latencies, 0.5)} p95={percentile(latencies, 0.95)} '
+            f'p99={percentile(latencies, 0.99)} max={latencies[-1]}'
+        )
@@ -0,0 +1,14 @@
+from payments.models import Payment
+from payments.views import PAYMENT_EXPORT_FIELDS
+from service_marketplace.export_command import ExportCommand
+
+
+class Command(ExportCommand):
+    help = 'Stream payments created in a date range as CSV or JSONL'
+    export_name = 'payments'
+
+    def get_queryset(self):
+        return Payment.objects.order_by('created_at')
+
+    def get_fields(self):
+        return PAYMENT_EXPORT_FIELDS
@@ -0,0 +1,47 @@
+import time
+import uuid
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from payments.fake_gateway import GATEWAY_MAP
+from payments.models import Payment
+
+
+class Command(BaseCommand):
+    help = 'Fire a burst of signed fake gateway callbacks at a webhook URL (load testing)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('url', help='e.g. http://localhost:8000/api/payments/webhooks/payme/')
+        parser.add_argument('--payment-method', choices=list(GATEWAY_MAP), default='payme')
+        parser.add_argument('--count', type=int, default=1000, help='Number of distinct transactions')
+        parser.add_argument('--duplicates', type=int, default=0, help='Extra deliveries per transaction')
+        parser.add_argument('--status', choices=['success', 'failed'], default='success')
+        parser.add_argument('--concurrency', type=int, default=20)
+
+    def handle(self, *args, **options):
+        method = options['payment_method']
+        transaction_ids = list(
+            Payment.objects.filter(
+                payment_method=method,
+                status__in=['pending', 'processing'],
+                gateway_transaction_id__isnull=False,
+            ).values_list('gateway_transaction_id', flat=True)[:options['count']]
+        )
+        # Pad with unknown transactions so the burst size doesn't depend on the database
+        transaction_ids += [str(uuid.uuid4()) for _ in range(options['count'] - len(transaction_ids))]
+
+        started = time.monotonic()
+        results = GATEWAY_MAP[method].send_webhooks(
+            options['url'],
+            transaction_ids,
+            settings.PAYMENT_WEBHOOK_SECRETS[method],
+            status=options['status'],
+            duplicates=options['duplicates'],
+            concurrency=options['concurrency'],
+        )
+        elapsed = time.monotonic() - started
+
+        total = sum(results.values())
+        self.stdout.write(f'Responses: {results}')
+        self.stdout.write(self.style.SUCCESS(
+            f'Sent {total} webhooks in {elapsed:.2f}s ({total / elapsed if elapsed else 0:.0f}/s)'
+        ))
@@ -0,0 +1,43 @@
+from django.core.management.base import BaseCommand
+from payments.fake_gateway import GATEWAY_MAP
+from payments.models import Payment
+from payments.reconciliation import SETTLED_PAYMENT_STATUSES
+from .reconcile_settlement import parse_window_bound
+
+
+class Command(BaseCommand):
+    help = 'Write a fake gateway settlement CSV for existing payments (for testing reconciliation)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('output', help='Path of the settlement CSV to write')
+        parser.add_argument('--payment-method', choices=list(GATEWAY_MAP), default='card')
+        parser.add_argument('--start', help='Only include payments processed at or after this time')
+        parser.add_argument('--end', help='Only include payments processed before this time')
+        parser.add_argument('--mismatch-rate', type=float, default=0.0,
+                            help='Fraction of rows to corrupt (amount or status)')
+        parser.add_argument('--seed', type=int)
+
+    def handle(self, *args, **options):
+        payments = Payment.objects.filter(
+            payment_method=options['payment_method'],
+            status__in=SETTLED_PAYMENT_STATUSES,
+            gateway_transaction_id__isnull=False,
+        )
+        if options['start']:
+            payments = payments.filter(processed_at__gte=parse_window_bound(options['start']))
+        if options['end']:
+            payments = payments.filter(processed_at__lt=parse_window_bound(options['end']))
+
+        transactions = (
+            payments.order_by()
+            .values_list('gateway_transaction_id', 'amount', 'status', 'currency', 'processed_at')
+            .iterator(chunk_size=5000)
+        )
+
+        gateway = GATEWAY_MAP[options['payment_method']]
+        with open(options['output'], 'w', newline='') as fileobj:
+            written = gateway.write_settlement_file(
+                fileobj, transactions, mismatch_rate=options['mismatch_rate'], seed=options['seed']
+            )
+
+        self.stdout.write(self.style.SUCCESS(f'Wrote {written} settlement rows to {options["output"]}'))
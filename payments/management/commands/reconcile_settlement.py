@@ -0,0 +1,42 @@
+import sys
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from payments.reconciliation import reconcile, open_settlement
+
+
+def parse_window_bound(value):
+    parsed = parse_datetime(value)
+    if parsed is None:
+        raise CommandError(f'Invalid datetime: {value}')
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed)
+    return parsed
+
+
+class Command(BaseCommand):
+    help = 'Reconcile a gateway settlement CSV against payments and report mismatches'
+
+    def add_arguments(self, parser):
+        parser.add_argument('settlement_file', help='Settlement CSV (optionally .gz)')
+        parser.add_argument('--output', help='Write mismatches to this CSV file instead of stdout')
+        parser.add_argument('--start', help='Start of the processed_at window, to report payments missing from the file')
+        parser.add_argument('--end', help='End of the processed_at window (exclusive)')
+        parser.add_argument('--batch-size', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        start = parse_window_bound(options['start']) if options['start'] else None
+        end = parse_window_bound(options['end']) if options['end'] else None
+        if (start is None) != (end is None):
+            raise CommandError('--start and --end must be given together')
+
+        output_file = open(options['output'], 'w', newline='') if options['output'] else sys.stdout
+        try:
+            with open_settlement(options['settlement_file']) as settlement_file:
+                counts = reconcile(settlement_file, output_file, start=start, end=end,
+                                   batch_size=options['batch_size'])
+        finally:
+            if output_file is not sys.stdout:
+                output_file.close()
+
+        self.stderr.write(self.style.SUCCESS(f'Reconciliation completed: {counts}'))
@@ -0,0 +1,20 @@
+PAYMENT_MESSAGES = {
+    'payment_success': 'Payment for order #{order_id} completed successfully',
+    'payment_failed': 'Payment for order #{order_id} failed',
+}
+
+
+def payment_notification(payment, notification_type):
+    """
+    Outbox payload telling the client about a charge outcome, the same for the
+    synchronous path and gateway webhooks
+    """
+    return {
+        'type': 'payment_notification',
+        'notification_type': notification_type,
+        'order_id': payment.order_id,
+        'payment_id': str(payment.id),
+        'message': PAYMENT_MESSAGES[notification_type].format(order_id=payment.order_id),
+        'amount': str(payment.amount),
+        'status': payment.status
+    }
@@ -0,0 +1,73 @@
+import json
+import zlib
+from decimal import Decimal, InvalidOperation
+from django.db import migrations
+
+BATCH_SIZE = 2000
+
+
+def split_gateway_response(blob):
+    blob = dict(blob)
+    refund_data = blob.pop('refund_data', None)
+    nested = blob.get('gateway_response') if isinstance(blob.get('gateway_response'), dict) else blob
+    error_code = blob.get('error_code') or nested.get('error_code') or ''
+    try:
+        fee = Decimal(str(nested['gateway_fee'])).quantize(Decimal('0.01')) if nested.get('gateway_fee') else None
+    except InvalidOperation:
+        fee = None
+    return blob, refund_data, error_code, fee
+
+
+def move_gateway_responses(apps, schema_editor):
+    Payment = apps.get_model('payments', 'Payment')
+    PaymentGatewayEvent = apps.get_model('payments', 'PaymentGatewayEvent')
+
+    events, payments = [], []
+
+    def flush():
+        PaymentGatewayEvent.objects.bulk_create(events)
+        Payment.objects.bulk_update(payments, ['error_code', 'fee', 'refund_id'])
+        events.clear()
+        payments.clear()
+
+    for payment in Payment.objects.filter(gateway_response__isnull=False).iterator(chunk_size=BATCH_SIZE):
+        charge, refund_data, error_code, fee = split_gateway_response(payment.gateway_response)
+        events.append(PaymentGatewayEvent(payment=payment, event_type='charge', payload=charge))
+        if refund_data:
+            events.append(PaymentGatewayEvent(payment=payment, event_type='refund', payload=refund_data))
+            payment.refund_id = refund_data.get('refund_id')
+        payment.error_code = error_code
+        payment.fee = fee
+        payments.append(payment)
+        if len(payments) >= BATCH_SIZE:
+            flush()
+    flush()
+
+
+def restore_gateway_responses(apps, schema_editor):
+    Payment = apps.get_model('payments', 'Payment')
+    PaymentGatewayEvent = apps.get_model('payments', 'PaymentGatewayEvent')
+
+    for payment in Payment.objects.filter(gateway_events__isnull=False).distinct().iterator(chunk_size=BATCH_SIZE):
+        blob = {}
+        for event in PaymentGatewayEvent.objects.filter(payment=payment).order_by('created_at'):
+            payload = event.payload
+            if event.compressed_payload is not None:
+                payload = json.loads(zlib.decompress(bytes(event.compressed_payload)))
+            if event.event_type == 'refund':
+                blob['refund_data'] = payload
+            else:
+                blob.update(payload or {})
+        payment.gateway_response = blob
+        payment.save(update_fields=['gateway_response'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payments', '0005_payment_error_code_payment_fee_payment_refund_id_and_more'),
+    ]
+
+    operations = [
+        migrations.RunPython(move_gateway_responses, restore_gateway_responses),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.5 on 2026-10-19 01:37
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payments', '0006_move_gateway_response_to_events'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='payment',
+            name='gateway_response',
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.2.5 on 2026-10-19 01:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payments', '0007_remove_payment_gateway_response'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PaymentWebhookEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('gateway', models.CharField(choices=[('payme', 'Payme'), ('click', 'Click'), ('card', 'Credit Card')], max_length=10)),
+                ('transaction_id', models.CharField(max_length=255)),
+                ('event_status', models.CharField(max_length=20)),
+                ('payload', models.JSONField()),
+                ('outcome', models.CharField(blank=True, max_length=20)),
+                ('received_at', models.DateTimeField(auto_now_add=True)),
+                ('processed_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'ordering': ['id'],
+                'indexes': [models.Index(condition=models.Q(('processed_at__isnull', True)), fields=['id'], name='payment_webhook_pending_idx')],
+            },
+        ),
+    ]
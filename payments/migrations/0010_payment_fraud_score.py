@@ -0,0 +1,23 @@
+# Generated by Django 5.2.5 on 2026-10-19 01:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payments', '0009_paymentrefundjob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='payment',
+            name='fraud_action',
+            field=models.CharField(blank=True, choices=[('flag', 'Flagged for review'), ('block', 'Blocked')], max_length=10),
+        ),
+        migrations.AddField(
+            model_name='payment',
+            name='fraud_score',
+            field=models.FloatField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.5 on 2026-10-19 01:54
+
+from django.db import migrations, models
+from django.db.models import F
+
+
+def backfill_base_amounts(apps, schema_editor):
+    # Existing rollups are all USD, the base currency
+    PaymentDailyRollup = apps.get_model('payments', 'PaymentDailyRollup')
+    PaymentDailyRollup.objects.filter(currency='USD').update(total_amount_base=F('total_amount'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payments', '0010_payment_fraud_score'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='paymentdailyrollup',
+            name='total_amount_base',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=20),
+        ),
+        migrations.AlterField(
+            model_name='payment',
+            name='amount',
+            field=models.DecimalField(decimal_places=2, max_digits=14),
+        ),
+        migrations.RunPython(backfill_base_amounts, migrations.RunPython.noop),
+    ]
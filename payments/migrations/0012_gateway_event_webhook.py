@@ -0,0 +1,18 @@
+# Generated by Django 5.2.5 on 2026-10-19 03:23
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payments', '0011_paymentdailyrollup_total_amount_base_and_more'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='paymentgatewayevent',
+            name='event_type',
+            field=models.CharField(choices=[('charge', 'Charge'), ('refund', 'Refund'), ('webhook', 'Webhook')], max_length=20),
+        ),
+    ]
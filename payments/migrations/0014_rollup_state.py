@@ -0,0 +1,31 @@
+# Generated by Django 5.2.5 on 2026-10-19 03:35
+
+from django.db import migrations, models
+from django.db.models import Max
+
+
+def seed_watermark(apps, schema_editor):
+    # Carry over the old watermark so the first incremental refresh isn't a full rebuild
+    PaymentDailyRollup = apps.get_model('payments', 'PaymentDailyRollup')
+    PaymentRollupState = apps.get_model('payments', 'PaymentRollupState')
+    last = PaymentDailyRollup.objects.aggregate(last=Max('refreshed_at'))['last']
+    if last is not None:
+        PaymentRollupState.objects.create(pk=1, refreshed_through=last)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payments', '0013_payment_refunding_status'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PaymentRollupState',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('refreshed_through', models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+        migrations.RunPython(seed_watermark, migrations.RunPython.noop),
+    ]
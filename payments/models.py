@@ -1,7 +1,11 @@
 from django.db import models
+from django.conf import settings
 from django.contrib.auth import get_user_model
+from django.core.serializers.json import DjangoJSONEncoder
 from orders.models import Order
+import json
 import uuid
+import zlib
 
 User = get_user_model()
 
@@ -12,6 +16,7 @@ class Payment(models.Model):
         ('completed', 'Completed'),
         ('failed', 'Failed'),
         ('canceled', 'Canceled'),
+        ('refunding', 'Refunding'),
         ('refunded', 'Refunded'),
     ]
     
@@ -21,18 +26,30 @@ class Payment(models.Model):
         ('card', 'Credit Card'),
     ]
     
+    FRAUD_ACTION_CHOICES = [
+        ('flag', 'Flagged for review'),
+        ('block', 'Blocked'),
+    ]
+    
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     order = models.OneToOneField(Order, on_delete=models.CASCADE, related_name='payment')
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='payments')
     
-    amount = models.DecimalField(max_digits=10, decimal_places=2)
+    amount = models.DecimalField(max_digits=14, decimal_places=2)
     currency = models.CharField(max_length=3, default='USD')
     payment_method = models.CharField(max_length=10, choices=PAYMENT_METHOD_CHOICES)
     
     status = models.CharField(max_length=20, choices=PAYMENT_STATUS_CHOICES, default='pending')
     
-    gateway_transaction_id = models.CharField(max_length=255, blank=True, null=True)
-    gateway_response = models.JSONField(blank=True, null=True)
+    gateway_transaction_id = models.CharField(max_length=255, blank=True, null=True, db_index=True)
+    # Raw gateway payloads live in PaymentGatewayEvent, only these are kept on the row
+    error_code = models.CharField(max_length=50, blank=True)
+    fee = models.DecimalField(max_digits=10, decimal_places=2, blank=True, null=True)
+    refund_id = models.CharField(max_length=255, blank=True, null=True)
+    
+    # Pre-authorization fraud screening, see payments.fraud
+    fraud_score = models.FloatField(blank=True, null=True)
+    fraud_action = models.CharField(max_length=10, choices=FRAUD_ACTION_CHOICES, blank=True)
     
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
@@ -40,6 +57,171 @@ class Payment(models.Model):
     
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['created_at'], name='payment_created_idx'),
+            models.Index(fields=['updated_at'], name='payment_updated_idx'),
+        ]
     
     def __str__(self):
-        return f"Payment {self.id} - {self.amount} - {self.status}"
\ No newline at end of file
+        return f"Payment {self.id} - {self.amount} - {self.status}"
+
+class PaymentGatewayEvent(models.Model):
+    """
+    Append-only record of one gateway interaction with its raw payload
+    """
+    EVENT_TYPE_CHOICES = [
+        ('charge', 'Charge'),
+        ('refund', 'Refund'),
+        ('webhook', 'Webhook'),
+    ]
+    
+    payment = models.ForeignKey(Payment, on_delete=models.CASCADE, related_name='gateway_events')
+    event_type = models.CharField(max_length=20, choices=EVENT_TYPE_CHOICES)
+    payload = models.JSONField(blank=True, null=True)
+    compressed_payload = models.BinaryField(blank=True, null=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        ordering = ['created_at']
+        indexes = [
+            models.Index(fields=['payment', 'created_at'], name='payment_event_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.event_type} event for payment {self.payment_id}"
+    
+    @classmethod
+    def build(cls, payment, event_type, payload):
+        """
+        Unsaved event, for callers that bulk_create
+        """
+        if getattr(settings, 'PAYMENT_GATEWAY_EVENT_COMPRESSION', False):
+            raw = json.dumps(payload, cls=DjangoJSONEncoder).encode()
+            return cls(payment=payment, event_type=event_type, compressed_payload=zlib.compress(raw))
+        return cls(payment=payment, event_type=event_type, payload=payload)
+    
+    @classmethod
+    def record(cls, payment, event_type, payload):
+        event = cls.build(payment, event_type, payload)
+        event.save()
+        return event
+    
+    @property
+    def data(self):
+        if self.compressed_payload is not None:
+            return json.loads(zlib.decompress(bytes(self.compressed_payload)))
+        return self.payload
+
+class PaymentWebhookEvent(models.Model):
+    """
+    Durable inbox for gateway callbacks, drained in batches by process_webhook_inbox
+    """
+    gateway = models.CharField(max_length=10, choices=Payment.PAYMENT_METHOD_CHOICES)
+    transaction_id = models.CharField(max_length=255)
+    event_status = models.CharField(max_length=20)
+    payload = models.JSONField()
+    outcome = models.CharField(max_length=20, blank=True)
+    received_at = models.DateTimeField(auto_now_add=True)
+    processed_at = models.DateTimeField(blank=True, null=True)
+    
+    class Meta:
+        ordering = ['id']
+        indexes = [
+            models.Index(fields=['id'], condition=models.Q(processed_at__isnull=True),
+                         name='payment_webhook_pending_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.gateway} webhook {self.transaction_id} - {self.event_status}"
+
+class PaymentRetry(models.Model):
+    payment = models.OneToOneField(Payment, on_delete=models.CASCADE, related_name='retry')
+    attempts = models.PositiveIntegerField(default=0)
+    last_error_code = models.CharField(max_length=50, blank=True)
+    next_attempt_at = models.DateTimeField(null=True, blank=True)
+    is_active = models.BooleanField(default=True)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['is_active', 'next_attempt_at'], name='payment_retry_due_idx'),
+        ]
+
+    def __str__(self):
+        return f"Retry for payment {self.payment_id} - attempt {self.attempts}"
+
+
+class PaymentDailyRollup(models.Model):
+    date = models.DateField()
+    payment_method = models.CharField(max_length=10, choices=Payment.PAYMENT_METHOD_CHOICES)
+    status = models.CharField(max_length=20, choices=Payment.PAYMENT_STATUS_CHOICES)
+    currency = models.CharField(max_length=3)
+
+    payment_count = models.PositiveIntegerField(default=0)
+    total_amount = models.DecimalField(max_digits=16, decimal_places=2, default=0)
+    # total_amount in FX_BASE_CURRENCY at the rate cached when the rollup was refreshed
+    total_amount_base = models.DecimalField(max_digits=20, decimal_places=2, default=0)
+
+    refreshed_at = models.DateTimeField()
+
+    class Meta:
+        ordering = ['-date', 'payment_method', 'status', 'currency']
+        constraints = [
+            models.UniqueConstraint(
+                fields=['date', 'payment_method', 'status', 'currency'],
+                name='unique_payment_daily_rollup',
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.date} {self.payment_method}/{self.status}/{self.currency}: {self.payment_count}"
+
+
+class PaymentRollupState(models.Model):
+    """
+    Single row: payments updated before refreshed_through are reflected in the daily rollups
+    """
+    refreshed_through = models.DateTimeField(blank=True, null=True)
+
+    def __str__(self):
+        return f"Rollups refreshed through {self.refreshed_through}"
+
+
+class PaymentRefundJob(models.Model):
+    """
+    Batch refund request, run in the background by process_refund_job
+    """
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('running', 'Running'),
+        ('completed', 'Completed'),
+        ('failed', 'Failed'),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    requested_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True,
+                                     related_name='refund_jobs')
+    payment_ids = models.JSONField(default=list)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
+
+    total = models.PositiveIntegerField(default=0)
+    refunded_count = models.PositiveIntegerField(default=0)
+    skipped_count = models.PositiveIntegerField(default=0)
+    failed_count = models.PositiveIntegerField(default=0)
+    errors = models.JSONField(default=list, blank=True)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(blank=True, null=True)
+    finished_at = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return f"Refund job {self.id} - {self.status}"
+
+    @property
+    def processed(self):
+        return self.refunded_count + self.skipped_count + self.failed_count
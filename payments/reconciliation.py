@@ -0,0 +1,169 @@
+import csv
+import gzip
+import os
+import sqlite3
+import tempfile
+from decimal import Decimal, InvalidOperation
+from itertools import islice
+from .models import Payment
+
+SETTLEMENT_FIELDS = ['transaction_id', 'amount', 'currency', 'status', 'settled_at']
+MISMATCH_FIELDS = ['kind', 'transaction_id', 'payment_id', 'settlement_amount', 'payment_amount',
+                   'settlement_status', 'payment_status']
+
+# Settlement status -> Payment status
+SETTLEMENT_STATUS_MAP = {
+    'settled': 'completed',
+    'refunded': 'refunded',
+    'failed': 'failed',
+}
+
+# Payment statuses the gateway is expected to report
+SETTLED_PAYMENT_STATUSES = ['completed', 'refunded']
+
+
+def open_settlement(path):
+    if path.endswith('.gz'):
+        return gzip.open(path, 'rt', newline='')
+    return open(path, newline='')
+
+
+def _batches(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+class SeenTransactions:
+    """
+    On-disk set of settlement transaction ids, so the reverse check
+    (payments missing from the file) doesn't hold millions of ids in memory
+    """
+
+    def __init__(self):
+        fd, self.path = tempfile.mkstemp(suffix='.sqlite3')
+        os.close(fd)
+        self.conn = sqlite3.connect(self.path)
+        self.conn.execute('CREATE TABLE seen (transaction_id TEXT PRIMARY KEY) WITHOUT ROWID')
+
+    def add_many(self, transaction_ids):
+        self.conn.executemany('INSERT OR IGNORE INTO seen VALUES (?)', ((t,) for t in transaction_ids))
+
+    def missing(self, transaction_ids):
+        transaction_ids = list(transaction_ids)
+        placeholders = ','.join('?' * len(transaction_ids))
+        found = {
+            row[0] for row in self.conn.execute(
+                f'SELECT transaction_id FROM seen WHERE transaction_id IN ({placeholders})', transaction_ids
+            )
+        }
+        return [t for t in transaction_ids if t not in found]
+
+    def close(self):
+        self.conn.close()
+        os.remove(self.path)
+
+
+def _compare_batch(rows, writer, counts):
+    by_txn = {}
+    for row in rows:
+        by_txn[row['transaction_id']] = row
+
+    payments = Payment.objects.filter(gateway_transaction_id__in=list(by_txn)).values_list(
+        'gateway_transaction_id', 'id', 'amount', 'status'
+    )
+    matched = set()
+    for transaction_id, payment_id, amount, payment_status in payments.iterator():
+        matched.add(transaction_id)
+        row = by_txn[transaction_id]
+        mismatch = {
+            'transaction_id': transaction_id,
+            'payment_id': payment_id,
+            'settlement_amount': row['amount'],
+            'payment_amount': amount,
+            'settlement_status': row['status'],
+            'payment_status': payment_status,
+        }
+        try:
+            settlement_amount = Decimal(row['amount'])
+        except (InvalidOperation, TypeError):
+            settlement_amount = None
+        if settlement_amount != amount:
+            writer.writerow({'kind': 'amount_mismatch', **mismatch})
+            counts['amount_mismatch'] += 1
+        if SETTLEMENT_STATUS_MAP.get(row['status']) != payment_status:
+            writer.writerow({'kind': 'status_mismatch', **mismatch})
+            counts['status_mismatch'] += 1
+        counts['matched'] += 1
+
+    for transaction_id, row in by_txn.items():
+        if transaction_id not in matched:
+            writer.writerow({
+                'kind': 'missing_payment',
+                'transaction_id': transaction_id,
+                'settlement_amount': row['amount'],
+                'settlement_status': row['status'],
+            })
+            counts['missing_payment'] += 1
+
+
+def reconcile(settlement_file, output_file, start=None, end=None, batch_size=5000):
+    """
+    Stream a settlement CSV and write mismatches to output_file as CSV.
+    Settlement rows are matched against payments one batch query at a time. If a
+    processed_at window is given, settled payments absent from the file are reported too.
+    Memory use is bounded by batch_size regardless of file size.
+    """
+    writer = csv.DictWriter(output_file, fieldnames=MISMATCH_FIELDS)
+    writer.writeheader()
+    counts = {
+        'rows': 0,
+        'matched': 0,
+        'amount_mismatch': 0,
+        'status_mismatch': 0,
+        'missing_payment': 0,
+        'missing_settlement': 0,
+    }
+
+    check_missing = start is not None and end is not None
+    seen = SeenTransactions() if check_missing else None
+    try:
+        reader = csv.DictReader(settlement_file)
+        for rows in _batches(reader, batch_size):
+            counts['rows'] += len(rows)
+            if seen:
+                seen.add_many(row['transaction_id'] for row in rows)
+            _compare_batch(rows, writer, counts)
+
+        if check_missing:
+            settled = (
+                Payment.objects.filter(
+                    processed_at__gte=start,
+                    processed_at__lt=end,
+                    status__in=SETTLED_PAYMENT_STATUSES,
+                    gateway_transaction_id__isnull=False,
+                )
+                .order_by()
+                .values_list('gateway_transaction_id', 'id', 'amount', 'status')
+                .iterator(chunk_size=batch_size)
+            )
+            for payments in _batches(settled, batch_size):
+                by_txn = {p[0]: p for p in payments}
+                for transaction_id in seen.missing(by_txn):
+                    _, payment_id, amount, payment_status = by_txn[transaction_id]
+                    writer.writerow({
+                        'kind': 'missing_settlement',
+                        'transaction_id': transaction_id,
+                        'payment_id': payment_id,
+                        'payment_amount': amount,
+                        'payment_status': payment_status,
+                    })
+                    counts['missing_settlement'] += 1
+    finally:
+        if seen:
+            seen.close()
+
+    return counts
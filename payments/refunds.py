@@ -0,0 +1,150 @@
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from .models import Payment, PaymentGatewayEvent, PaymentRefundJob
+from .fake_gateway import GATEWAY_MAP
+from orders.models import Order
+from ledger.posting import record_refund
+import logging
+
+logger = logging.getLogger(__name__)
+
+REFUND_BATCH_SIZE = 200
+# Keep the job row small, the counters still cover every failure
+MAX_RECORDED_ERRORS = 100
+
+
+def get_refund_concurrency():
+    return getattr(settings, 'PAYMENT_REFUND_CONCURRENCY', 8)
+
+
+def create_refund_job(payment_ids, requested_by=None):
+    payment_ids = list(dict.fromkeys(str(payment_id) for payment_id in payment_ids))
+    return PaymentRefundJob.objects.create(
+        requested_by=requested_by,
+        payment_ids=payment_ids,
+        total=len(payment_ids),
+    )
+
+
+def claim_for_refund(payment_id):
+    """
+    Move a completed payment to 'refunding'. Only one caller wins the claim, the
+    others must not call the gateway.
+    """
+    return Payment.objects.filter(id=payment_id, status='completed').update(
+        status='refunding', updated_at=timezone.now()
+    ) == 1
+
+
+def release_refund_claims(payment_ids):
+    """
+    Give claimed payments back after the gateway declined or failed the refund
+    """
+    Payment.objects.filter(id__in=payment_ids, status='refunding').update(
+        status='completed', updated_at=timezone.now()
+    )
+
+
+def _refund_one(gateway, payment):
+    try:
+        return payment, gateway.refund_payment(payment.gateway_transaction_id, payment.amount), None
+    except Exception as e:
+        return payment, None, str(e)
+
+
+def _apply_results(results):
+    """
+    Write one batch of gateway responses for claimed payments: bulk payment/order
+    updates, one bulk insert of gateway events, and the ledger postings, all in one
+    transaction. Payments the gateway didn't refund are released.
+    """
+    now = timezone.now()
+    refunded, events, errors = [], [], []
+
+    for payment, response, error in results:
+        if response is not None:
+            events.append(PaymentGatewayEvent.build(payment, 'refund', response))
+        if response is not None and response.get('status') == 'refunded':
+            payment.status = 'refunded'
+            payment.refund_id = response.get('refund_id')
+            payment.updated_at = now
+            refunded.append(payment)
+        else:
+            errors.append({
+                'payment_id': str(payment.id),
+                'error': error or f"Gateway returned status {response.get('status')}",
+            })
+
+    with transaction.atomic():
+        Payment.objects.bulk_update(refunded, ['status', 'refund_id', 'updated_at'])
+        PaymentGatewayEvent.objects.bulk_create(events)
+        Order.objects.filter(id__in=[payment.order_id for payment in refunded]).update(
+            status='canceled', updated_at=now
+        )
+        for payment in refunded:
+            record_refund(payment)
+        release_refund_claims([error['payment_id'] for error in errors])
+
+    return refunded, errors
+
+
+def run_refund_job(job, concurrency=None, batch_size=REFUND_BATCH_SIZE):
+    """
+    Refund the job's payments. Each batch is split by gateway and every gateway
+    gets its own pool of `concurrency` threads, so one slow gateway doesn't hold up
+    the others and none of them sees more than `concurrency` calls at once.
+    Progress is saved on the job after every batch.
+    """
+    from .tasks import send_payment_notification
+
+    claimed = PaymentRefundJob.objects.filter(pk=job.pk, status='pending').update(
+        status='running', started_at=timezone.now()
+    )
+    if not claimed:
+        return job
+    job.refresh_from_db()
+
+    concurrency = concurrency or get_refund_concurrency()
+    executors = defaultdict(
+        lambda: ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='refund')
+    )
+    try:
+        for start in range(0, len(job.payment_ids), batch_size):
+            batch_ids = job.payment_ids[start:start + batch_size]
+            # A payment also in another job or refunded through the API is claimed only once
+            payments = [
+                payment for payment in Payment.objects.filter(id__in=batch_ids)
+                if payment.status == 'completed' and payment.payment_method in GATEWAY_MAP
+                and claim_for_refund(payment.id)
+            ]
+
+            futures = [
+                executors[payment.payment_method].submit(_refund_one, GATEWAY_MAP[payment.payment_method], payment)
+                for payment in payments
+            ]
+            refunded, errors = _apply_results([future.result() for future in futures])
+
+            job.refunded_count += len(refunded)
+            job.failed_count += len(errors)
+            job.skipped_count += len(batch_ids) - len(payments)
+            job.errors = (job.errors + errors)[:MAX_RECORDED_ERRORS]
+            job.save(update_fields=['refunded_count', 'failed_count', 'skipped_count', 'errors'])
+
+            for payment in refunded:
+                send_payment_notification.delay(str(payment.id), 'payment_refunded')
+
+        job.status = 'completed'
+    except Exception as e:
+        logger.error(f"Refund job {job.id} failed: {e}")
+        job.status = 'failed'
+        raise
+    finally:
+        for executor in executors.values():
+            executor.shutdown(wait=True)
+        job.finished_at = timezone.now()
+        job.save(update_fields=['status', 'finished_at'])
+
+    return job
@@ -0,0 +1,134 @@
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+from django.db import transaction
+from django.db.models import Count, Sum, Q
+from django.utils import timezone
+from .models import Payment, PaymentDailyRollup, PaymentRollupState
+from currencies.rates import to_base
+
+CENTS = Decimal('0.01')
+
+
+def day_bounds(day):
+    """
+    Half-open [start, end) range for a calendar day, so the created_at index can be used
+    """
+    start = timezone.make_aware(datetime.combine(day, time.min))
+    return start, start + timedelta(days=1)
+
+
+def aggregate_day(day):
+    """
+    Aggregate one day of payments in a single conditional-aggregation query.
+    Returns rows of (payment_method, status, currency, count, total_amount).
+    """
+    start, end = day_bounds(day)
+    statuses = [choice[0] for choice in Payment.PAYMENT_STATUS_CHOICES]
+
+    aggregates = {}
+    for status in statuses:
+        aggregates[f'{status}_count'] = Count('id', filter=Q(status=status))
+        aggregates[f'{status}_amount'] = Sum('amount', filter=Q(status=status))
+
+    grouped = (
+        Payment.objects.filter(created_at__gte=start, created_at__lt=end)
+        .order_by()
+        .values('payment_method', 'currency')
+        .annotate(**aggregates)
+    )
+
+    rows = []
+    for group in grouped:
+        for status in statuses:
+            count = group[f'{status}_count']
+            if count:
+                rows.append((
+                    group['payment_method'],
+                    status,
+                    group['currency'],
+                    count,
+                    (group[f'{status}_amount'] or Decimal('0')).quantize(CENTS),
+                ))
+    return rows
+
+
+def refresh_daily_rollup(day, refreshed_at=None):
+    """
+    Recompute the rollup rows for one day and replace the stored buckets. Buckets are upserted
+    on their unique key, so a refresh of the same day running concurrently can't make the insert
+    fail, and buckets that no longer have payments are deleted.
+    """
+    refreshed_at = refreshed_at or timezone.now()
+    rows = aggregate_day(day)
+
+    rollups = [
+        PaymentDailyRollup(
+            date=day,
+            payment_method=payment_method,
+            status=status,
+            currency=currency,
+            payment_count=count,
+            total_amount=total_amount,
+            total_amount_base=to_base(total_amount, currency),
+            refreshed_at=refreshed_at,
+        )
+        for payment_method, status, currency, count, total_amount in rows
+    ]
+
+    stale = PaymentDailyRollup.objects.filter(date=day)
+    for rollup in rollups:
+        stale = stale.exclude(payment_method=rollup.payment_method, status=rollup.status, currency=rollup.currency)
+
+    with transaction.atomic():
+        stale.delete()
+        PaymentDailyRollup.objects.bulk_create(
+            rollups,
+            update_conflicts=True,
+            unique_fields=['date', 'payment_method', 'status', 'currency'],
+            update_fields=['payment_count', 'total_amount', 'total_amount_base', 'refreshed_at'],
+        )
+
+    return rollups
+
+
+def refresh_touched_rollups():
+    """
+    Refresh only the days that have payments created or updated since the last incremental
+    refresh. Its watermark lives in PaymentRollupState: rollup rows also get refreshed one day
+    at a time by the daily report, so their refreshed_at says nothing about other days.
+    """
+    started = timezone.now()
+    state, _ = PaymentRollupState.objects.get_or_create(pk=1)
+
+    if state.refreshed_through is None:
+        days = Payment.objects.dates('created_at', 'day')
+    else:
+        days = Payment.objects.filter(updated_at__gte=state.refreshed_through).dates('created_at', 'day')
+
+    days = list(days)
+    for day in days:
+        refresh_daily_rollup(day, refreshed_at=started)
+
+    state.refreshed_through = started
+    state.save(update_fields=['refreshed_through'])
+    return days
+
+
+def summarize(rollups):
+    """
+    Collapse rollup rows into the daily report stats, amounts in the base currency
+    """
+    stats = {
+        'total_payments': 0,
+        'completed': 0,
+        'failed': 0,
+        'pending': 0,
+        'total_amount': Decimal('0.00'),
+    }
+    for rollup in rollups:
+        stats['total_payments'] += rollup.payment_count
+        if rollup.status in stats:
+            stats[rollup.status] += rollup.payment_count
+        if rollup.status == 'completed':
+            stats['total_amount'] += rollup.total_amount_base
+    return stats
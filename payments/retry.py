@@ -0,0 +1,57 @@
+from datetime import timedelta
+from django.utils import timezone
+
+# Backoff policy per gateway error code. Codes that are missing here
+# (FRAUD_DETECTED, INVALID_CARD, ...) are never retried.
+RETRY_POLICY = {
+    'NETWORK_ERROR': {'base_delay': 60, 'max_delay': 3600, 'max_attempts': 6},
+    'INSUFFICIENT_FUNDS': {'base_delay': 1800, 'max_delay': 21600, 'max_attempts': 3},
+}
+
+# How long a claimed retry stays invisible to the scheduler while its task runs
+RETRY_LEASE_SECONDS = 300
+
+
+def is_retryable(error_code):
+    return error_code in RETRY_POLICY
+
+
+def compute_backoff(error_code, attempts):
+    """
+    Exponential delay in seconds before the next attempt, capped per error code
+    """
+    policy = RETRY_POLICY[error_code]
+    return min(policy['base_delay'] * (2 ** attempts), policy['max_delay'])
+
+
+def get_error_code(gateway_result):
+    if not gateway_result:
+        return None
+    return gateway_result.get('error_code') or (gateway_result.get('gateway_response') or {}).get('error_code')
+
+
+def schedule_retry(payment, error_code):
+    """
+    Record a failed attempt and schedule the next one.
+    Returns the PaymentRetry if another attempt is scheduled, otherwise None.
+    """
+    from .models import PaymentRetry
+
+    retry = getattr(payment, 'retry', None)
+    if retry is None:
+        if not is_retryable(error_code):
+            return None
+        retry = PaymentRetry(payment=payment)
+
+    retry.last_error_code = error_code or ''
+
+    if not is_retryable(error_code) or retry.attempts >= RETRY_POLICY[error_code]['max_attempts']:
+        retry.is_active = False
+        retry.next_attempt_at = None
+        retry.save()
+        return None
+
+    retry.is_active = True
+    retry.next_attempt_at = timezone.now() + timedelta(seconds=compute_backoff(error_code, retry.attempts))
+    retry.save()
+    return retry
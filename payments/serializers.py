@@ -1,11 +1,12 @@
 from rest_framework import serializers
-from .models import Payment
+from django.conf import settings
+from .models import Payment, PaymentDailyRollup, PaymentRefundJob
 
 class PaymentSerializer(serializers.ModelSerializer):
     class Meta:
         model = Payment
-        fields = '__all__'
-        read_only_fields = ['id', 'gateway_transaction_id', 'gateway_response', 
+        exclude = ['fraud_score', 'fraud_action']
+        read_only_fields = ['id', 'gateway_transaction_id', 'error_code', 'fee', 'refund_id',
                            'processed_at', 'created_at', 'updated_at']
 
 class PaymentCreateSerializer(serializers.Serializer):
@@ -24,4 +25,25 @@ class PaymentCreateSerializer(serializers.Serializer):
                 if not attrs.get(field):
                     raise serializers.ValidationError(f'{field} is required for card payments')
         
-        return attrs
\ No newline at end of file
+        return attrs
+
+class PaymentDailyRollupSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = PaymentDailyRollup
+        fields = ['date', 'payment_method', 'status', 'currency', 'payment_count', 'total_amount', 'total_amount_base']
+
+class BatchRefundSerializer(serializers.Serializer):
+    payment_ids = serializers.ListField(
+        child=serializers.UUIDField(),
+        allow_empty=False,
+        max_length=settings.PAYMENT_REFUND_MAX_BATCH
+    )
+
+class PaymentRefundJobSerializer(serializers.ModelSerializer):
+    processed = serializers.IntegerField(read_only=True)
+    
+    class Meta:
+        model = PaymentRefundJob
+        fields = ['id', 'status', 'total', 'processed', 'refunded_count', 'failed_count', 'skipped_count',
+                  'errors', 'requested_by', 'created_at', 'started_at', 'finished_at']
+        read_only_fields = fields
@@ -1,54 +1,63 @@
-from celery import shared_task
+from celery import shared_task, group
 from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from django.db import transaction
 from django.contrib.auth import get_user_model
-from .models import Payment
+from .models import Payment, PaymentGatewayEvent, PaymentRetry, PaymentRefundJob
 from .fake_gateway import GATEWAY_MAP
+from .retry import schedule_retry, get_error_code, RETRY_LEASE_SECONDS
+from .reporting import refresh_daily_rollup, refresh_touched_rollups, summarize
+from .reconciliation import reconcile, open_settlement
+from .webhooks import drain_inbox
+from .refunds import run_refund_job
+from .fraud import screen_payment, record_attempt, FRAUD_BLOCKED_CODE
+from ledger.posting import record_charge, gateway_fee
+from datetime import date
 import logging
 
 User = get_user_model()
 logger = logging.getLogger(__name__)
 
+# Error code for a claimed payment whose processing raised before a gateway result was saved
+PROCESSING_ERROR_CODE = 'PROCESSING_ERROR'
+
 @shared_task
 def process_payment_async(payment_id):
     """
-    Process payment asynchronously
+    Process payment asynchronously.
+    Failed payments with an active retry schedule are attempted again.
     """
     try:
-        payment = Payment.objects.get(id=payment_id)
+        payment = Payment.objects.select_related('order__service', 'user', 'retry').get(id=payment_id)
+        retry = getattr(payment, 'retry', None)
+        is_retry = payment.status == 'failed' and retry is not None and retry.is_active
         
-        if payment.status != 'pending':
+        if payment.status != 'pending' and not is_retry:
             return f"Payment {payment_id} is not in pending status"
         
-        payment.status = 'processing'
-        payment.save()
-        
-        gateway = GATEWAY_MAP.get(payment.payment_method)
-        if not gateway:
-            payment.status = 'failed'
-            payment.save()
-            return f"No gateway found for payment method: {payment.payment_method}"
+        # The order may have been canceled or paid since the failed attempt, only charge it while it's pending
+        if is_retry and payment.order.status != 'pending':
+            PaymentRetry.objects.filter(pk=retry.pk).update(is_active=False, next_attempt_at=None)
+            logger.info(f"Retry of payment {payment_id} stopped, order {payment.order_id} is {payment.order.status}")
+            return f"Order {payment.order_id} is not in pending status"
         
-        result = gateway.process_payment(
-            amount=payment.amount,
-            payment_method=payment.payment_method,
-            card_data=None
+        # Conditional claim, an overlapping delivery of the same task finds the status changed and stops
+        claimed = Payment.objects.filter(id=payment.id, status=payment.status).update(
+            status='processing', updated_at=timezone.now()
         )
+        if not claimed:
+            return f"Payment {payment_id} is already being processed"
+        payment.status = 'processing'
         
-        if result['status'] == 'completed':
-            payment.status = 'completed'
-            payment.gateway_transaction_id = result['transaction_id']
-            payment.gateway_response = result.get('gateway_response', {})
-            payment.processed_at = timezone.now()
-        else:
-            payment.status = 'failed'
-            payment.gateway_response = result.get('gateway_response', {})
-        
-        payment.save()
-        
-        send_payment_notification.delay(payment.id, 'payment_processed')
+        if is_retry:
+            retry.attempts += 1
+            retry.save(update_fields=['attempts', 'updated_at'])
         
-        logger.info(f"Payment {payment_id} processed with status: {payment.status}")
-        return f"Payment processed: {payment.status}"
+        try:
+            return charge_claimed_payment(payment, retry)
+        except Exception:
+            release_claim(payment)
+            raise
     
     except Payment.DoesNotExist:
         logger.error(f"Payment with id {payment_id} not found")
@@ -57,6 +66,87 @@ def process_payment_async(payment_id):
         logger.error(f"Error processing payment {payment_id}: {e}")
         return f"Error: {e}"
 
+def release_claim(payment):
+    """
+    Fail a payment left in 'processing' by an unexpected error, so it isn't stuck there with
+    its retry still active. The outcome at the gateway is unknown, so it is not retried.
+    """
+    released = Payment.objects.filter(id=payment.id, status='processing').update(
+        status='failed', error_code=PROCESSING_ERROR_CODE, updated_at=timezone.now()
+    )
+    if not released:
+        return
+    payment.status = 'failed'
+    payment.error_code = PROCESSING_ERROR_CODE
+    if schedule_retry(payment, PROCESSING_ERROR_CODE) is None and payment.order.status == 'pending':
+        payment.order.status = 'canceled'
+        payment.order.save()
+
+def charge_claimed_payment(payment, retry):
+    """
+    Charge a payment claimed by process_payment_async (status 'processing')
+    """
+    gateway = GATEWAY_MAP.get(payment.payment_method)
+    if not gateway:
+        payment.status = 'failed'
+        payment.save()
+        return f"No gateway found for payment method: {payment.payment_method}"
+    
+    assessment = screen_payment(payment)
+    if assessment and assessment.action == 'block':
+        payment.status = 'failed'
+        payment.error_code = FRAUD_BLOCKED_CODE
+        payment.save()
+        record_attempt(payment, failed=True)
+        
+        if retry is not None:
+            PaymentRetry.objects.filter(pk=retry.pk).update(is_active=False, next_attempt_at=None)
+        if payment.order.status == 'pending':
+            payment.order.status = 'canceled'
+            payment.order.save()
+        
+        send_payment_notification.delay(payment.id, 'payment_failed')
+        logger.warning(f"Payment {payment.id} blocked by fraud screening: {assessment.features}")
+        return f"Payment blocked by fraud screening"
+    
+    result = gateway.process_payment(
+        amount=payment.amount,
+        payment_method=payment.payment_method,
+        card_data=None
+    )
+    record_attempt(payment, failed=result['status'] != 'success')
+    
+    if result['status'] == 'success':
+        with transaction.atomic():
+            payment.status = 'completed'
+            payment.gateway_transaction_id = result['transaction_id']
+            payment.error_code = ''
+            payment.fee = gateway_fee(result)
+            payment.processed_at = timezone.now()
+            payment.save()
+            PaymentGatewayEvent.record(payment, 'charge', result)
+            
+            if retry is not None:
+                PaymentRetry.objects.filter(pk=retry.pk).update(is_active=False, next_attempt_at=None)
+            if payment.order.status == 'pending':
+                payment.order.status = 'paid'
+                payment.order.save()
+            record_charge(payment, payment.fee)
+    else:
+        payment.status = 'failed'
+        payment.error_code = get_error_code(result) or ''
+        payment.save()
+        PaymentGatewayEvent.record(payment, 'charge', result)
+        
+        if schedule_retry(payment, payment.error_code) is None and payment.order.status == 'pending':
+            payment.order.status = 'canceled'
+            payment.order.save()
+    
+    send_payment_notification.delay(payment.id, 'payment_processed')
+    
+    logger.info(f"Payment {payment.id} processed with status: {payment.status}")
+    return f"Payment processed: {payment.status}"
+
 @shared_task
 def send_payment_notification(payment_id, notification_type):
     """
@@ -84,23 +174,31 @@ def send_payment_notification(payment_id, notification_type):
         return f"Error: {e}"
 
 @shared_task
-def retry_failed_payments():
+def retry_failed_payments(batch_size=1000, chunk_size=100):
     """
-    Retry failed payments that might be recoverable
+    Enqueue failed payments whose backoff has elapsed.
+    Due rows are claimed with a lease so overlapping runs don't queue them twice.
     """
     try:
-        cutoff_time = timezone.now() - timezone.timedelta(hours=24)
-        failed_payments = Payment.objects.filter(
-            status='failed',
-            created_at__gte=cutoff_time
+        now = timezone.now()
+        due_ids = list(
+            PaymentRetry.objects.filter(is_active=True, next_attempt_at__lte=now)
+            .order_by('next_attempt_at')
+            .values_list('payment_id', flat=True)[:batch_size]
         )
         
-        retry_count = 0
-        for payment in failed_payments:
-            if payment.order.status == 'pending':
-                process_payment_async.delay(payment.id)
-                retry_count += 1
+        if not due_ids:
+            return "Queued 0 payments for retry"
+        
+        PaymentRetry.objects.filter(payment_id__in=due_ids).update(
+            next_attempt_at=now + timezone.timedelta(seconds=RETRY_LEASE_SECONDS)
+        )
+        
+        for start in range(0, len(due_ids), chunk_size):
+            chunk = due_ids[start:start + chunk_size]
+            group(process_payment_async.s(str(payment_id)) for payment_id in chunk).apply_async()
         
+        retry_count = len(due_ids)
         logger.info(f"Queued {retry_count} failed payments for retry")
         return f"Queued {retry_count} payments for retry"
     
@@ -109,21 +207,16 @@ def retry_failed_payments():
         return f"Error: {e}"
 
 @shared_task
-def generate_payment_report():
+def generate_payment_report(day=None):
     """
-    Generate daily payment report
+    Generate daily payment report from the rollup table
     """
     try:
-        today = timezone.now().date()
-        payments_today = Payment.objects.filter(created_at__date=today)
-        
-        stats = {
-            'total_payments': payments_today.count(),
-            'completed': payments_today.filter(status='completed').count(),
-            'failed': payments_today.filter(status='failed').count(),
-            'pending': payments_today.filter(status='pending').count(),
-            'total_amount': sum(p.amount for p in payments_today.filter(status='completed'))
-        }
+        report_day = date.fromisoformat(day) if day else timezone.now().date()
+        rollups = refresh_daily_rollup(report_day)
+        
+        stats = summarize(rollups)
+        stats['total_amount'] = str(stats['total_amount'])
         
         logger.info(f"Daily payment report: {stats}")
         return f"Payment report generated: {stats}"
@@ -131,3 +224,79 @@ def generate_payment_report():
     except Exception as e:
         logger.error(f"Error generating payment report: {e}")
         return f"Error: {e}"
+
+@shared_task
+def refresh_payment_rollups():
+    """
+    Refresh daily rollups for days with payments changed since the last run
+    """
+    try:
+        days = refresh_touched_rollups()
+        
+        logger.info(f"Refreshed payment rollups for {len(days)} days")
+        return f"Refreshed payment rollups for {len(days)} days"
+    
+    except Exception as e:
+        logger.error(f"Error refreshing payment rollups: {e}")
+        return f"Error: {e}"
+
+@shared_task
+def reconcile_settlement_file(settlement_path, output_path, start=None, end=None, batch_size=5000):
+    """
+    Reconcile a gateway settlement file and write mismatches to output_path
+    """
+    try:
+        start = parse_datetime(start) if start else None
+        end = parse_datetime(end) if end else None
+        
+        with open_settlement(settlement_path) as settlement_file, \
+                open(output_path, 'w', newline='') as output_file:
+            counts = reconcile(settlement_file, output_file, start=start, end=end, batch_size=batch_size)
+        
+        logger.info(f"Settlement reconciliation for {settlement_path}: {counts}")
+        return f"Reconciliation completed: {counts}"
+    
+    except Exception as e:
+        logger.error(f"Error reconciling settlement file {settlement_path}: {e}")
+        return f"Error: {e}"
+
+@shared_task
+def process_webhook_inbox(batch_size=500, max_batches=20):
+    """
+    Drain the webhook inbox in batches
+    """
+    try:
+        processed = 0
+        for _ in range(max_batches):
+            consumed = drain_inbox(batch_size=batch_size)
+            processed += consumed
+            if consumed < batch_size:
+                break
+        
+        if processed:
+            logger.info(f"Processed {processed} payment webhooks")
+        return f"Processed {processed} payment webhooks"
+    
+    except Exception as e:
+        logger.error(f"Error processing payment webhooks: {e}")
+        return f"Error: {e}"
+
+@shared_task
+def process_refund_job(job_id):
+    """
+    Run a batch refund job created by the batch refund API or admin action
+    """
+    try:
+        job = PaymentRefundJob.objects.get(id=job_id)
+        job = run_refund_job(job)
+        
+        logger.info(f"Refund job {job_id} {job.status}: {job.refunded_count} refunded, "
+                    f"{job.failed_count} failed, {job.skipped_count} skipped")
+        return f"Refund job {job.status}: {job.refunded_count}/{job.total} refunded"
+    
+    except PaymentRefundJob.DoesNotExist:
+        logger.error(f"Refund job with id {job_id} not found")
+        return f"Refund job not found"
+    except Exception as e:
+        logger.error(f"Error running refund job {job_id}: {e}")
+        return f"Error: {e}"
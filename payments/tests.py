@@ -1,56 +1,97 @@
-from django.test import TestCase
+import csv
+import gzip
+import io
+import json
+import os
+import tempfile
+import time
+from django.test import TestCase, override_settings
+from django.conf import settings
+from django.core.management import call_command
 from django.contrib.auth import get_user_model
 from django.urls import reverse
 from rest_framework.test import APITestCase, APIClient
 from rest_framework import status
 from rest_framework_simplejwt.tokens import RefreshToken
+from django.utils import timezone
+from decimal import Decimal
 from unittest.mock import patch, MagicMock
-from .models import Payment
+from .models import Payment, PaymentRetry, PaymentDailyRollup, PaymentWebhookEvent
+from .serializers import PaymentSerializer
+from .refunds import create_refund_job, run_refund_job
+from .fraud import (
+    InMemoryCounters, assess_payment, record_attempt, rescore_payments, reset_counters, score_matrix,
+    FRAUD_BLOCKED_CODE
+)
+from .tasks import process_payment_async, retry_failed_payments, generate_payment_report, process_webhook_inbox
 from orders.models import Order
+from ledger.models import LedgerEntry
+from notifications.models import OutboxMessage
 from services.models import Service, ServiceCategory
 from accounts.models import User
 
 User = get_user_model()
 
-class PaymentModelTest(TestCase):
-    def setUp(self):
-        self.client_user = User.objects.create_user(
-            username='client',
-            email='client@example.com',
-            password='clientpass123',
-            role='client'
-        )
-        
-        self.worker_user = User.objects.create_user(
-            username='worker',
-            email='worker@example.com',
-            password='workerpass123',
-            role='worker'
+class PaymentFixtures:
+    """
+    Users, a service and order/payment factories shared by the payment tests
+    """
+    
+    def create_user(self, role):
+        return User.objects.create_user(
+            username=role,
+            email=f'{role}@example.com',
+            password=f'{role}pass123',
+            role=role
         )
-        
+    
+    def get_jwt_token(self, user):
+        refresh = RefreshToken.for_user(user)
+        return str(refresh.access_token)
+    
+    def create_service(self, base_price=500.00):
         self.category = ServiceCategory.objects.create(
             name='Web Development',
             description='All web development services'
         )
-        
-        self.service = Service.objects.create(
+        return Service.objects.create(
             name='WordPress Website',
             description='Custom WordPress development',
-            base_price=500.00,
+            base_price=base_price,
             category=self.category,
             duration_hours=40
         )
-        
-        self.order = Order.objects.create(
+    
+    def create_order(self, total_price=500.00, **fields):
+        return Order.objects.create(
             client=self.client_user,
             service=self.service,
             description='Need a business website',
             address='123 Main St',
             scheduled_date='2024-01-01 10:00:00',
-            total_price=500.00,
-            status='pending'
+            total_price=total_price,
+            **fields
         )
     
+    def create_payment(self, amount=500.00, order=None, quantity=1, **fields):
+        """
+        Payment of `amount` by the client, for a new order of the same total unless one is given
+        """
+        fields.setdefault('payment_method', 'card')
+        return Payment.objects.create(
+            order=order or self.create_order(total_price=amount, quantity=quantity),
+            user=self.client_user,
+            amount=amount,
+            **fields
+        )
+
+class PaymentModelTest(PaymentFixtures, TestCase):
+    def setUp(self):
+        self.client_user = self.create_user('client')
+        self.worker_user = self.create_user('worker')
+        self.service = self.create_service()
+        self.order = self.create_order(status='pending')
+    
     def test_create_payment(self):
         payment = Payment.objects.create(
             order=self.order,
@@ -75,66 +116,16 @@ class PaymentModelTest(TestCase):
         expected_str = f"Payment {payment.id} - {payment.amount} - {payment.status}"
         self.assertEqual(str(payment), expected_str)
 
-class PaymentAPITest(APITestCase):
+class PaymentAPITest(PaymentFixtures, APITestCase):
     def setUp(self):
         self.client = APIClient()
         
-        self.client_user = User.objects.create_user(
-            username='client',
-            email='client@example.com',
-            password='clientpass123',
-            role='client'
-        )
-        
-        self.worker_user = User.objects.create_user(
-            username='worker',
-            email='worker@example.com',
-            password='workerpass123',
-            role='worker'
-        )
-        
-        self.admin_user = User.objects.create_user(
-            username='admin',
-            email='admin@example.com',
-            password='adminpass123',
-            role='admin'
-        )
-        
-        self.category = ServiceCategory.objects.create(
-            name='Web Development',
-            description='All web development services'
-        )
-        
-        self.service = Service.objects.create(
-            name='WordPress Website',
-            description='Custom WordPress development',
-            base_price=500.00,
-            category=self.category,
-            duration_hours=40
-        )
-        
-        self.order = Order.objects.create(
-            client=self.client_user,
-            service=self.service,
-            description='Need a business website',
-            address='123 Main St',
-            scheduled_date='2024-01-01 10:00:00',
-            total_price=500.00,
-            status='pending'
-        )
-        
-        # Create test payment
-        self.payment = Payment.objects.create(
-            order=self.order,
-            user=self.client_user,
-            amount=500.00,
-            payment_method='card',
-            gateway_transaction_id='txn_123456789'
-        )
-    
-    def get_jwt_token(self, user):
-        refresh = RefreshToken.for_user(user)
-        return str(refresh.access_token)
+        self.client_user = self.create_user('client')
+        self.worker_user = self.create_user('worker')
+        self.admin_user = self.create_user('admin')
+        self.service = self.create_service()
+        self.order = self.create_order(status='pending')
+        self.payment = self.create_payment(order=self.order, gateway_transaction_id='txn_123456789')
     
     def test_payment_list_authenticated_users(self):
         token = self.get_jwt_token(self.client_user)
@@ -293,3 +284,790 @@ class FakePaymentGatewayTest(TestCase):
         
         self.assertIsInstance(result['status'], str)
         self.assertIsInstance(result['status'], str)
+    
+    def test_seeded_gateways_are_reproducible(self):
+        from .fake_gateway import FakePaymentGateway
+        
+        first = FakePaymentGateway('realistic', seed=42, time_scale=0)
+        second = FakePaymentGateway('realistic', seed=42, time_scale=0)
+        
+        for _ in range(50):
+            a = first.process_payment(Decimal('10.00'), 'card')
+            b = second.process_payment(Decimal('10.00'), 'card')
+            self.assertEqual(a['transaction_id'], b['transaction_id'])
+            self.assertEqual(a['status'], b['status'])
+            self.assertEqual(a.get('error_code'), b.get('error_code'))
+            self.assertEqual(a['gateway_response']['latency_ms'], b['gateway_response']['latency_ms'])
+    
+    def test_seeded_gateway_is_reproducible_across_threads(self):
+        from concurrent.futures import ThreadPoolExecutor
+        from .fake_gateway import FakePaymentGateway
+        
+        def outcomes(gateway, concurrency):
+            with ThreadPoolExecutor(max_workers=concurrency) as executor:
+                results = executor.map(lambda _: gateway.process_payment(Decimal('10.00'), 'card'), range(200))
+                return sorted(
+                    (r['transaction_id'], r['status'], r.get('error_code'), r['gateway_response']['latency_ms'])
+                    for r in results
+                )
+        
+        sequential = outcomes(FakePaymentGateway('realistic', seed=7, time_scale=0), 1)
+        self.assertEqual(outcomes(FakePaymentGateway('realistic', seed=7, time_scale=0), 16), sequential)
+        
+        gateway = FakePaymentGateway('realistic', seed=1, time_scale=0)
+        gateway.process_payment(Decimal('10.00'), 'card')
+        gateway.reseed(7)
+        self.assertEqual(outcomes(gateway, 8), sequential)
+    
+    @patch('payments.fake_gateway.time.sleep')
+    def test_profile_error_mix_and_time_scale(self, mock_sleep):
+        from .fake_gateway import FakePaymentGateway
+        
+        gateway = FakePaymentGateway({
+            'base': 'fast',
+            'success_rate': 0,
+            'error_mix': {'NETWORK_ERROR': 1},
+        }, seed=1, time_scale=0.5)
+        
+        result = gateway.process_payment(Decimal('10.00'), 'payme')
+        self.assertEqual(result['error_code'], 'NETWORK_ERROR')
+        self.assertEqual(result['gateway_response']['latency_ms'], 50.0)
+        mock_sleep.assert_called_once_with(0.025)
+    
+    def test_latency_distributions(self):
+        import random
+        from .fake_gateway import sample_latency
+        
+        rng = random.Random(7)
+        long_tail = {'distribution': 'long_tail', 'median': 0.5, 'sigma': 0.4,
+                     'tail_probability': 0.05, 'tail_alpha': 1.5, 'max': 30}
+        samples = sorted(sample_latency(rng, long_tail) for _ in range(2000))
+        self.assertAlmostEqual(samples[1000], 0.5, delta=0.1)
+        self.assertGreater(samples[-1], 5 * samples[1000])
+        self.assertLessEqual(samples[-1], 30)
+        
+        with self.assertRaises(ValueError):
+            sample_latency(rng, {'distribution': 'bimodal'})
+    
+    @override_settings(PAYMENT_GATEWAY_SEED='bench', PAYMENT_GATEWAY_TIME_SCALE=0)
+    def test_configure_gateways_from_settings(self):
+        from .fake_gateway import GATEWAY_MAP, configure_gateways
+        
+        try:
+            configure_gateways({'click': {'profile': 'degraded'}})
+            self.assertEqual(GATEWAY_MAP['click'].success_rate, 0.6)
+            self.assertEqual(GATEWAY_MAP['payme'].success_rate, 0.85)
+            self.assertEqual(GATEWAY_MAP['card'].time_scale, 0)
+            self.assertEqual(GATEWAY_MAP['card'].seed, 'bench:card')
+        finally:
+            configure_gateways()
+
+class PaymentRetryTest(PaymentFixtures, TestCase):
+    def setUp(self):
+        self.client_user = self.create_user('client')
+        self.service = self.create_service()
+        self.order = self.create_order(status='pending')
+        self.payment = self.create_payment(order=self.order, status='failed')
+    
+    def test_backoff_grows_exponentially_and_is_capped(self):
+        from .retry import compute_backoff
+        self.assertEqual(compute_backoff('NETWORK_ERROR', 0), 60)
+        self.assertEqual(compute_backoff('NETWORK_ERROR', 2), 240)
+        self.assertEqual(compute_backoff('NETWORK_ERROR', 20), 3600)
+    
+    def test_fraud_is_never_retried(self):
+        from .retry import schedule_retry
+        self.assertIsNone(schedule_retry(self.payment, 'FRAUD_DETECTED'))
+        self.assertFalse(PaymentRetry.objects.exists())
+    
+    def test_network_error_is_scheduled(self):
+        from .retry import schedule_retry
+        retry = schedule_retry(self.payment, 'NETWORK_ERROR')
+        self.assertTrue(retry.is_active)
+        self.assertEqual(retry.attempts, 0)
+        self.assertGreater(retry.next_attempt_at, timezone.now())
+    
+    def test_retry_exhausted_after_max_attempts(self):
+        from .retry import schedule_retry, RETRY_POLICY
+        PaymentRetry.objects.create(
+            payment=self.payment,
+            attempts=RETRY_POLICY['NETWORK_ERROR']['max_attempts'],
+            last_error_code='NETWORK_ERROR'
+        )
+        self.payment.refresh_from_db()
+        self.assertIsNone(schedule_retry(self.payment, 'NETWORK_ERROR'))
+        self.assertFalse(PaymentRetry.objects.get(payment=self.payment).is_active)
+    
+    @patch('payments.tasks.group')
+    def test_retry_failed_payments_enqueues_only_due_rows(self, mock_group):
+        PaymentRetry.objects.create(
+            payment=self.payment,
+            last_error_code='NETWORK_ERROR',
+            next_attempt_at=timezone.now() - timezone.timedelta(minutes=1)
+        )
+        
+        result = retry_failed_payments()
+        self.assertEqual(result, "Queued 1 payments for retry")
+        self.assertEqual(mock_group.call_count, 1)
+        
+        # The claimed row is leased and not picked up again
+        result = retry_failed_payments()
+        self.assertEqual(result, "Queued 0 payments for retry")
+    
+    @patch('payments.tasks.send_payment_notification.delay')
+    @patch('payments.fake_gateway.FakePaymentGateway.process_payment')
+    def test_process_payment_async_retries_failed_payment(self, mock_process, mock_notify):
+        mock_process.return_value = {
+            'status': 'success',
+            'transaction_id': 'txn_retry',
+            'gateway_response': {'message': 'Payment processed successfully'}
+        }
+        retry = PaymentRetry.objects.create(
+            payment=self.payment,
+            last_error_code='NETWORK_ERROR',
+            next_attempt_at=timezone.now()
+        )
+        
+        process_payment_async(str(self.payment.id))
+        
+        self.payment.refresh_from_db()
+        self.order.refresh_from_db()
+        retry.refresh_from_db()
+        self.assertEqual(self.payment.status, 'completed')
+        self.assertEqual(self.order.status, 'paid')
+        self.assertEqual(retry.attempts, 1)
+        self.assertFalse(retry.is_active)
+    
+    @patch('payments.tasks.send_payment_notification.delay')
+    @patch('payments.fake_gateway.FakePaymentGateway.process_payment')
+    def test_retry_skipped_when_order_no_longer_pending(self, mock_process, mock_notify):
+        retry = PaymentRetry.objects.create(
+            payment=self.payment,
+            last_error_code='NETWORK_ERROR',
+            next_attempt_at=timezone.now()
+        )
+        self.order.status = 'canceled'
+        self.order.save()
+        
+        process_payment_async(str(self.payment.id))
+        
+        mock_process.assert_not_called()
+        self.payment.refresh_from_db()
+        retry.refresh_from_db()
+        self.assertEqual(self.payment.status, 'failed')
+        self.assertEqual(retry.attempts, 0)
+        self.assertFalse(retry.is_active)
+    
+    @patch('payments.tasks.send_payment_notification.delay')
+    @patch('payments.fake_gateway.FakePaymentGateway.process_payment')
+    def test_overlapping_delivery_charges_once(self, mock_process, mock_notify):
+        mock_process.return_value = {
+            'status': 'success',
+            'transaction_id': 'txn_once',
+            'gateway_response': {'message': 'Payment processed successfully'}
+        }
+        PaymentRetry.objects.create(
+            payment=self.payment,
+            last_error_code='NETWORK_ERROR',
+            next_attempt_at=timezone.now()
+        )
+        select_related = Payment.objects.select_related
+        overlapping = []
+        
+        def read_then_deliver_again(*args):
+            payment = select_related(*args).get(id=self.payment.id)
+            if mock_select_related.call_count == 1:
+                # The same task delivered twice: the second copy runs to completion after the
+                # first has read the payment as failed but before it claims it
+                overlapping.append(process_payment_async(str(self.payment.id)))
+            return MagicMock(get=MagicMock(return_value=payment))
+        
+        with patch.object(Payment.objects, 'select_related', side_effect=read_then_deliver_again) as mock_select_related:
+            result = process_payment_async(str(self.payment.id))
+        
+        self.assertEqual(overlapping, ["Payment processed: completed"])
+        self.assertEqual(result, f"Payment {self.payment.id} is already being processed")
+        mock_process.assert_called_once()
+    
+    @patch('payments.tasks.send_payment_notification.delay')
+    @patch('payments.fake_gateway.FakePaymentGateway.process_payment')
+    def test_error_after_claim_releases_payment(self, mock_process, mock_notify):
+        mock_process.side_effect = RuntimeError('connection reset')
+        retry = PaymentRetry.objects.create(
+            payment=self.payment,
+            last_error_code='NETWORK_ERROR',
+            next_attempt_at=timezone.now()
+        )
+        
+        result = process_payment_async(str(self.payment.id))
+        
+        self.assertEqual(result, "Error: connection reset")
+        self.payment.refresh_from_db()
+        self.order.refresh_from_db()
+        retry.refresh_from_db()
+        self.assertEqual(self.payment.status, 'failed')
+        self.assertEqual(self.payment.error_code, 'PROCESSING_ERROR')
+        self.assertFalse(retry.is_active)
+        self.assertEqual(self.order.status, 'canceled')
+    
+    @override_settings(PAYMENT_GATEWAY_EVENT_COMPRESSION=True)
+    @patch('payments.tasks.send_payment_notification.delay')
+    @patch('payments.fake_gateway.FakePaymentGateway.process_payment')
+    def test_failed_attempt_keeps_payload_off_payment_row(self, mock_process, mock_notify):
+        result = {
+            'status': 'failed',
+            'transaction_id': 'txn_failed',
+            'error_code': 'FRAUD_DETECTED',
+            'gateway_response': {'code': '400', 'message': 'Transaction flagged as potentially fraudulent'}
+        }
+        mock_process.return_value = result
+        self.payment.status = 'pending'
+        self.payment.save()
+        
+        process_payment_async(str(self.payment.id))
+        
+        self.payment.refresh_from_db()
+        self.order.refresh_from_db()
+        self.assertEqual(self.payment.error_code, 'FRAUD_DETECTED')
+        self.assertEqual(self.order.status, 'canceled')
+        
+        event = self.payment.gateway_events.get()
+        self.assertIsNone(event.payload)
+        self.assertEqual(event.data, result)
+        self.assertNotIn('gateway_response', PaymentSerializer(self.payment).data)
+
+class PaymentReportingTest(PaymentFixtures, APITestCase):
+    def setUp(self):
+        self.client = APIClient()
+        
+        self.client_user = self.create_user('client')
+        self.admin_user = self.create_user('admin')
+        self.service = self.create_service()
+        
+        for amount, method, payment_status in [
+            (100, 'card', 'completed'),
+            (200, 'card', 'completed'),
+            (300, 'payme', 'failed'),
+            (400, 'click', 'pending'),
+        ]:
+            self.create_payment(amount, payment_method=method, status=payment_status)
+    
+    def test_aggregate_day_is_single_query(self):
+        from .reporting import aggregate_day
+        with self.assertNumQueries(1):
+            rows = aggregate_day(timezone.now().date())
+        self.assertIn(('card', 'completed', 'USD', 2, Decimal('300.00')), rows)
+    
+    def test_generate_payment_report_stores_rollups(self):
+        result = generate_payment_report()
+        self.assertIn("'total_payments': 4", result)
+        self.assertIn("'total_amount': '300.00'", result)
+        
+        rollup = PaymentDailyRollup.objects.get(payment_method='card', status='completed')
+        self.assertEqual(rollup.payment_count, 2)
+        self.assertEqual(rollup.total_amount, Decimal('300.00'))
+        self.assertEqual(PaymentDailyRollup.objects.count(), 3)
+    
+    def test_refresh_touched_rollups_picks_up_status_changes(self):
+        from .reporting import refresh_touched_rollups
+        refresh_touched_rollups()
+        
+        payment = Payment.objects.get(payment_method='payme')
+        payment.status = 'completed'
+        payment.save()
+        
+        self.assertEqual(refresh_touched_rollups(), [timezone.now().date()])
+        self.assertFalse(PaymentDailyRollup.objects.filter(status='failed').exists())
+        self.assertTrue(PaymentDailyRollup.objects.filter(payment_method='payme', status='completed').exists())
+    
+    def test_overlapping_refreshes_of_a_day(self):
+        from .reporting import refresh_daily_rollup
+        day = timezone.now().date()
+        bulk_create = PaymentDailyRollup.objects.bulk_create
+        
+        def refresh_again_first(*args, **kwargs):
+            # Another refresh of the same day commits its buckets between our delete and insert
+            if mock_bulk_create.call_count == 1:
+                refresh_daily_rollup(day)
+            return bulk_create(*args, **kwargs)
+        
+        with patch.object(PaymentDailyRollup.objects, 'bulk_create', side_effect=refresh_again_first) as mock_bulk_create:
+            rollups = refresh_daily_rollup(day)
+        
+        self.assertEqual(len(rollups), 3)
+        self.assertEqual(PaymentDailyRollup.objects.count(), 3)
+        self.assertEqual(PaymentDailyRollup.objects.get(payment_method='card').payment_count, 2)
+    
+    def test_daily_report_does_not_move_the_incremental_watermark(self):
+        from .reporting import refresh_daily_rollup, refresh_touched_rollups
+        refresh_touched_rollups()
+        
+        payment = Payment.objects.get(payment_method='payme')
+        yesterday = timezone.now() - timezone.timedelta(days=1)
+        Payment.objects.filter(id=payment.id).update(created_at=yesterday, updated_at=timezone.now())
+        # The daily report refreshes another day after the change
+        refresh_daily_rollup(timezone.now().date())
+        
+        self.assertEqual(refresh_touched_rollups(), [yesterday.date()])
+        self.assertTrue(PaymentDailyRollup.objects.filter(date=yesterday.date(), payment_method='payme').exists())
+    
+    def test_report_api_admin_only(self):
+        generate_payment_report()
+        url = reverse('payment-report-daily')
+        
+        token = self.get_jwt_token(self.client_user)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+        
+        token = self.get_jwt_token(self.admin_user)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
+        response = self.client.get(url, {'status': 'completed'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data['results']), 1)
+        self.assertEqual(response.data['totals'][0]['total_amount'], '300.00')
+    
+    def test_report_api_invalid_date(self):
+        token = self.get_jwt_token(self.admin_user)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
+        response = self.client.get(reverse('payment-report-daily'), {'start': 'yesterday'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+class SettlementReconciliationTest(PaymentFixtures, TestCase):
+    def setUp(self):
+        self.client_user = self.create_user('client')
+        self.service = self.create_service()
+        
+        self.processed_at = timezone.now()
+        self.payments = [
+            self.create_payment(
+                100 + i,
+                status='completed',
+                gateway_transaction_id=f'txn_{i}',
+                processed_at=self.processed_at
+            )
+            for i in range(5)
+        ]
+    
+    def settlement_for(self, transactions):
+        from .fake_gateway import FakePaymentGateway
+        settlement = io.StringIO()
+        FakePaymentGateway().write_settlement_file(settlement, transactions)
+        settlement.seek(0)
+        return settlement
+    
+    def test_reconcile_reports_mismatches(self):
+        from .reconciliation import reconcile
+        transactions = [
+            (p.gateway_transaction_id, p.amount, p.status, p.currency, p.processed_at)
+            for p in self.payments[1:]
+        ]
+        transactions[0] = ('txn_1', Decimal('999.00'), 'completed', 'USD', self.processed_at)
+        transactions[1] = ('txn_2', Decimal('102.00'), 'refunded', 'USD', self.processed_at)
+        transactions.append(('txn_unknown', Decimal('50.00'), 'completed', 'USD', self.processed_at))
+        
+        output = io.StringIO()
+        counts = reconcile(
+            self.settlement_for(transactions), output,
+            start=self.processed_at - timezone.timedelta(hours=1),
+            end=self.processed_at + timezone.timedelta(hours=1),
+            batch_size=2
+        )
+        
+        self.assertEqual(counts['rows'], 5)
+        self.assertEqual(counts['matched'], 4)
+        self.assertEqual(counts['amount_mismatch'], 1)
+        self.assertEqual(counts['status_mismatch'], 1)
+        self.assertEqual(counts['missing_payment'], 1)
+        self.assertEqual(counts['missing_settlement'], 1)
+        
+        kinds = {(row['kind'], row['transaction_id']) for row in csv.DictReader(io.StringIO(output.getvalue()))}
+        self.assertIn(('missing_settlement', 'txn_0'), kinds)
+        self.assertIn(('amount_mismatch', 'txn_1'), kinds)
+        self.assertIn(('missing_payment', 'txn_unknown'), kinds)
+    
+    def test_generated_settlement_reconciles_cleanly(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            settlement_path = os.path.join(tmpdir, 'settlement.csv')
+            output_path = os.path.join(tmpdir, 'mismatches.csv')
+            call_command('generate_settlement_file', settlement_path, stdout=io.StringIO())
+            call_command('reconcile_settlement', settlement_path, output=output_path, stderr=io.StringIO())
+            
+            with open(output_path) as output:
+                self.assertEqual(list(csv.DictReader(output)), [])
+
+class PaymentWebhookTest(PaymentFixtures, APITestCase):
+    def setUp(self):
+        self.client = APIClient()
+        
+        self.client_user = self.create_user('client')
+        self.service = self.create_service()
+        self.order = self.create_order(status='pending')
+        self.payment = self.create_payment(
+            order=self.order,
+            payment_method='payme',
+            status='processing',
+            gateway_transaction_id='txn_webhook'
+        )
+        self.url = reverse('payment-webhook', kwargs={'gateway': 'payme'})
+    
+    def post_webhook(self, transaction_id, webhook_status='success', secret=None, gateway='payme', amount=None):
+        from .fake_gateway import FakePaymentGateway
+        from .webhooks import sign_payload
+        body = FakePaymentGateway().build_webhook(transaction_id, webhook_status, amount)
+        signature = sign_payload(secret or settings.PAYMENT_WEBHOOK_SECRETS[gateway], body)
+        return self.client.post(reverse('payment-webhook', kwargs={'gateway': gateway}), data=body,
+                                content_type='application/json', HTTP_X_GATEWAY_SIGNATURE=signature)
+    
+    def test_invalid_signature_rejected(self):
+        response = self.post_webhook('txn_webhook', secret='wrong-secret')
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+        self.assertFalse(PaymentWebhookEvent.objects.exists())
+    
+    def test_webhook_only_appends_to_inbox(self):
+        response = self.post_webhook('txn_webhook')
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        
+        self.payment.refresh_from_db()
+        self.assertEqual(self.payment.status, 'processing')
+        self.assertEqual(PaymentWebhookEvent.objects.filter(processed_at__isnull=True).count(), 1)
+    
+    def test_inbox_drain_dedupes_and_applies(self):
+        self.post_webhook('txn_webhook', 'failed')
+        self.post_webhook('txn_webhook', 'success')
+        self.post_webhook('txn_unknown')
+        
+        result = process_webhook_inbox()
+        self.assertEqual(result, "Processed 3 payment webhooks")
+        
+        self.payment.refresh_from_db()
+        self.order.refresh_from_db()
+        self.assertEqual(self.payment.status, 'completed')
+        self.assertEqual(self.order.status, 'paid')
+        
+        outcomes = dict(PaymentWebhookEvent.objects.values_list('event_status', 'outcome').filter(transaction_id='txn_webhook'))
+        self.assertEqual(outcomes, {'failed': 'duplicate', 'success': 'applied'})
+        self.assertEqual(PaymentWebhookEvent.objects.get(transaction_id='txn_unknown').outcome, 'unknown_payment')
+        self.assertFalse(PaymentWebhookEvent.objects.filter(processed_at__isnull=True).exists())
+    
+    def test_drain_posts_gateway_fee_and_notifies_client(self):
+        self.post_webhook('txn_webhook', 'success', amount=Decimal('500.00'))
+        
+        process_webhook_inbox()
+        
+        self.payment.refresh_from_db()
+        self.assertEqual(self.payment.fee, Decimal('15.00'))
+        fee = LedgerEntry.objects.get(payment=self.payment, account__code='fees:payme:USD')
+        self.assertEqual(fee.amount, Decimal('15.00'))
+        
+        message = OutboxMessage.objects.get(group=f'user_{self.client_user.id}')
+        self.assertEqual(message.payload['notification_type'], 'payment_success')
+        self.assertEqual(message.payload['payment_id'], str(self.payment.id))
+    
+    def test_completed_payment_not_downgraded(self):
+        self.payment.status = 'completed'
+        self.payment.save()
+        self.post_webhook('txn_webhook', 'failed')
+        
+        process_webhook_inbox()
+        
+        self.payment.refresh_from_db()
+        self.assertEqual(self.payment.status, 'completed')
+        self.assertEqual(PaymentWebhookEvent.objects.get().outcome, 'ignored')
+
+    def test_other_gateway_cannot_change_payment(self):
+        self.post_webhook('txn_webhook', 'failed', gateway='click')
+        
+        process_webhook_inbox()
+        
+        self.payment.refresh_from_db()
+        self.assertEqual(self.payment.status, 'processing')
+        self.assertEqual(PaymentWebhookEvent.objects.get().outcome, 'unknown_payment')
+    
+    def test_late_success_ends_retry_and_keeps_canceled_order(self):
+        self.payment.status = 'failed'
+        self.payment.save()
+        retry = PaymentRetry.objects.create(payment=self.payment, next_attempt_at=timezone.now())
+        self.order.status = 'canceled'
+        self.order.save()
+        self.post_webhook('txn_webhook', 'success')
+        
+        process_webhook_inbox()
+        
+        self.payment.refresh_from_db()
+        self.order.refresh_from_db()
+        retry.refresh_from_db()
+        self.assertEqual(self.payment.status, 'completed')
+        self.assertEqual(self.order.status, 'canceled')
+        self.assertFalse(retry.is_active)
+        self.assertEqual(PaymentWebhookEvent.objects.get().outcome, 'order_canceled')
+        self.assertEqual(list(self.payment.gateway_events.values_list('event_type', flat=True)), ['webhook'])
+
+class PaymentExportTest(PaymentFixtures, APITestCase):
+    def setUp(self):
+        self.client = APIClient()
+        
+        self.client_user = self.create_user('client')
+        self.admin_user = self.create_user('admin')
+        self.service = self.create_service()
+        
+        for amount in (100, 200, 300):
+            self.create_payment(amount)
+        self.url = reverse('payment-export')
+    
+    def test_export_csv_streams_rows(self):
+        token = self.get_jwt_token(self.admin_user)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
+        
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.streaming)
+        
+        rows = list(csv.DictReader(io.StringIO(b''.join(response.streaming_content).decode())))
+        self.assertEqual([row['amount'] for row in rows], ['100.00', '200.00', '300.00'])
+    
+    def test_export_gzipped_jsonl(self):
+        token = self.get_jwt_token(self.admin_user)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
+        
+        today = timezone.now().date().isoformat()
+        response = self.client.get(self.url, {'export_format': 'jsonl', 'gzip': '1', 'start': today, 'end': today})
+        self.assertEqual(response['Content-Type'], 'application/gzip')
+        
+        lines = gzip.decompress(b''.join(response.streaming_content)).decode().splitlines()
+        self.assertEqual(len(lines), 3)
+        self.assertEqual(json.loads(lines[0])['payment_method'], 'card')
+    
+    def test_export_invalid_range_and_permissions(self):
+        token = self.get_jwt_token(self.client_user)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
+        self.assertEqual(self.client.get(self.url).status_code, status.HTTP_403_FORBIDDEN)
+        
+        token = self.get_jwt_token(self.admin_user)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
+        response = self.client.get(self.url, {'start': '2024-02-31'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+class PaymentBatchRefundTest(PaymentFixtures, APITestCase):
+    def setUp(self):
+        self.client = APIClient()
+        
+        self.client_user = self.create_user('client')
+        self.admin_user = self.create_user('admin')
+        self.service = self.create_service()
+        
+        self.payments = [
+            self.create_payment(
+                100,
+                order=self.create_order(total_price=100, status='paid'),
+                payment_method=payment_method,
+                status='completed',
+                gateway_transaction_id=f'txn_{index}'
+            )
+            for index, payment_method in enumerate(['payme', 'click', 'card', 'payme'])
+        ]
+    
+    @patch('payments.tasks.send_payment_notification.delay')
+    @patch('payments.fake_gateway.FakePaymentGateway.refund_payment')
+    def test_run_refund_job(self, mock_refund, mock_notify):
+        def refund(transaction_id, amount=None):
+            if transaction_id == 'txn_2':
+                raise ConnectionError('gateway timeout')
+            return {'status': 'refunded', 'refund_id': f'ref_{transaction_id}'}
+        mock_refund.side_effect = refund
+        
+        self.payments[3].status = 'pending'
+        self.payments[3].save()
+        
+        job = create_refund_job([payment.id for payment in self.payments] + [self.payments[0].id])
+        self.assertEqual(job.total, 4)
+        
+        job = run_refund_job(job, concurrency=2, batch_size=2)
+        self.assertEqual(job.status, 'completed')
+        self.assertEqual((job.refunded_count, job.failed_count, job.skipped_count), (2, 1, 1))
+        self.assertEqual(job.errors[0]['payment_id'], str(self.payments[2].id))
+        self.assertEqual(mock_notify.call_count, 2)
+        
+        refunded = Payment.objects.get(id=self.payments[0].id)
+        self.assertEqual(refunded.status, 'refunded')
+        self.assertEqual(refunded.refund_id, 'ref_txn_0')
+        self.assertEqual(refunded.order.status, 'canceled')
+        self.assertEqual(refunded.gateway_events.get().data['refund_id'], 'ref_txn_0')
+        self.assertTrue(LedgerEntry.objects.filter(payment=refunded, entry_type='refund').exists())
+        
+        self.assertEqual(Payment.objects.get(id=self.payments[2].id).status, 'completed')
+        
+        # A finished job is not run twice
+        run_refund_job(job)
+        self.assertEqual(mock_refund.call_count, 3)
+    
+    @patch('payments.tasks.send_payment_notification.delay')
+    @patch('payments.fake_gateway.FakePaymentGateway.refund_payment')
+    def test_payment_claimed_elsewhere_is_not_refunded_twice(self, mock_refund, mock_notify):
+        from . import refunds
+        real_claim = refunds.claim_for_refund
+        
+        def api_claims_first(payment_id):
+            real_claim(payment_id)
+            return real_claim(payment_id)
+        
+        with patch('payments.refunds.claim_for_refund', side_effect=api_claims_first):
+            job = run_refund_job(create_refund_job([self.payments[0].id]))
+        mock_refund.assert_not_called()
+        self.assertEqual((job.refunded_count, job.skipped_count), (0, 1))
+        
+        # And the API refuses a payment a job is refunding
+        self.client.force_authenticate(user=self.client_user)
+        response = self.client.post(reverse('payment-refund', kwargs={'payment_id': self.payments[0].id}))
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        mock_refund.assert_not_called()
+    
+    @patch('payments.views.process_refund_job.delay')
+    def test_batch_refund_api_and_job_status(self, mock_delay):
+        token = self.get_jwt_token(self.admin_user)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
+        
+        response = self.client.post(
+            reverse('payment-refund-batch'),
+            {'payment_ids': [str(payment.id) for payment in self.payments]},
+            format='json'
+        )
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(response.data['total'], 4)
+        mock_delay.assert_called_once_with(str(response.data['id']))
+        
+        response = self.client.get(reverse('payment-refund-job', kwargs={'pk': response.data['id']}))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['status'], 'pending')
+        self.assertEqual(response.data['processed'], 0)
+    
+    def test_batch_refund_validation_and_permissions(self):
+        token = self.get_jwt_token(self.admin_user)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
+        response = self.client.post(reverse('payment-refund-batch'), {'payment_ids': []}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        
+        token = self.get_jwt_token(self.client_user)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
+        response = self.client.post(
+            reverse('payment-refund-batch'),
+            {'payment_ids': [str(self.payments[0].id)]},
+            format='json'
+        )
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+class PaymentFraudScoringTest(PaymentFixtures, APITestCase):
+    def setUp(self):
+        self.client = APIClient()
+        reset_counters()
+        
+        self.client_user = self.create_user('client')
+        self.service = self.create_service(base_price=100.00)
+    
+    def tearDown(self):
+        reset_counters()
+    
+    def create_payment(self, amount=100, **fields):
+        return super().create_payment(amount, **fields)
+    
+    def test_in_memory_counters_window(self):
+        counters = InMemoryCounters()
+        now = 1_000_000.0
+        counters.record(1, True, now - 90000)
+        counters.record(1, True, now - 7200)
+        counters.record(1, False, now - 60)
+        
+        self.assertEqual(counters.snapshot(1, now), (1, 2, 1))
+        self.assertEqual(counters.snapshot(2, now), (0, 0, 0))
+    
+    def test_assess_payment_low_and_high_risk(self):
+        self.client_user.date_joined = timezone.now() - timezone.timedelta(days=365)
+        self.client_user.save()
+        payment = self.create_payment()
+        
+        assessment = assess_payment(payment)
+        self.assertEqual(assessment.action, '')
+        self.assertEqual(assessment.features['velocity_1h'], 0)
+        
+        for _ in range(20):
+            record_attempt(payment, failed=True)
+        payment.amount = Decimal('500.00')
+        
+        assessment = assess_payment(payment)
+        self.assertEqual(assessment.action, 'block')
+        self.assertEqual(assessment.features['failed_ratio_24h'], 1.0)
+        self.assertEqual(assessment.features['amount_zscore'], 16.0)
+    
+    def test_multi_unit_order_is_priced_per_unit(self):
+        payment = self.create_payment(amount=300, quantity=3)
+        
+        assessment = assess_payment(payment)
+        self.assertEqual(assessment.features['amount_zscore'], 0.0)
+        self.assertEqual(assessment.action, '')
+        
+        counts = rescore_payments()
+        self.assertEqual(counts, {'scored': 1, 'flag': 0, 'block': 0})
+        payment.refresh_from_db()
+        self.assertAlmostEqual(payment.fraud_score, assessment.score, places=3)
+    
+    def test_scoring_is_sub_millisecond(self):
+        payment = self.create_payment()
+        payment = Payment.objects.select_related('order__service', 'user').get(id=payment.id)
+        
+        iterations = 1000
+        started = time.perf_counter()
+        for _ in range(iterations):
+            assess_payment(payment)
+        self.assertLess((time.perf_counter() - started) / iterations, 0.001)
+    
+    @patch('payments.views.PaymentCreateView.send_payment_notification')
+    @patch('payments.fake_gateway.FakePaymentGateway.process_payment')
+    def test_blocked_payment_never_reaches_gateway(self, mock_process, mock_notify):
+        earlier = self.create_payment(status='failed')
+        for _ in range(20):
+            record_attempt(earlier, failed=True)
+        
+        order = self.create_order(total_price=500)
+        
+        token = self.get_jwt_token(self.client_user)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
+        response = self.client.post(
+            reverse('payment-create', kwargs={'order_id': order.id}),
+            {'payment_method': 'payme'}
+        )
+        
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        mock_process.assert_not_called()
+        payment = Payment.objects.get(order=order)
+        self.assertEqual(payment.status, 'failed')
+        self.assertEqual(payment.error_code, FRAUD_BLOCKED_CODE)
+        self.assertEqual(payment.fraud_action, 'block')
+        order.refresh_from_db()
+        self.assertEqual(order.status, 'canceled')
+    
+    def test_rescore_payments_matches_online_features(self):
+        now = timezone.now()
+        payments = [self.create_payment(status='failed') for _ in range(5)]
+        payments.append(self.create_payment(amount=300))
+        for index, payment in enumerate(payments):
+            Payment.objects.filter(id=payment.id).update(created_at=now - timezone.timedelta(minutes=50 - index))
+        
+        counts = rescore_payments(start=now - timezone.timedelta(hours=2))
+        self.assertEqual(counts['scored'], 6)
+        
+        last = Payment.objects.get(id=payments[-1].id)
+        age_days = max(0.0, (last.created_at - self.client_user.date_joined).total_seconds() / 86400)
+        expected = score_matrix([5, 1.0, 8.0, age_days])[0]
+        self.assertAlmostEqual(last.fraud_score, expected, places=6)
+        self.assertEqual(last.fraud_action, 'block')
+        
+        first = Payment.objects.get(id=payments[0].id)
+        self.assertAlmostEqual(first.fraud_score, score_matrix([0, 0.0, 0.0, 0.0])[0], places=3)
+        
+        # Windows carry over between pages
+        scores = list(Payment.objects.order_by('id').values_list('fraud_score', flat=True))
+        Payment.objects.update(fraud_score=None)
+        self.assertEqual(rescore_payments(start=now - timezone.timedelta(hours=2), batch_size=2)['scored'], 6)
+        paged = list(Payment.objects.order_by('id').values_list('fraud_score', flat=True))
+        for expected_score, score in zip(scores, paged):
+            self.assertAlmostEqual(score, expected_score, places=6)
@@ -1,9 +1,17 @@
 from django.urls import path
-from .views import PaymentCreateView, PaymentDetailView, PaymentListView, RefundPaymentView
+from .views import (
+    PaymentCreateView, PaymentDetailView, PaymentListView, RefundPaymentView,
+    PaymentReportView, PaymentWebhookView, PaymentExportView, BatchRefundView, PaymentRefundJobView
+)
 
 urlpatterns = [
     path('', PaymentListView.as_view(), name='payment-list'),
     path('<uuid:pk>/', PaymentDetailView.as_view(), name='payment-detail'),
     path('order/<int:order_id>/pay/', PaymentCreateView.as_view(), name='payment-create'),
     path('<uuid:payment_id>/refund/', RefundPaymentView.as_view(), name='payment-refund'),
+    path('refunds/batch/', BatchRefundView.as_view(), name='payment-refund-batch'),
+    path('refunds/jobs/<uuid:pk>/', PaymentRefundJobView.as_view(), name='payment-refund-job'),
+    path('export/', PaymentExportView.as_view(), name='payment-export'),
+    path('reports/daily/', PaymentReportView.as_view(), name='payment-report-daily'),
+    path('webhooks/<str:gateway>/', PaymentWebhookView.as_view(), name='payment-webhook'),
 ]
\ No newline at end of file
@@ -2,18 +2,39 @@ from rest_framework import generics, status, permissions
 from rest_framework.response import Response
 from rest_framework.views import APIView
 from django.shortcuts import get_object_or_404
+from django.db import transaction
 from django.utils import timezone
-from channels.layers import get_channel_layer
-from asgiref.sync import async_to_sync
-from .models import Payment
-from .serializers import PaymentSerializer, PaymentCreateSerializer
+from django.utils.dateparse import parse_date
+from django.db.models import Sum
+from .models import Payment, PaymentGatewayEvent, PaymentDailyRollup, PaymentWebhookEvent, PaymentRefundJob
+from .serializers import (
+    PaymentSerializer, PaymentCreateSerializer, PaymentDailyRollupSerializer,
+    BatchRefundSerializer, PaymentRefundJobSerializer
+)
 from .fake_gateway import GATEWAY_MAP
+from .retry import schedule_retry, get_error_code
+from .reporting import CENTS
+from currencies.rates import get_base_currency
+from .webhooks import verify_signature, SIGNATURE_HEADER
+from .refunds import claim_for_refund, create_refund_job, release_refund_claims
+from .fraud import screen_payment, record_attempt, FRAUD_BLOCKED_CODE
+from .tasks import process_refund_job
 from orders.models import Order
-from accounts.permissions import IsClient
+from notifications.outbox import notify_user
+from .messages import payment_notification
+from service_marketplace.exports import ExportError, parse_date_range, filter_created_range, export_response
+from ledger.posting import record_charge, record_refund, gateway_fee
+from accounts.permissions import IsClient, IsAdmin
+import json
 import logging
 
 logger = logging.getLogger(__name__)
 
+PAYMENT_EXPORT_FIELDS = [
+    'id', 'order_id', 'user_id', 'amount', 'currency', 'payment_method', 'status',
+    'gateway_transaction_id', 'error_code', 'fee', 'refund_id', 'created_at', 'processed_at',
+]
+
 class PaymentCreateView(APIView):
     permission_classes = [IsClient]
     
@@ -37,9 +58,24 @@ class PaymentCreateView(APIView):
                 order=order,
                 user=request.user,
                 amount=order.total_price,
+                currency=order.currency,
                 payment_method=serializer.validated_data['payment_method']
             )
             
+            assessment = screen_payment(payment)
+            if assessment and assessment.action == 'block':
+                payment.status = 'failed'
+                payment.error_code = FRAUD_BLOCKED_CODE
+                payment.save()
+                record_attempt(payment, failed=True)
+                
+                order.status = 'canceled'
+                order.save()
+                
+                logger.warning(f"Payment {payment.id} blocked by fraud screening: {assessment.features}")
+                self.send_payment_notification(order, payment, 'payment_failed')
+                return Response({'error': 'Payment declined'}, status=status.HTTP_400_BAD_REQUEST)
+            
             gateway = GATEWAY_MAP[payment.payment_method]
             
             card_data = None
@@ -58,26 +94,34 @@ class PaymentCreateView(APIView):
                     card_data=card_data
                 )
                 
-                payment.gateway_response = gateway_response
                 payment.gateway_transaction_id = gateway_response.get('transaction_id')
+                record_attempt(payment, failed=gateway_response['status'] != 'success')
                 
                 if gateway_response['status'] == 'success':
-                    payment.status = 'completed'
-                    payment.processed_at = timezone.now()
-                    order.status = 'paid'
-                    order.save()
-                    
-                    self.send_payment_notification(order, payment, 'payment_success')
+                    with transaction.atomic():
+                        payment.status = 'completed'
+                        payment.fee = gateway_fee(gateway_response)
+                        payment.processed_at = timezone.now()
+                        payment.save()
+                        PaymentGatewayEvent.record(payment, 'charge', gateway_response)
+                        order.status = 'paid'
+                        order.save()
+                        record_charge(payment, payment.fee)
+                        self.send_payment_notification(order, payment, 'payment_success')
                 else:
                     payment.status = 'failed'
-                    order.status = 'canceled'
-                    order.save()
+                    payment.error_code = get_error_code(gateway_response) or ''
+                    payment.save()
+                    PaymentGatewayEvent.record(payment, 'charge', gateway_response)
+                    
+                    # Retryable failures keep the order open for the retry scheduler
+                    if schedule_retry(payment, payment.error_code) is None:
+                        order.status = 'canceled'
+                        order.save()
                     
                     # Send failure notification
                     self.send_payment_notification(order, payment, 'payment_failed')
                 
-                payment.save()
-                
                 return Response({
                     'payment': PaymentSerializer(payment).data,
                     'gateway_response': gateway_response
@@ -98,25 +142,7 @@ class PaymentCreateView(APIView):
             return Response({'error': 'Order not found'}, status=status.HTTP_404_NOT_FOUND)
     
     def send_payment_notification(self, order, payment, notification_type):
-        channel_layer = get_channel_layer()
-        
-        message = {
-            'payment_success': f'Payment for order #{order.id} completed successfully',
-            'payment_failed': f'Payment for order #{order.id} failed'
-        }.get(notification_type)
-        
-        async_to_sync(channel_layer.group_send)(
-            f"user_{order.client.id}",
-            {
-                'type': 'payment_notification',
-                'notification_type': notification_type,
-                'order_id': order.id,
-                'payment_id': str(payment.id),
-                'message': message,
-                'amount': str(payment.amount),
-                'status': payment.status
-            }
-        )
+        notify_user(order.client_id, payment_notification(payment, notification_type))
 
 class PaymentDetailView(generics.RetrieveAPIView):
     serializer_class = PaymentSerializer
@@ -149,38 +175,42 @@ class RefundPaymentView(APIView):
                 return Response({'error': 'Permission denied'}, 
                               status=status.HTTP_403_FORBIDDEN)
             
-            if payment.status != 'completed':
+            # Claimed so a batch refund job can't refund it at the gateway as well
+            if payment.status != 'completed' or not claim_for_refund(payment.id):
                 return Response({'error': 'Only completed payments can be refunded'}, 
                               status=status.HTTP_400_BAD_REQUEST)
             
             gateway = GATEWAY_MAP[payment.payment_method]
-            refund_response = gateway.refund_payment(
-                payment.gateway_transaction_id,
-                payment.amount
-            )
+            try:
+                refund_response = gateway.refund_payment(
+                    payment.gateway_transaction_id,
+                    payment.amount
+                )
+            except Exception:
+                release_refund_claims([payment.id])
+                raise
             
-            if refund_response['status'] == 'refunded':
-                payment.status = 'refunded'
-                if payment.gateway_response is None:
-                    payment.gateway_response = {}
-                payment.gateway_response.update({'refund_data': refund_response})
-                payment.save()
-                
-                payment.order.status = 'canceled'
-                payment.order.save()
-                
-                channel_layer = get_channel_layer()
-                async_to_sync(channel_layer.group_send)(
-                    f"user_{payment.user.id}",
-                    {
+            if refund_response['status'] != 'refunded':
+                release_refund_claims([payment.id])
+            else:
+                with transaction.atomic():
+                    payment.status = 'refunded'
+                    payment.refund_id = refund_response.get('refund_id')
+                    payment.save()
+                    PaymentGatewayEvent.record(payment, 'refund', refund_response)
+                    
+                    payment.order.status = 'canceled'
+                    payment.order.save()
+                    record_refund(payment)
+                    
+                    notify_user(payment.user_id, {
                         'type': 'payment_notification',
                         'notification_type': 'payment_refunded',
-                        'order_id': payment.order.id,
+                        'order_id': payment.order_id,
                         'payment_id': str(payment.id),
-                        'message': f'Refund processed for order #{payment.order.id}',
+                        'message': f'Refund processed for order #{payment.order_id}',
                         'amount': str(payment.amount)
-                    }
-                )
+                    })
             
             return Response({
                 'payment': PaymentSerializer(payment).data,
@@ -189,4 +219,125 @@ class RefundPaymentView(APIView):
             
         except Payment.DoesNotExist:
             return Response({'error': 'Payment not found'}, 
-                          status=status.HTTP_404_NOT_FOUND)
\ No newline at end of file
+                          status=status.HTTP_404_NOT_FOUND)
+
+class BatchRefundView(APIView):
+    """
+    Queue a refund job for many payments. Progress is polled from PaymentRefundJobView.
+    """
+    permission_classes = [IsAdmin]
+    
+    def post(self, request):
+        serializer = BatchRefundSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        
+        job = create_refund_job(serializer.validated_data['payment_ids'], requested_by=request.user)
+        process_refund_job.delay(str(job.id))
+        
+        return Response(PaymentRefundJobSerializer(job).data, status=status.HTTP_202_ACCEPTED)
+
+class PaymentRefundJobView(generics.RetrieveAPIView):
+    serializer_class = PaymentRefundJobSerializer
+    permission_classes = [IsAdmin]
+    queryset = PaymentRefundJob.objects.all()
+
+class PaymentReportView(generics.ListAPIView):
+    """
+    Daily payment rollups for dashboards. Reads the rollup table, never the payments table.
+    """
+    serializer_class = PaymentDailyRollupSerializer
+    permission_classes = [IsAdmin]
+    pagination_class = None
+    
+    def get_queryset(self):
+        params = self.request.query_params
+        end = parse_date(params['end']) if params.get('end') else timezone.now().date()
+        start = parse_date(params['start']) if params.get('start') else end - timezone.timedelta(days=30)
+        
+        queryset = PaymentDailyRollup.objects.filter(date__gte=start, date__lte=end)
+        for field in ('payment_method', 'status', 'currency'):
+            if params.get(field):
+                queryset = queryset.filter(**{field: params[field]})
+        return queryset
+    
+    def list(self, request, *args, **kwargs):
+        try:
+            queryset = self.get_queryset()
+        except (TypeError, ValueError):
+            return Response({'error': 'start and end must be valid dates (YYYY-MM-DD)'}, 
+                          status=status.HTTP_400_BAD_REQUEST)
+        
+        totals = (
+            queryset.order_by('status', 'currency')
+            .values('status', 'currency')
+            .annotate(payment_count=Sum('payment_count'), total_amount=Sum('total_amount'))
+        )
+        base_totals = (
+            queryset.order_by('status')
+            .values('status')
+            .annotate(payment_count=Sum('payment_count'), total_amount=Sum('total_amount_base'))
+        )
+        
+        return Response({
+            'results': self.get_serializer(queryset, many=True).data,
+            'totals': [
+                {**row, 'total_amount': str(row['total_amount'].quantize(CENTS))} for row in totals
+            ],
+            'base_currency': get_base_currency(),
+            'base_totals': [
+                {**row, 'total_amount': str(row['total_amount'].quantize(CENTS))} for row in base_totals
+            ]
+        })
+
+class PaymentWebhookView(APIView):
+    """
+    Gateway callback endpoint. Only verifies the signature and appends to the inbox;
+    process_webhook_inbox applies the state changes.
+    """
+    authentication_classes = []
+    permission_classes = [permissions.AllowAny]
+    
+    def post(self, request, gateway):
+        if gateway not in GATEWAY_MAP:
+            return Response({'error': 'Unknown gateway'}, status=status.HTTP_404_NOT_FOUND)
+        
+        body = request.body
+        if not verify_signature(gateway, body, request.META.get(SIGNATURE_HEADER)):
+            return Response({'error': 'Invalid signature'}, status=status.HTTP_403_FORBIDDEN)
+        
+        try:
+            payload = json.loads(body)
+            transaction_id = str(payload['transaction_id'])
+            event_status = str(payload['status'])
+        except (ValueError, KeyError, TypeError):
+            return Response({'error': 'Malformed webhook payload'}, status=status.HTTP_400_BAD_REQUEST)
+        
+        PaymentWebhookEvent.objects.create(
+            gateway=gateway,
+            transaction_id=transaction_id,
+            event_status=event_status,
+            payload=payload
+        )
+        return Response({'status': 'accepted'}, status=status.HTTP_202_ACCEPTED)
+
+class PaymentExportView(APIView):
+    """
+    Stream payments created in a date range as CSV or JSONL, optionally gzipped
+    """
+    permission_classes = [IsAdmin]
+    
+    def get(self, request):
+        params = request.query_params
+        try:
+            start_at, end_at = parse_date_range(params.get('start'), params.get('end'))
+            queryset = filter_created_range(Payment.objects.order_by('created_at'), start_at, end_at)
+            return export_response(
+                queryset,
+                PAYMENT_EXPORT_FIELDS,
+                'payments',
+                export_format=params.get('export_format', 'csv'),
+                compress=params.get('gzip') in ('1', 'true')
+            )
+        except ExportError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
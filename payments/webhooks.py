@@ -0,0 +1,130 @@
+import hashlib
+import hmac
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+from .models import Payment, PaymentGatewayEvent, PaymentRetry, PaymentWebhookEvent
+from orders.models import Order
+from ledger.posting import gateway_fee, record_charge
+from notifications.outbox import notify_each
+from .messages import payment_notification
+import logging
+
+logger = logging.getLogger(__name__)
+
+SIGNATURE_HEADER = 'HTTP_X_GATEWAY_SIGNATURE'
+
+# Webhook status -> (Payment status, statuses it may be applied to)
+WEBHOOK_TRANSITIONS = {
+    'success': ('completed', ['pending', 'processing', 'failed']),
+    'failed': ('failed', ['pending', 'processing']),
+}
+
+
+def get_webhook_secret(gateway):
+    return settings.PAYMENT_WEBHOOK_SECRETS.get(gateway)
+
+
+def sign_payload(secret, body):
+    return hmac.new(secret.encode(), body, hashlib.sha256).hexdigest()
+
+
+def verify_signature(gateway, body, signature):
+    secret = get_webhook_secret(gateway)
+    if not secret or not signature:
+        return False
+    return hmac.compare_digest(sign_payload(secret, body), signature)
+
+
+def drain_inbox(batch_size=500):
+    """
+    Apply one batch of unprocessed webhook events. Events are deduplicated by
+    (gateway, transaction id), latest wins, and only match payments made through that
+    gateway. Payment/order changes are written with bulk updates.
+    Returns the number of inbox rows consumed.
+    """
+    now = timezone.now()
+
+    with transaction.atomic():
+        events = list(
+            PaymentWebhookEvent.objects.select_for_update()
+            .filter(processed_at__isnull=True)
+            .order_by('id')[:batch_size]
+        )
+        if not events:
+            return 0
+
+        latest = {}
+        for event in events:
+            latest[(event.gateway, event.transaction_id)] = event
+        duplicate_ids = [
+            event.id for event in events if latest[(event.gateway, event.transaction_id)] is not event
+        ]
+
+        by_gateway = {}
+        for gateway, transaction_id in latest:
+            by_gateway.setdefault(gateway, []).append(transaction_id)
+        match = Q()
+        for gateway, transaction_ids in by_gateway.items():
+            match |= Q(payment_method=gateway, gateway_transaction_id__in=transaction_ids)
+        payments = Payment.objects.select_for_update().select_related('order').filter(match)
+        payments_by_txn = {(payment.payment_method, payment.gateway_transaction_id): payment for payment in payments}
+
+        outcomes = {'applied': [], 'ignored': [], 'unknown_payment': [], 'order_canceled': []}
+        changed, audit, paid_order_ids, canceled_order_ids = [], [], [], []
+        # Same client notifications as a synchronous charge
+        notifications = []
+        for key, event in latest.items():
+            payment = payments_by_txn.get(key)
+            transition = WEBHOOK_TRANSITIONS.get(event.event_status)
+            if payment is None:
+                outcomes['unknown_payment'].append(event.id)
+                continue
+            audit.append(PaymentGatewayEvent.build(payment, 'webhook', event.payload))
+            if transition is None or payment.status not in transition[1]:
+                outcomes['ignored'].append(event.id)
+                continue
+
+            payment.status = transition[0]
+            payment.updated_at = now
+            if payment.status == 'completed':
+                payment.processed_at = now
+                payment.fee = gateway_fee(event.payload)
+                if payment.order.status == 'canceled':
+                    # The gateway captured money for an order that is gone: keep the order
+                    # canceled and leave the payment for a refund
+                    logger.warning(f"Webhook completed payment {payment.id} of canceled order {payment.order_id}")
+                    outcomes['order_canceled'].append(event.id)
+                else:
+                    paid_order_ids.append(payment.order_id)
+                    notifications.append((payment.order.client_id, payment_notification(payment, 'payment_success')))
+                    outcomes['applied'].append(event.id)
+            else:
+                canceled_order_ids.append(payment.order_id)
+                notifications.append((payment.order.client_id, payment_notification(payment, 'payment_failed')))
+                outcomes['applied'].append(event.id)
+            changed.append(payment)
+
+        if audit:
+            PaymentGatewayEvent.objects.bulk_create(audit)
+        if changed:
+            Payment.objects.bulk_update(changed, ['status', 'processed_at', 'fee', 'updated_at'])
+            # A late success ends the retry schedule of a failed payment
+            PaymentRetry.objects.filter(
+                payment_id__in=[payment.id for payment in changed if payment.status == 'completed'], is_active=True
+            ).update(is_active=False, next_attempt_at=None)
+            Order.objects.filter(id__in=paid_order_ids, status='pending').update(status='paid', updated_at=now)
+            Order.objects.filter(id__in=canceled_order_ids, status='pending').update(status='canceled', updated_at=now)
+            for payment in changed:
+                if payment.status == 'completed':
+                    record_charge(payment, payment.fee)
+            notify_each(notifications)
+
+        for outcome, ids in outcomes.items():
+            if ids:
+                PaymentWebhookEvent.objects.filter(id__in=ids).update(processed_at=now, outcome=outcome)
+        if duplicate_ids:
+            PaymentWebhookEvent.objects.filter(id__in=duplicate_ids).update(processed_at=now, outcome='duplicate')
+
+    return len(events)
@@ -8,20 +8,25 @@ https://docs.djangoproject.com/en/4.2/howto/deployment/asgi/
 """
 import os
 import django
+from django.urls import re_path
 from channels.routing import ProtocolTypeRouter, URLRouter
-from channels.auth import AuthMiddlewareStack
 from channels.security.websocket import AllowedHostsOriginValidator
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'service_marketplace.settings')
 django.setup()
 
+from accounts.middleware import JWTAuthMiddlewareStack
+from notifications.routing import http_urlpatterns
 from service_marketplace.routing import websocket_urlpatterns
 
+django_asgi_app = get_asgi_application()
+
 application = ProtocolTypeRouter({
-    "http": get_asgi_application(),
+    # The SSE stream is a long-lived consumer, everything else goes to Django
+    "http": URLRouter(http_urlpatterns + [re_path(r'', django_asgi_app)]),
     "websocket": AllowedHostsOriginValidator(
-        AuthMiddlewareStack(
+        JWTAuthMiddlewareStack(
             URLRouter(websocket_urlpatterns)
         )
     ),
@@ -0,0 +1,52 @@
+import sys
+import time
+from abc import ABC, abstractmethod
+from django.core.management.base import BaseCommand, CommandError
+from .exports import EXPORT_FORMATS, ExportError, parse_date_range, filter_created_range, write_export
+
+
+class ExportCommand(ABC, BaseCommand):
+    """
+    Base for the export_payments / export_orders management commands
+    """
+    export_name = None
+
+    @abstractmethod
+    def get_queryset(self):
+        """
+        Rows to export, ordered; the --start/--end range is applied on top
+        """
+
+    @abstractmethod
+    def get_fields(self):
+        """
+        Model field names to write for each row
+        """
+
+    def add_arguments(self, parser):
+        parser.add_argument('--start', help='First created_at date to include (YYYY-MM-DD)')
+        parser.add_argument('--end', help='Last created_at date to include (YYYY-MM-DD)')
+        parser.add_argument('--format', dest='export_format', choices=EXPORT_FORMATS, default='csv')
+        parser.add_argument('--gzip', action='store_true', help='Gzip the output incrementally')
+        parser.add_argument('--output', help='Output file (default: stdout)')
+
+    def handle(self, *args, **options):
+        try:
+            start_at, end_at = parse_date_range(options['start'], options['end'])
+        except ExportError as e:
+            raise CommandError(str(e))
+
+        queryset = filter_created_range(self.get_queryset(), start_at, end_at)
+        output = open(options['output'], 'wb') if options['output'] else sys.stdout.buffer
+
+        started = time.monotonic()
+        try:
+            written = write_export(output, queryset, self.get_fields(),
+                                   export_format=options['export_format'], compress=options['gzip'])
+        finally:
+            if output is not sys.stdout.buffer:
+                output.close()
+
+        self.stderr.write(self.style.SUCCESS(
+            f'Exported {self.export_name} ({written} bytes) in {time.monotonic() - started:.2f}s'
+        ))
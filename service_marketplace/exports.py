@@ -0,0 +1,123 @@
+"""
+Constant-memory CSV/JSONL export helpers shared by the payments and orders apps.
+"""
+import csv
+import io
+import json
+import zlib
+from datetime import datetime, time, timedelta
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+EXPORT_FORMATS = ('csv', 'jsonl')
+EXPORT_CHUNK_SIZE = 2000
+
+
+class ExportError(ValueError):
+    pass
+
+
+def parse_date_range(start, end):
+    """
+    Turn start/end dates into a half-open [start_at, end_at) datetime range.
+    The end date itself is included.
+    """
+    try:
+        start_date = parse_date(start) if start else None
+        end_date = parse_date(end) if end else None
+    except ValueError:
+        start_date = end_date = None
+    if (start and start_date is None) or (end and end_date is None):
+        raise ExportError('start and end must be valid dates (YYYY-MM-DD)')
+
+    start_at = timezone.make_aware(datetime.combine(start_date, time.min)) if start_date else None
+    end_at = timezone.make_aware(datetime.combine(end_date, time.min)) + timedelta(days=1) if end_date else None
+    return start_at, end_at
+
+
+def filter_created_range(queryset, start_at, end_at):
+    if start_at:
+        queryset = queryset.filter(created_at__gte=start_at)
+    if end_at:
+        queryset = queryset.filter(created_at__lt=end_at)
+    return queryset
+
+
+def iter_rows(queryset, fields, chunk_size=EXPORT_CHUNK_SIZE):
+    """
+    Server-side chunked iteration over tuples, no model instances
+    """
+    return queryset.values_list(*fields).iterator(chunk_size=chunk_size)
+
+
+def iter_csv(rows, fields):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(fields)
+    for row in rows:
+        writer.writerow(row)
+        # Flush roughly every 64KB so the response starts immediately but isn't byte-sized
+        if buffer.tell() > 65536:
+            yield buffer.getvalue().encode()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue().encode()
+
+
+def iter_jsonl(rows, fields):
+    lines = []
+    size = 0
+    for row in rows:
+        line = json.dumps(dict(zip(fields, row)), cls=DjangoJSONEncoder) + '\n'
+        lines.append(line)
+        size += len(line)
+        if size > 65536:
+            yield ''.join(lines).encode()
+            lines, size = [], 0
+    yield ''.join(lines).encode()
+
+
+def iter_gzip(chunks):
+    compressor = zlib.compressobj(6, zlib.DEFLATED, zlib.MAX_WBITS | 16)
+    for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+
+def iter_export(queryset, fields, export_format='csv', compress=False, chunk_size=EXPORT_CHUNK_SIZE):
+    if export_format not in EXPORT_FORMATS:
+        raise ExportError(f"format must be one of: {', '.join(EXPORT_FORMATS)}")
+
+    rows = iter_rows(queryset, fields, chunk_size)
+    chunks = iter_csv(rows, fields) if export_format == 'csv' else iter_jsonl(rows, fields)
+    return iter_gzip(chunks) if compress else chunks
+
+
+def export_response(queryset, fields, filename, export_format='csv', compress=False):
+    content_type = 'text/csv' if export_format == 'csv' else 'application/x-ndjson'
+    filename = f'{filename}.{export_format}'
+    if compress:
+        content_type = 'application/gzip'
+        filename += '.gz'
+
+    response = StreamingHttpResponse(
+        iter_export(queryset, fields, export_format, compress),
+        content_type=content_type,
+    )
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
+
+
+def write_export(output, queryset, fields, export_format='csv', compress=False):
+    """
+    Write an export to a binary file object, returns bytes written
+    """
+    written = 0
+    for chunk in iter_export(queryset, fields, export_format, compress):
+        output.write(chunk)
+        written += len(chunk)
+    return written
@@ -43,6 +43,7 @@ INSTALLED_APPS = [
     # Third party apps
     'rest_framework',
     'rest_framework_simplejwt',
+    'rest_framework_simplejwt.token_blacklist',
     'corsheaders',
     'channels',
     'django_celery_beat',
@@ -53,6 +54,9 @@ INSTALLED_APPS = [
     'orders',
     'services',
     'payments',
+    'ledger',
+    'currencies',
+    'notifications',
 
 ]
 
@@ -84,7 +88,7 @@ CHANNEL_LAYERS = {
 # REST Framework Configuration
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'accounts.authentication.SnapshotJWTAuthentication',
     ],
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticated',
@@ -111,14 +115,85 @@ SIMPLE_JWT = {
     'REFRESH_TOKEN_LIFETIME': timedelta(days=7),
     'ROTATE_REFRESH_TOKENS': True,
     'BLACKLIST_AFTER_ROTATION': True,
-    'UPDATE_LAST_LOGIN': True,
+    'UPDATE_LAST_LOGIN': False,  # LoginView records last_login through accounts.activity
     'ALGORITHM': 'HS256',
     'SIGNING_KEY': SECRET_KEY,
     'AUTH_HEADER_TYPES': ('Bearer',),
     'USER_ID_FIELD': 'id',
     'USER_ID_CLAIM': 'user_id',
+    'TOKEN_REFRESH_SERIALIZER': 'accounts.serializers.VersionedTokenRefreshSerializer',
 }
 
+# Seconds a user snapshot resolved from a JWT stays cached, per process and in AUTH_USER_SNAPSHOT_CACHE
+AUTH_USER_SNAPSHOT_TTL = config('AUTH_USER_SNAPSHOT_TTL', default=30, cast=int)
+AUTH_USER_SNAPSHOT_CACHE = 'default'
+
+# Bloom filter answering "not blacklisted" for refresh token JTIs without a DB query.
+# 'redis' is shared by all processes, 'memory' is only correct for a single process, '' disables it.
+TOKEN_BLACKLIST_BLOOM = config('TOKEN_BLACKLIST_BLOOM', default='redis')
+TOKEN_BLACKLIST_BLOOM_CAPACITY = config('TOKEN_BLACKLIST_BLOOM_CAPACITY', default=1000000, cast=int)
+TOKEN_BLACKLIST_BLOOM_ERROR_RATE = config('TOKEN_BLACKLIST_BLOOM_ERROR_RATE', default=0.01, cast=float)
+
+# Presence registry maintained by NotificationConsumer. 'redis' is shared by all processes, 'memory' only
+# sees this process's connections, '' disables it. A connection without a ping for WORKER_PRESENCE_TTL
+# seconds counts as gone; pings refresh it at most every WORKER_PRESENCE_REFRESH_INTERVAL seconds.
+WORKER_PRESENCE = config('WORKER_PRESENCE', default='redis')
+WORKER_PRESENCE_TTL = config('WORKER_PRESENCE_TTL', default=90, cast=int)
+WORKER_PRESENCE_REFRESH_INTERVAL = 30
+
+# Notification outbox: rows per relay batch, and how often the relay_outbox command polls for new rows
+NOTIFICATION_OUTBOX_BATCH_SIZE = config('NOTIFICATION_OUTBOX_BATCH_SIZE', default=500, cast=int)
+NOTIFICATION_OUTBOX_POLL_INTERVAL = config('NOTIFICATION_OUTBOX_POLL_INTERVAL', default=0.2, cast=float)
+# Seconds before another relay takes over rows a relay claimed but never marked (it crashed), and failed
+# sends after which a message is dead-lettered
+NOTIFICATION_OUTBOX_CLAIM_TIMEOUT = 60
+NOTIFICATION_OUTBOX_MAX_ATTEMPTS = config('NOTIFICATION_OUTBOX_MAX_ATTEMPTS', default=10, cast=int)
+# Delivered notifications are kept this many seconds for replay on reconnect, at most
+# NOTIFICATION_REPLAY_LIMIT of them are sent back in one replay
+NOTIFICATION_RETENTION = config('NOTIFICATION_RETENTION', default=86400, cast=int)
+NOTIFICATION_REPLAY_LIMIT = 100
+# SSE stream (/sse/notifications/): seconds between keep-alive comments on idle streams,
+# and the reconnect delay in milliseconds suggested to EventSource
+SSE_KEEPALIVE_INTERVAL = config('SSE_KEEPALIVE_INTERVAL', default=15, cast=float)
+SSE_RETRY = 5000
+
+# Per-connection WebSocket send queue. A client with WS_OUTBOUND_QUEUE_SIZE messages queued, or one waiting
+# WS_SLOW_CONSUMER_TIMEOUT seconds, is disconnected (code 4408). Policies by notification_type or type:
+# 'coalesce' keeps only the latest message per order, 'drop' may be discarded, the rest are kept.
+WS_OUTBOUND_QUEUE_SIZE = config('WS_OUTBOUND_QUEUE_SIZE', default=100, cast=int)
+WS_SLOW_CONSUMER_TIMEOUT = config('WS_SLOW_CONSUMER_TIMEOUT', default=30, cast=float)
+WS_OUTBOUND_POLICIES = {
+    'status_update': 'coalesce',
+    'pong': 'coalesce',
+    'new_order_available': 'drop',
+}
+
+# Expired token cleanup: rows per DELETE transaction and seconds to yield between them
+TOKEN_CLEANUP_BATCH_SIZE = config('TOKEN_CLEANUP_BATCH_SIZE', default=1000, cast=int)
+TOKEN_CLEANUP_PAUSE = config('TOKEN_CLEANUP_PAUSE', default=0.05, cast=float)
+
+# Write-behind for User.last_login/last_activity. 'memory' buffers per process and flushes inline every
+# USER_ACTIVITY_FLUSH_INTERVAL seconds, 'redis' is shared and flushed by the beat task, '' writes each event.
+USER_ACTIVITY_BUFFER = config('USER_ACTIVITY_BUFFER', default='memory')
+USER_ACTIVITY_FLUSH_INTERVAL = config('USER_ACTIVITY_FLUSH_INTERVAL', default=30, cast=int)
+USER_ACTIVITY_FLUSH_BATCH_SIZE = 1000
+USER_ACTIVITY_RESOLUTION = config('USER_ACTIVITY_RESOLUTION', default=60, cast=int)  # seconds between recorded requests
+
+# Worker import: rows per bulk_create transaction and password hashing processes (0 = one per CPU)
+WORKER_IMPORT_BATCH_SIZE = config('WORKER_IMPORT_BATCH_SIZE', default=1000, cast=int)
+WORKER_IMPORT_PROCESSES = config('WORKER_IMPORT_PROCESSES', default=0, cast=int)
+
+# Avatar thumbnails rendered by accounts.tasks.generate_avatar_thumbnails, {label: square size in px}
+AVATAR_THUMBNAIL_SIZES = {'small': 64, 'medium': 256}
+AVATAR_THUMBNAIL_FORMAT = 'WEBP'
+AVATAR_THUMBNAIL_QUALITY = 80
+
+# Worker ratings: Bayesian prior (a new worker counts as `weight` reviews of `mean` stars) and
+# how many profiles the periodic aggregate check covers per run
+WORKER_RATING_PRIOR = {'mean': 4.0, 'weight': 5}
+WORKER_RATING_REPAIR_CHUNK_SIZE = 500
+WORKER_RATING_REPAIR_CHUNKS = config('WORKER_RATING_REPAIR_CHUNKS', default=20, cast=int)
+
 TEMPLATES = [
     {
         'BACKEND': 'django.template.backends.django.DjangoTemplates',
@@ -208,7 +283,19 @@ CELERY_TIMEZONE = TIME_ZONE
 CELERY_BEAT_SCHEDULE = {
     'cleanup-expired-tokens': {
         'task': 'accounts.tasks.cleanup_expired_tokens',
-        'schedule': 3600.0,  # Run every hour
+        'schedule': 600.0,  # Run every 10 minutes, small batches instead of an hourly spike
+    },
+    'flush-user-activity': {
+        'task': 'accounts.tasks.flush_user_activity',
+        'schedule': 30.0,  # Run every 30 seconds
+    },
+    'prune-worker-presence': {
+        'task': 'accounts.tasks.prune_worker_presence',
+        'schedule': 300.0,  # Run every 5 minutes
+    },
+    'update-worker-ratings': {
+        'task': 'accounts.tasks.update_worker_ratings',
+        'schedule': 600.0,  # Run every 10 minutes, resumes where the last run stopped
     },
     'auto-assign-orders': {
         'task': 'orders.tasks.auto_assign_orders',
@@ -216,18 +303,96 @@ CELERY_BEAT_SCHEDULE = {
     },
     'retry-failed-payments': {
         'task': 'payments.tasks.retry_failed_payments',
-        'schedule': 1800.0,  # Run every 30 minutes
+        'schedule': 60.0,  # Run every minute, backoff is tracked per payment
     },
     'generate-payment-report': {
         'task': 'payments.tasks.generate_payment_report',
         'schedule': 86400.0,  # Run daily
     },
+    'refresh-payment-rollups': {
+        'task': 'payments.tasks.refresh_payment_rollups',
+        'schedule': 300.0,  # Run every 5 minutes
+    },
+    'relay-notification-outbox': {
+        'task': 'notifications.tasks.relay_notification_outbox',
+        'schedule': 2.0,  # Fallback for deployments without the relay_outbox command
+    },
+    'prune-notification-outbox': {
+        'task': 'notifications.tasks.prune_notification_outbox',
+        'schedule': 3600.0,  # Run every hour
+    },
+    'process-webhook-inbox': {
+        'task': 'payments.tasks.process_webhook_inbox',
+        'schedule': 5.0,  # Run every 5 seconds
+    },
+    'rebuild-token-blacklist-filter': {
+        'task': 'accounts.tasks.rebuild_token_blacklist_filter',
+        'schedule': 900.0,  # Run every 15 minutes
+    },
+    'refresh-exchange-rates': {
+        'task': 'currencies.tasks.refresh_exchange_rates',
+        'schedule': 3600.0,  # Run every hour
+    },
     'cleanup-old-orders': {
         'task': 'orders.tasks.cleanup_old_orders',
         'schedule': 604800.0,  # Run weekly
     },
 }
 
+# FX: rates are units of currency per 1 FX_BASE_CURRENCY. FX_FALLBACK_RATES only cover currencies
+# missing from the ExchangeRate table, FX_CACHE_TTL is how long a process keeps its cached table.
+FX_BASE_CURRENCY = config('FX_BASE_CURRENCY', default='USD')
+FX_FALLBACK_RATES = {
+    'UZS': '12650',
+    'EUR': '0.92',
+    'RUB': '92',
+}
+FX_CACHE_TTL = config('FX_CACHE_TTL', default=300, cast=int)
+FX_BACKGROUND_REFRESH = config('FX_BACKGROUND_REFRESH', default=True, cast=bool)
+FX_RATES_URL = config('FX_RATES_URL', default='')
+
+# Store raw gateway payloads zlib-compressed in PaymentGatewayEvent
+PAYMENT_GATEWAY_EVENT_COMPRESSION = config('PAYMENT_GATEWAY_EVENT_COMPRESSION', default=True, cast=bool)
+
+# Shared secrets used to verify gateway webhook signatures (HMAC-SHA256 of the body)
+PAYMENT_WEBHOOK_SECRETS = {
+    'payme': config('PAYME_WEBHOOK_SECRET', default='payme-dev-secret'),
+    'click': config('CLICK_WEBHOOK_SECRET', default='click-dev-secret'),
+    'card': config('CARD_WEBHOOK_SECRET', default='card-dev-secret'),
+}
+
+# Fake gateway simulator: profile per GATEWAY_MAP entry (see payments.fake_gateway.SIMULATOR_PROFILES).
+# A seed makes gateway outcomes reproducible, the time scale compresses simulated latency (0 = no sleeps).
+PAYMENT_GATEWAY_SEED = config('PAYMENT_GATEWAY_SEED', default='')
+PAYMENT_GATEWAY_TIME_SCALE = config('PAYMENT_GATEWAY_TIME_SCALE', default=1.0, cast=float)
+PAYMENT_GATEWAY_SIMULATOR = {
+    'payme': {'profile': config('PAYME_GATEWAY_PROFILE', default='default')},
+    'click': {'profile': config('CLICK_GATEWAY_PROFILE', default='default')},
+    'card': {'profile': config('CARD_GATEWAY_PROFILE', default='default')},
+}
+
+# Fraud screening before the gateway call. Counters are per process ('memory') or shared ('redis').
+PAYMENT_FRAUD_ENABLED = config('PAYMENT_FRAUD_ENABLED', default=True, cast=bool)
+PAYMENT_FRAUD_COUNTERS = config('PAYMENT_FRAUD_COUNTERS', default='memory')
+PAYMENT_FRAUD_PRICE_SPREAD = 0.25  # amount z-score unit, as a fraction of the service base price
+PAYMENT_FRAUD_MODEL = {
+    'weights': {
+        'velocity_1h': 1.2,
+        'failed_ratio_24h': 2.5,
+        'amount_zscore': 0.6,
+        'account_age_days': 1.5,
+    },
+    'bias': -4.0,
+}
+PAYMENT_FRAUD_THRESHOLDS = {'flag': 0.5, 'block': 0.9}
+
+# Batch refunds: max ids per request and concurrent refund calls per gateway
+PAYMENT_REFUND_MAX_BATCH = config('PAYMENT_REFUND_MAX_BATCH', default=10000, cast=int)
+PAYMENT_REFUND_CONCURRENCY = config('PAYMENT_REFUND_CONCURRENCY', default=8, cast=int)
+
+# Ledger: store a balance snapshot every N entries per account
+LEDGER_SNAPSHOT_INTERVAL = config('LEDGER_SNAPSHOT_INTERVAL', default=100, cast=int)
+
 # Custom User Model
 AUTH_USER_MODEL = 'accounts.User'
 
@@ -239,5 +404,7 @@ USE_TZ = True
 STATIC_URL = '/static/'
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
+# Uploads that must never be served (worker import CSVs), deleted once processed
+PRIVATE_MEDIA_ROOT = config('PRIVATE_MEDIA_ROOT', default=os.path.join(BASE_DIR, 'private'))
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
\ No newline at end of file
@@ -33,6 +33,7 @@ urlpatterns = [
     path('api/services/', include('services.urls')),
     path('api/orders/', include('orders.urls')),
     path('api/payments/', include('payments.urls')),
+    path('api/notifications/', include('notifications.urls')),
 ]
 
 if settings.DEBUG:
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.5 on 2026-10-19 01:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('services', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='service',
+            name='currency',
+            field=models.CharField(choices=[('USD', 'US Dollar'), ('UZS', 'Uzbekistani Som'), ('EUR', 'Euro'), ('RUB', 'Russian Ruble')], default='USD', max_length=3),
+        ),
+    ]
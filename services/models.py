@@ -1,4 +1,5 @@
 from django.db import models
+from currencies.models import CURRENCY_CHOICES
 
 # Create your models here.
 
@@ -18,6 +19,7 @@ class Service(models.Model):
     description = models.TextField()
     category = models.ForeignKey(ServiceCategory, on_delete=models.CASCADE, related_name='services')
     base_price = models.DecimalField(max_digits=10, decimal_places=2)
+    currency = models.CharField(max_length=3, choices=CURRENCY_CHOICES, default='USD')
     duration_hours = models.PositiveIntegerField(default=1)
     is_active = models.BooleanField(default=True)
     created_at = models.DateTimeField(auto_now_add=True)